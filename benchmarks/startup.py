@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Measure the start-up time of each cobind.py sub-command.
+
+Every sub-command is run to completion on tiny generated inputs (a few
+hundred intervals) in a fresh interpreter, so the time is dominated by the
+imports of the sub-command's branch, not by the analysis. The median
+wall-clock time of several runs is reported, together with the time of
+"-h" (argument parsing only), the number of modules imported by the run,
+and the heavy third-party packages it loaded.
+
+Usage: python benchmarks/startup.py [-n RUNS] [sub-command ...]
+
+@author: m102324
+"""
+
+import os
+import re
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import subprocess
+
+_here = os.path.dirname(os.path.abspath(__file__))
+_script = os.path.join(_here, os.pardir, 'bin', 'cobind.py')
+_lib = os.path.join(_here, os.pardir, 'lib')
+_heavy = ('pandas', 'scipy', 'pyBigWig', 'bx')
+
+# arguments of each sub-command (run in the directory of the inputs)
+_commands = {
+    'stat': 'a.bed b.bed',
+    'overlap': '-n 2 a.bed b.bed',
+    'jaccard': '-n 2 a.bed b.bed',
+    'dice': '-n 2 a.bed b.bed',
+    'simpson': '-n 2 a.bed b.bed',
+    'pmi': '-n 2 a.bed b.bed',
+    'npmi': '-n 2 a.bed b.bed',
+    'all': '-n 2 a.bed b.bed',
+    'matrix': 'a.bed b.bed bg.bed out/matrix',
+    'index': 'a.bed b.bed out/index',
+    'query': 'a.bed index out/query.tsv',
+    'cooccur': 'a.bed b.bed bg.bed out/cooccur.tsv',
+    'cooccur-batch': 'a.bed b.bed bg.bed out/cooccur_batch.tsv',
+    'covary': 'a.bed a.bw b.bed b.bw out/covary',
+    'covary-matrix': 'bg.bed a.bw b.bw out/covary_matrix',
+    'srog': 'a.bed b.bed out/srog.tsv',
+    'sort': 'a.bed out/sorted.bed',
+    'zscore': 'scores.tsv out/zscores.tsv',
+}
+
+# run in the child interpreter: report the modules loaded by cobind.py
+_probe = """
+import sys, runpy
+sys.argv = [%r] + %r
+try:
+    runpy.run_path(sys.argv[0], run_name='__main__')
+except SystemExit:
+    pass
+sys.stderr.write('\\n@modules %%d %%s\\n' %% (len(sys.modules), ','.join(
+    m for m in %r if m in sys.modules)))
+"""
+
+
+def _bed(fname, chroms, n, step, offset, width):
+    with open(fname, 'w') as fh:
+        for chrom in chroms:
+            for i in range(n):
+                start = i * step + offset
+                fh.write('%s\t%d\t%d\n' % (chrom, start,
+                                           start + width + i * 37 % 400))
+
+
+def make_inputs(directory):
+    """
+    Write tiny inputs of every sub-command into directory. bigWig files
+    are only written if pyBigWig is installed.
+    """
+    chroms = ['chr1', 'chr2']
+    _bed(os.path.join(directory, 'a.bed'), chroms, 100, 9000, 0, 500)
+    _bed(os.path.join(directory, 'b.bed'), chroms, 100, 6000, 300, 500)
+    _bed(os.path.join(directory, 'bg.bed'), chroms, 200, 4500, 0, 2000)
+    with open(os.path.join(directory, 'scores.tsv'), 'w') as fh:
+        fh.write('TF_name\tC\tJ\tSD\tSS\tPMI\tNPMI\n')
+        for i, name in enumerate(['RAD21', 'SMC3', 'STAG1', 'CTCF']):
+            fh.write('%s\t%s\n' % (name, '\t'.join(
+                '%.4f' % ((i + 1) * (k + 1) / 30.0) for k in range(6))))
+    os.makedirs(os.path.join(directory, 'out'))
+    try:
+        import pyBigWig
+    except ImportError:
+        return
+    for name, shift in (('a.bw', 0), ('b.bw', 5)):
+        bw = pyBigWig.open(os.path.join(directory, name), 'w')
+        bw.addHeader([(c, 1000000) for c in chroms])
+        for chrom in chroms:
+            bw.addEntries(chrom, 0, span=100, step=100, values=[
+                float((i * 7 + shift) % 13 + 1) for i in range(10000)])
+        bw.close()
+
+
+def _env():
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(
+        p for p in (_lib, env.get('PYTHONPATH')) if p)
+    return env
+
+
+def _run(argv, directory):
+    start = time.perf_counter()
+    p = subprocess.run([sys.executable, _script] + argv, cwd=directory,
+                       env=_env(), stdout=subprocess.DEVNULL,
+                       stderr=subprocess.PIPE, text=True)
+    return (time.perf_counter() - start, p)
+
+
+def measure(command, directory, runs=5):
+    """
+    Returns (median seconds of a run, median seconds of "-h", number of
+    modules, heavy packages loaded), or None if the sub-command failed.
+    """
+    argv = [command] + _commands[command].split()
+    times, helps = [], []
+    for i in range(runs):
+        seconds, p = _run(argv, directory)
+        if p.returncode != 0:
+            sys.stderr.write('%s failed:\n%s\n' %
+                             (command, p.stderr[-2000:]))
+            return None
+        times.append(seconds)
+        helps.append(_run([command, '-h'], directory)[0])
+    probe = subprocess.run(
+        [sys.executable, '-c', _probe % (_script, argv, _heavy)],
+        cwd=directory, env=_env(), stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE, text=True).stderr
+    n, heavy = re.search(r'@modules (\d+) (\S*)', probe).groups()
+    return (sorted(times)[len(times) // 2], sorted(helps)[len(helps) // 2],
+            int(n), heavy or '-')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[1])
+    parser.add_argument('commands', nargs='*', metavar='sub-command',
+                        help="Sub-commands to measure. (default: all)")
+    parser.add_argument('-n', '--runs', type=int, default=5,
+                        help="Number of runs per sub-command. (default: 5)")
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix='cobind_startup_')
+    try:
+        make_inputs(directory)
+        # the index queried by "query"
+        _run(['index', 'a.bed', 'b.bed', 'index'], directory)
+        print('%-16s%10s%10s%10s  %s' % ('sub-command', 'run(s)', 'help(s)',
+                                         'modules', 'heavy packages'))
+        for command in args.commands or list(_commands):
+            if command not in _commands:
+                print('%-16s  unknown sub-command' % command)
+                continue
+            if command.startswith('covary') and not os.path.exists(
+                    os.path.join(directory, 'a.bw')):
+                print('%-16s  skipped (pyBigWig is not installed)' % command)
+                continue
+            result = measure(command, directory, args.runs)
+            if result is None:
+                print('%-16s  failed' % command)
+                continue
+            print('%-16s%10.3f%10.3f%10d  %s' % ((command,) + result))
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -3,16 +3,13 @@
 import sys
 import logging
 import argparse
-import pandas as pd
-from cobindability.BED import compare_bed, peakwise_ovcoef
-from cobindability.BED import cooccur_peak, srog_peak
-from cobindability.bw import bigwig_corr
-from cobindability.ovstat import ov_stats
 from cobindability import version
-from cobindability.ovbootstrap import bootstrap_coef, bootstrap_npmi
-from cobindability.coefcal import ov_coef, ov_jaccard, ov_ss, ov_sd
-from cobindability.coefcal import pmi_value, npmi_value
-from cobindability.utils import config_log, cal_zscores
+from cobindability.utils import config_log
+
+# Analysis modules (and pandas, scipy, pyBigWig) are imported by
+# each sub-command after the arguments are parsed, so that "-h" and light
+# sub-commands do not pay for imports they do not use. Start-up times are
+# measured by benchmarks/startup.py.
 
 __author__ = "Liguo Wang"
 __copyright__ = "Copyleft"
@@ -24,8 +21,16 @@ __email__ = "wang.liguo@mayo.edu"
 __status__ = "Production"
 
 
-def main():
+def print_format():
+    """
+    Print pandas tables with 4 decimals. Called only by the sub-commands
+    that print tables, so that the others do not import pandas.
+    """
+    import pandas as pd
     pd.set_option('display.float_format', lambda x: '%.4f' % x)
+
+
+def main():
     general_help = "**cobind: collocation analyses of genomic regions**"
     bed_help = "Genomic regions in BED, BED-like or bigBed format. The \
         BED-like format includes:'bed3', 'bed4', 'bed6', 'bed12', 'bedgraph', \
@@ -33,6 +38,11 @@ def main():
         be plain text, compressed (.gz, .z, .bz, .bz2, .bzip2) or remote \
         (http://, https://, ftp://) files. Do not compress BigBed foramt. \
         BigBed file can also be a remote file."
+    region_help = "Only read the genomic regions overlapping these \
+        chromosomes or windows: comma-separated names or \"chrom:start-end\" \
+        windows in BED coordinates (e.g., \"chr1,chr2:1000000-2000000\"), \
+        or a BED file of windows. Only the data blocks covering them are \
+        read from bigBed files. (default: all regions)"
     log_help = "\
         This file is used to save the log information. By default, if no file \
         is specified (None), the log information will be printed to the \
@@ -60,14 +70,30 @@ def main():
         'npmi': "Calculate the normalized pointwise mutual information (NPMI) \
             between two sets of genomic regions. NPMI = log(p(|A|)*p(|B|)) / \
             log(p(|A and B|)) - 1",
+        'all': "Calculate all six collocation measurements (C, J, SD, SS, \
+            PMI and NPMI) and their confidence intervals in one pass.",
+        'matrix': "Calculate all six collocation measurements (C, J, SD, SS, \
+            PMI and NPMI) between every pair of many sets of genomic regions \
+            (all-vs-all).",
+        'index': "Build an on-disk index of a collection (library) of BED \
+            files for the \"query\" sub-command.",
+        'query': "Compare one set of genomic regions with every member of an \
+            index built by the \"index\" sub-command (one-vs-many).",
         'cooccur': "Evaluate if two sets of genomic regions are significantly \
             co-occurred in given background regions.",
+        'cooccur-batch': "Evaluate the co-occurrence of every pair of many \
+            sets of genomic regions in the same background regions.",
         'covary': "Calculate the covariance (Pearson, Spearman and Kendall \
             coefficients) of binding intensities between two sets of genomic \
             regions.",
+        'covary-matrix': "Calculate the correlation matrices (Pearson, \
+            Spearman and Kendall) of many bigWig files over the same genomic \
+            regions.",
         'srog': "Report the code of Spatial Relation Of Genomic (SROG) \
             regions. SROG codes include 'disjoint','touch','equal','overlap',\
             'contain', 'within'.",
+        'sort': "Sort genomic regions by chromosome and coordinates with an \
+            external merge sort (for unsorted files larger than memory).",
         'stat': "Wrapper function. Report basic statistics of genomic \
             regions, and calculate overlapping measurements (including \"C\", \
             \"J\", \"SD\", \"SS\", \"PMI\", \"NPMI\"), without bootstrap \
@@ -103,12 +129,26 @@ def main():
         'pmi', help=commands['pmi'])
     parser_npmi = sub_parsers.add_parser(
         'npmi', help=commands['npmi'])
+    parser_all = sub_parsers.add_parser(
+        'all', help=commands['all'])
+    parser_matrix = sub_parsers.add_parser(
+        'matrix', help=commands['matrix'])
+    parser_index = sub_parsers.add_parser(
+        'index', help=commands['index'])
+    parser_query = sub_parsers.add_parser(
+        'query', help=commands['query'])
     parser_cooccur = sub_parsers.add_parser(
         'cooccur', help=commands['cooccur'])
+    parser_cooccur_batch = sub_parsers.add_parser(
+        'cooccur-batch', help=commands['cooccur-batch'])
     parser_covary = sub_parsers.add_parser(
         'covary', help=commands['covary'])
+    parser_covary_matrix = sub_parsers.add_parser(
+        'covary-matrix', help=commands['covary-matrix'])
     parser_srog = sub_parsers.add_parser(
         'srog', help=commands['srog'])
+    parser_sort = sub_parsers.add_parser(
+        'sort', help=commands['sort'])
     parser_stat = sub_parsers.add_parser(
         'stat', help=commands['stat'])
     parser_zscore = sub_parsers.add_parser(
@@ -132,6 +172,15 @@ def main():
     parser_overlap.add_argument(
         '-f', '--fraction', type=int, dest="subsample", default=0.75,
         help="Resampling fraction. (default: %(default).2f)")
+    parser_overlap.add_argument(
+        '-p', '--threads', type=int, dest="threads", default=1,
+        help="Number of processes used for resampling. (default: \
+            %(default)d)")
+    parser_overlap.add_argument(
+        '--seed', type=int, dest="seed", default=None,
+        help="Seed of the random number generator used for resampling. \
+            Results are reproducible for the same seed regardless of the \
+            number of processes. (default: %(default)s)")
     parser_overlap.add_argument(
         '-b', '--background', type=int, dest="bgsize", default=1.4e9,
         help="The size of the cis-regulatory genomic regions. This is about \
@@ -141,6 +190,20 @@ def main():
         help="If set, will save peak-wise coefficients to files \
             (\"input_A_peakwise_scores.tsv\" and \
              \"input_B_peakwise_scores.tsv\").")
+    parser_overlap.add_argument(
+        "--stream", dest="stream", action="store_true",
+        help="If set, read input files in chunks and process them \
+            chromosome by chromosome, so that memory use does not grow \
+            with the input size. Use this for inputs larger than \
+            memory. Resampling \
+            and peak-wise coefficients are not available.")
+    parser_overlap.add_argument(
+        "--tmpdir", type=str, dest="tmpdir", default=None,
+        help="Directory of temporary files used by \"--stream\". \
+            (default: the system temporary directory)")
+    parser_overlap.add_argument(
+        "--region", type=str, dest="regions", default=None,
+        help=region_help)
     parser_overlap.add_argument(
         "-l", "--log", type=str, metavar="log_file", default=None,
         help=log_help)
@@ -166,6 +229,15 @@ def main():
     parser_jaccard.add_argument(
         '-f', '--fraction', type=int, dest="subsample", default=0.75,
         help="Resampling fraction. (default: %(default).2f)")
+    parser_jaccard.add_argument(
+        '-p', '--threads', type=int, dest="threads", default=1,
+        help="Number of processes used for resampling. (default: \
+            %(default)d)")
+    parser_jaccard.add_argument(
+        '--seed', type=int, dest="seed", default=None,
+        help="Seed of the random number generator used for resampling. \
+            Results are reproducible for the same seed regardless of the \
+            number of processes. (default: %(default)s)")
     parser_jaccard.add_argument(
         '-b', '--background', type=int, dest="bgsize", default=1.4e9,
         help="The size of the cis-regulatory genomic regions. This is about \
@@ -200,6 +272,15 @@ def main():
     parser_dice.add_argument(
         '-f', '--fraction', type=int, dest="subsample", default=0.75,
         help="Resampling fraction. (default: %(default).2f)")
+    parser_dice.add_argument(
+        '-p', '--threads', type=int, dest="threads", default=1,
+        help="Number of processes used for resampling. (default: \
+            %(default)d)")
+    parser_dice.add_argument(
+        '--seed', type=int, dest="seed", default=None,
+        help="Seed of the random number generator used for resampling. \
+            Results are reproducible for the same seed regardless of the \
+            number of processes. (default: %(default)s)")
     parser_dice.add_argument(
         '-b', '--background', type=int, dest="bgsize", default=1.4e9,
         help="The size of the cis-regulatory genomic regions. This is about \
@@ -234,6 +315,15 @@ def main():
     parser_simpson.add_argument(
         '-f', '--fraction', type=int, dest="subsample", default=0.75,
         help="Resampling fraction. (default: %(default).2f)")
+    parser_simpson.add_argument(
+        '-p', '--threads', type=int, dest="threads", default=1,
+        help="Number of processes used for resampling. (default: \
+            %(default)d)")
+    parser_simpson.add_argument(
+        '--seed', type=int, dest="seed", default=None,
+        help="Seed of the random number generator used for resampling. \
+            Results are reproducible for the same seed regardless of the \
+            number of processes. (default: %(default)s)")
     parser_simpson.add_argument(
         '-b', '--background', type=int, dest="bgsize", default=1.4e9,
         help="The size of the cis-regulatory genomic regions. This is about \
@@ -268,6 +358,15 @@ def main():
     parser_pmi.add_argument(
         '-f', '--fraction', type=int, dest="subsample", default=0.75,
         help="Resampling fraction. (default: %(default).2f)")
+    parser_pmi.add_argument(
+        '-p', '--threads', type=int, dest="threads", default=1,
+        help="Number of processes used for resampling. (default: \
+            %(default)d)")
+    parser_pmi.add_argument(
+        '--seed', type=int, dest="seed", default=None,
+        help="Seed of the random number generator used for resampling. \
+            Results are reproducible for the same seed regardless of the \
+            number of processes. (default: %(default)s)")
     parser_pmi.add_argument(
         '-b', '--background', type=int, dest="bgsize", default=1.4e9,
         help="The size of the cis-regulatory genomic regions. This is about \
@@ -302,6 +401,15 @@ def main():
     parser_npmi.add_argument(
         '-f', '--fraction', type=int, dest="subsample", default=0.75,
         help="Resampling fraction. (default: %(default).2f)")
+    parser_npmi.add_argument(
+        '-p', '--threads', type=int, dest="threads", default=1,
+        help="Number of processes used for resampling. (default: \
+            %(default)d)")
+    parser_npmi.add_argument(
+        '--seed', type=int, dest="seed", default=None,
+        help="Seed of the random number generator used for resampling. \
+            Results are reproducible for the same seed regardless of the \
+            number of processes. (default: %(default)s)")
     parser_npmi.add_argument(
         '-b', '--background', type=int, dest="bgsize", default=1.4e9,
         help="The size of the cis-regulatory genomic regions. This is about \
@@ -318,6 +426,115 @@ def main():
         "-d", "--debug", action="store_true",
         help="Print detailed information for debugging.")
 
+    # create the parser for the "all" sub-command
+    parser_all.add_argument(
+        "bed1", type=str, metavar="input_A.bed", help=bed_help)
+    parser_all.add_argument(
+        "bed2", type=str, metavar="input_B.bed", help=bed_help)
+    parser_all.add_argument(
+        '--nameA', type=str, default=None, help=nameA_help)
+    parser_all.add_argument(
+        '--nameB', type=str, default=None, help=nameB_help)
+    parser_all.add_argument(
+        '-n', '--ndraws', type=int, dest="iter", default=20,
+        help="Times of resampling to estimate confidence intervals. Set to \
+            '0' to turn off resampling. The same draws are shared by all six \
+            measurements. (default: %(default)d)")
+    parser_all.add_argument(
+        '-f', '--fraction', type=float, dest="subsample", default=0.75,
+        help="Resampling fraction. (default: %(default).2f)")
+    parser_all.add_argument(
+        '-p', '--threads', type=int, dest="threads", default=1,
+        help="Number of processes used for resampling. (default: \
+            %(default)d)")
+    parser_all.add_argument(
+        '--seed', type=int, dest="seed", default=None,
+        help="Seed of the random number generator used for resampling. \
+            Results are reproducible for the same seed regardless of the \
+            number of processes. (default: %(default)s)")
+    parser_all.add_argument(
+        '-b', '--background', type=int, dest="bgsize", default=1.4e9,
+        help="The size of the cis-regulatory genomic regions. This is about \
+            1.4Gb For the human genome. (default: %(default)d)")
+    parser_all.add_argument(
+        "-t", "--tsv", type=str, metavar="output.tsv", default=None,
+        help="If set, append the results as one row (named by input_B or \
+            --nameB) to this TSV file. The file can be used as the input of \
+            the \"zscore\" sub-command.")
+    parser_all.add_argument(
+        "-l", "--log", type=str, metavar="log_file", default=None,
+        help=log_help)
+    parser_all.add_argument(
+        "-d", "--debug", action="store_true",
+        help="Print detailed information for debugging.")
+
+    # create the parser for the "matrix" sub-command
+    parser_matrix.add_argument(
+        "inputs", type=str, nargs='+', metavar="input",
+        help="BED files, or directories containing BED files (searched \
+            recursively). Each file is read only once.")
+    parser_matrix.add_argument(
+        "output", type=str, metavar="output_prefix",
+        help="Prefix of output files. One N x N TSV file is written for the \
+            overlap size and each measurement (\"prefix_C.tsv\", \
+            \"prefix_J.tsv\", ...), and all matrices are saved to \
+            \"prefix.npz\" (load with numpy.load).")
+    parser_matrix.add_argument(
+        '-b', '--background', type=int, dest="bgsize", default=1.4e9,
+        help="The size of the cis-regulatory genomic regions. This is about \
+            1.4Gb For the human genome. (default: %(default)d)")
+    parser_matrix.add_argument(
+        '-p', '--threads', type=int, dest="threads", default=1,
+        help="Number of processes. (default: %(default)d)")
+    parser_matrix.add_argument(
+        "-l", "--log", type=str, metavar="log_file", default=None,
+        help=log_help)
+    parser_matrix.add_argument(
+        "-d", "--debug", action="store_true",
+        help="Print detailed information for debugging.")
+
+    # create the parser for the "index" sub-command
+    parser_index.add_argument(
+        "inputs", type=str, nargs='+', metavar="input",
+        help="BED files, or directories containing BED files (searched \
+            recursively).")
+    parser_index.add_argument(
+        "index_dir", type=str, metavar="index_dir",
+        help="Directory to save the index.")
+    parser_index.add_argument(
+        '-p', '--threads', type=int, dest="threads", default=1,
+        help="Number of processes used to read BED files. (default: \
+            %(default)d)")
+    parser_index.add_argument(
+        "-l", "--log", type=str, metavar="log_file", default=None,
+        help=log_help)
+    parser_index.add_argument(
+        "-d", "--debug", action="store_true",
+        help="Print detailed information for debugging.")
+
+    # create the parser for the "query" sub-command
+    parser_query.add_argument(
+        "bed1", type=str, metavar="input_A.bed", help=bed_help)
+    parser_query.add_argument(
+        "index_dir", type=str, metavar="index_dir",
+        help="Directory of the index built by the \"index\" sub-command.")
+    parser_query.add_argument(
+        "output", type=str, metavar="output.tsv",
+        help="Output TSV file. One row per indexed file, with the same \
+            fields as reported by the \"stat\" sub-command.")
+    parser_query.add_argument(
+        '--nameA', type=str, default=None, help=nameA_help)
+    parser_query.add_argument(
+        '-b', '--background', type=int, dest="bgsize", default=1.4e9,
+        help="The size of the cis-regulatory genomic regions. This is about \
+            1.4Gb For the human genome. (default: %(default)d)")
+    parser_query.add_argument(
+        "-l", "--log", type=str, metavar="log_file", default=None,
+        help=log_help)
+    parser_query.add_argument(
+        "-d", "--debug", action="store_true",
+        help="Print detailed information for debugging.")
+
     # create the parser for the "cooccur" sub-command
     parser_cooccur.add_argument(
         "bed1", type=str, metavar="input_A.bed", help=bed_help)
@@ -354,6 +571,42 @@ def main():
         "-d", "--debug", action="store_true",
         help="Print detailed information for debugging.")
 
+    # create the parser for the "cooccur-batch" sub-command
+    parser_cooccur_batch.add_argument(
+        "inputs", type=str, nargs='+', metavar="input",
+        help="BED files, or directories containing BED files (searched \
+            recursively). Each file is read only once.")
+    parser_cooccur_batch.add_argument(
+        "bed3", type=str, metavar="background.bed",
+        help="Genomic regions as the background (e.g., all promoters, \
+            all enhancers). The background is read only once.")
+    parser_cooccur_batch.add_argument(
+        "output", type=str, metavar="output.tsv",
+        help="Output TSV file. One row (2 x 2 table, odds ratio, p-value \
+            and adjusted p-values) per pair of input files.")
+    parser_cooccur_batch.add_argument(
+        '-m', '--matrix', type=str, dest="matrix", metavar="prefix",
+        default=None,
+        help="If set, also save N x N matrices of odds ratios, p-values, \
+            log10 p-values and q-values (\"prefix_odds_ratio.tsv\", ...) and \
+            \"prefix.npz\".")
+    parser_cooccur_batch.add_argument(
+        '--ncut', type=int, dest="n_cut",  default=1,
+        help="The minimum overlap size. (default: %(default)d)")
+    parser_cooccur_batch.add_argument(
+        '--pcut', type=float, dest="p_cut", default=0.0,
+        help="The minimum overlap percentage. (default: %(default)f)")
+    parser_cooccur_batch.add_argument(
+        '-p', '--threads', type=int, dest="threads", default=1,
+        help="Number of processes used to read BED files. (default: \
+            %(default)d)")
+    parser_cooccur_batch.add_argument(
+        "-l", "--log", type=str, metavar="log_file", default=None,
+        help=log_help)
+    parser_cooccur_batch.add_argument(
+        "-d", "--debug", action="store_true",
+        help="Print detailed information for debugging.")
+
     # create the parser for the "covary" sub-command
     parser_covary.add_argument(
         "bed1", type=str, metavar="input_A.bed", help=bed_help)
@@ -421,6 +674,56 @@ def main():
         "-d", "--debug", action="store_true",
         help="Print detailed information for debugging.")
 
+    # create the parser for the "covary-matrix" sub-command
+    parser_covary_matrix.add_argument(
+        "bed", type=str, metavar="input.bed", help=bed_help)
+    parser_covary_matrix.add_argument(
+        "bw_files", type=str, nargs='+', metavar="input.bw",
+        help="BigWig files (local or remote). Each file is read only once. \
+            Note: the chromosome IDs must be consistent between BED and \
+            bigWig files.")
+    parser_covary_matrix.add_argument(
+        "output", type=str, metavar="output_prefix",
+        help="Prefix of output files. The signal matrix (regions x bigWig \
+            files, float32) is saved as \"output_prefix_signal.npy\" (rows \
+            in \"output_prefix_regions.bed\"), correlation matrices are saved \
+            as \"output_prefix_pearson.tsv\", ... and \"output_prefix.npz\".")
+    parser_covary_matrix.add_argument(
+        '--type', type=str, dest="score_type",
+        choices=['mean', 'min', 'max'], default='mean',
+        help="Summary statistic score type ('min','mean' or 'max') of a \
+            genomic region. (default: %(default)s)")
+    parser_covary_matrix.add_argument(
+        '--topx', type=float, dest="top_X", default=1.0,
+        help="Fraction (if 0 < top_X <= 1) or number (if top_X > 1) of \
+            genomic regions (ranked by the mean log2 score of all bigWig \
+            files) used to calculate correlations. (default: %(default)s)")
+    parser_covary_matrix.add_argument(
+        '--min_sig', type=float, dest="min_signal", default=0,
+        help="Genomic region with summary statistic score <= this (in any \
+            bigWig file) will be removed. (default: %(default)s)")
+    parser_covary_matrix.add_argument(
+        '--methods', type=str, nargs='+', dest="methods",
+        choices=['pearson', 'spearman', 'kendall'],
+        default=['pearson', 'spearman', 'kendall'],
+        help="Correlation coefficients to calculate. Kendall's tau is \
+            calculated pair by pair and is the slowest. (default: \
+            %(default)s)")
+    parser_covary_matrix.add_argument(
+        "--exact", dest="exact", action="store_true",
+        help="If set, calculate the \"exact\" summary statistic score rather \
+            than \"zoom-level\" score for each genomic region.")
+    parser_covary_matrix.add_argument(
+        '-p', '--threads', type=int, dest="threads", default=1,
+        help="Number of processes used to read bigWig files and to \
+            calculate Kendall's tau. (default: %(default)d)")
+    parser_covary_matrix.add_argument(
+        "-l", "--log", type=str, metavar="log_file", default=None,
+        help=log_help)
+    parser_covary_matrix.add_argument(
+        "-d", "--debug", action="store_true",
+        help="Print detailed information for debugging.")
+
     # create the parser for the "srog" sub-command
     parser_srog.add_argument(
         "bed1", type=str, metavar="input_A.bed",
@@ -429,16 +732,20 @@ def main():
             \"chrom:start-end\". If strand (the 6th column) is not provided, \
             the default strand is \"+\".")
     parser_srog.add_argument(
-        "bed2", type=str, metavar="input_B.bed",
+        "bed2", type=str, metavar="input_B.bed", nargs='+',
         help="Genomic regions in BED, BED-like or bigBed format. If 'name' \
             (the 4th column) is not provided, the default name is \
             \"chrom:start-end\". If strand (the 6th column) is not provided, \
-            the default strand is \"+\". ")
+            the default strand is \"+\". Multiple files can be given: \
+            \"input_A.bed\" is then read once and compared to each of \
+            them.")
     parser_srog.add_argument(
         "output", type=str, metavar="output.tsv",
         help="Generate spatial relation code (disjoint, touch, equal, \
             overlap, contain, within) for each genomic interval in \
-            \"input_A.bed\".")
+            \"input_A.bed\". One group of two columns (SROG code and \
+            intervals) is reported for each \"input_B.bed\", in the order \
+            they are given.")
     parser_srog.add_argument(
         '--dist', type=int, dest="max_dist", default=250000000,
         help="When intervals are disjoint, find the closest up- and \
@@ -451,6 +758,30 @@ def main():
         "-d", "--debug", action="store_true",
         help="Print detailed information for debugging.")
 
+    # create the parser for the "sort" sub-command
+    parser_sort.add_argument(
+        "bed", type=str, metavar="input.bed", help=bed_help)
+    parser_sort.add_argument(
+        "output", type=str, metavar="output.bed",
+        help="Output BED3 file, sorted by chromosome (lexicographic) and then \
+            by start and end (numeric), the same order as \"LC_ALL=C sort \
+            -k1,1 -k2,2n -k3,3n\".")
+    parser_sort.add_argument(
+        '-S', '--buffer-size', type=str, dest="memory", default='512M',
+        help="Memory budget, e.g., 512M or 2G. Larger inputs are sorted in \
+            chunks that are merged from temporary files. (default: \
+            %(default)s)")
+    parser_sort.add_argument(
+        "--tmpdir", type=str, dest="tmpdir", default=None,
+        help="Directory of temporary files. (default: the system temporary \
+            directory)")
+    parser_sort.add_argument(
+        "-l", "--log", type=str, metavar="log_file", default=None,
+        help=log_help)
+    parser_sort.add_argument(
+        "-d", "--debug", action="store_true",
+        help="Print detailed information for debugging.")
+
     # create the parser for the "stat" sub-command
     parser_stat.add_argument(
         "bed1", type=str, metavar="input_A.bed", help=bed_help)
@@ -465,6 +796,19 @@ def main():
         default=1.4e9, help="The size of the cis-regulatory genomic \
             regions. This is about 1.4Gb For the human genome. \
             (default: %(default)d)")
+    parser_stat.add_argument(
+        "--stream", dest="stream", action="store_true",
+        help="If set, read input files in chunks and process them \
+            chromosome by chromosome, so that memory use does not grow \
+            with the input size. Use this for inputs larger than \
+            memory.")
+    parser_stat.add_argument(
+        "--tmpdir", type=str, dest="tmpdir", default=None,
+        help="Directory of temporary files used by \"--stream\". \
+            (default: the system temporary directory)")
+    parser_stat.add_argument(
+        "--region", type=str, dest="regions", default=None,
+        help=region_help)
     parser_stat.add_argument(
         "-l", "--log", type=str, metavar="log_file", default=None,
         help=log_help)
@@ -500,30 +844,83 @@ def main():
         command = sys.argv[1]
         if command == 'stat':
             config_log(switch=args.debug, logfile=args.log)
-            info = ov_stats(args.bed1, args.bed2,
-                            name1=args.nameA,
-                            name2=args.nameB,
-                            bg_size=args.bgsize)
+            print_format()
+            from cobindability.ovstat import ov_stats
+            from cobindability.ovstream import stream_stats
+            from cobindability.ireader import read_regions
+            from cobindability.BED import bed_to_intervalset
+            try:
+                regions = read_regions(args.regions)
+            except ValueError as e:
+                logging.error(e)
+                sys.exit(1)
+            if args.stream:
+                info = stream_stats(args.bed1, args.bed2,
+                                    name1=args.nameA,
+                                    name2=args.nameB,
+                                    bg_size=args.bgsize,
+                                    tmp_dir=args.tmpdir,
+                                    regions=regions)
+            else:
+                bed1, bed2 = args.bed1, args.bed2
+                if regions is not None:
+                    bed1 = bed_to_intervalset(args.bed1, regions=regions)
+                    bed2 = bed_to_intervalset(args.bed2, regions=regions)
+                info = ov_stats(bed1, bed2,
+                                name1=args.nameA,
+                                name2=args.nameB,
+                                bg_size=args.bgsize)
             print(info)
 
         elif command == 'overlap':
             config_log(switch=args.debug, logfile=args.log)
+            print_format()
+            from cobindability.BED import peakwise_ovcoef
+            from cobindability.ovbootstrap import bootstrap_coef
+            from cobindability.ovstream import stream_coef
+            from cobindability.coefcal import ov_coef
+            from cobindability.ireader import read_regions
+            from cobindability.BED import bed_to_intervalset
+            try:
+                regions = read_regions(args.regions)
+            except ValueError as e:
+                logging.error(e)
+                sys.exit(1)
             logging.info("Calculate collocation coefficient (overall) ...")
-            result = bootstrap_coef(args.bed1,
-                                    args.bed2,
-                                    name1=args.nameA,
-                                    name2=args.nameB,
-                                    size_factor=1/args.subsample,
-                                    score_func=ov_coef,
-                                    n_draws=args.iter,
-                                    fraction=args.subsample,
-                                    bg_size=args.bgsize)
+            if args.stream:
+                result = stream_coef(args.bed1,
+                                     args.bed2,
+                                     name1=args.nameA,
+                                     name2=args.nameB,
+                                     score_func=ov_coef,
+                                     bg_size=args.bgsize,
+                                     tmp_dir=args.tmpdir,
+                                     regions=regions)
+            else:
+                bed1, bed2 = args.bed1, args.bed2
+                if regions is not None:
+                    bed1 = bed_to_intervalset(args.bed1, regions=regions)
+                    bed2 = bed_to_intervalset(args.bed2, regions=regions)
+                result = bootstrap_coef(bed1,
+                                        bed2,
+                                        name1=args.nameA,
+                                        name2=args.nameB,
+                                        size_factor=1/args.subsample,
+                                        score_func=ov_coef,
+                                        n_draws=args.iter,
+                                        fraction=args.subsample,
+                                        bg_size=args.bgsize,
+                                        seed=args.seed,
+                                        threads=args.threads)
             print(result)
-            if args.save:
+            if args.save and args.stream:
+                logging.warning(
+                    "Peak-wise coefficients are not calculated with --stream.")
+            elif args.save:
                 logging.info(
                     "Calculate collocation coefficient (peak-wise) ...")
-                peakwise_ovcoef(args.bed1,
-                                args.bed2,
+                peakwise_ovcoef(bed1,
+                                bed2,
                                 name1=args.nameA,
                                 name2=args.nameB,
                                 score_func=ov_coef,
@@ -532,6 +929,10 @@ def main():
 
         elif command == 'jaccard':
             config_log(switch=args.debug, logfile=args.log)
+            print_format()
+            from cobindability.BED import peakwise_ovcoef
+            from cobindability.ovbootstrap import bootstrap_coef
+            from cobindability.coefcal import ov_jaccard
             logging.info("Calculate Jaccard coefficient (overall) ...")
             result = bootstrap_coef(args.bed1,
                                     args.bed2,
@@ -541,7 +942,9 @@ def main():
                                     score_func=ov_jaccard,
                                     n_draws=args.iter,
                                     fraction=args.subsample,
-                                    bg_size=args.bgsize)
+                                    bg_size=args.bgsize,
+                                    seed=args.seed,
+                                    threads=args.threads)
             print(result)
             if args.save:
                 logging.info("Calculate Jaccard coefficient (peakwise) ...")
@@ -555,6 +958,10 @@ def main():
 
         elif command == 'dice':
             config_log(switch=args.debug, logfile=args.log)
+            print_format()
+            from cobindability.BED import peakwise_ovcoef
+            from cobindability.ovbootstrap import bootstrap_coef
+            from cobindability.coefcal import ov_sd
             logging.info("Calculate Sørensen–Dice coefficient (overall) ...")
             result = bootstrap_coef(args.bed1,
                                     args.bed2,
@@ -563,7 +970,9 @@ def main():
                                     size_factor=1/args.subsample,
                                     score_func=ov_sd, n_draws=args.iter,
                                     fraction=args.subsample,
-                                    bg_size=args.bgsize)
+                                    bg_size=args.bgsize,
+                                    seed=args.seed,
+                                    threads=args.threads)
             print(result)
             if args.save:
                 logging.info(
@@ -578,6 +987,10 @@ def main():
 
         elif command == 'simpson':
             config_log(switch=args.debug, logfile=args.log)
+            print_format()
+            from cobindability.BED import peakwise_ovcoef
+            from cobindability.ovbootstrap import bootstrap_coef
+            from cobindability.coefcal import ov_ss
             logging.info(
                 "Calculate Szymkiewicz–Simpson coefficient (overall) ...")
             result = bootstrap_coef(args.bed1,
@@ -588,7 +1001,9 @@ def main():
                                     score_func=ov_ss,
                                     n_draws=args.iter,
                                     fraction=args.subsample,
-                                    bg_size=args.bgsize)
+                                    bg_size=args.bgsize,
+                                    seed=args.seed,
+                                    threads=args.threads)
             print(result)
             if args.save:
                 logging.info(
@@ -603,6 +1018,10 @@ def main():
 
         elif command == 'pmi':
             config_log(switch=args.debug, logfile=args.log)
+            print_format()
+            from cobindability.BED import peakwise_ovcoef
+            from cobindability.ovbootstrap import bootstrap_coef
+            from cobindability.coefcal import pmi_value
             logging.info(
                 "Calculate the pointwise mutual information (PMI) ...")
             # result = cal_pmi(args.bed1, args.bed2, bg_size=args.bgsize)
@@ -614,7 +1033,9 @@ def main():
                                     score_func=pmi_value,
                                     n_draws=args.iter,
                                     fraction=args.subsample,
-                                    bg_size=args.bgsize)
+                                    bg_size=args.bgsize,
+                                    seed=args.seed,
+                                    threads=args.threads)
             print(result)
             if args.save:
                 peakwise_ovcoef(args.bed1,
@@ -627,6 +1048,10 @@ def main():
 
         elif command == 'npmi':
             config_log(switch=args.debug, logfile=args.log)
+            print_format()
+            from cobindability.BED import peakwise_ovcoef
+            from cobindability.ovbootstrap import bootstrap_npmi
+            from cobindability.coefcal import npmi_value
             logging.info(
                 "Calculate the normalized pointwise mutual information (NPMI)")
             # result=cal_pmi(args.bed1, args.bed2, bg_size=args.bgsize)
@@ -638,7 +1063,9 @@ def main():
                                     score_func=npmi_value,
                                     n_draws=args.iter,
                                     fraction=args.subsample,
-                                    bg_size=args.bgsize)
+                                    bg_size=args.bgsize,
+                                    seed=args.seed,
+                                    threads=args.threads)
             print(result)
             if args.save:
                 peakwise_ovcoef(args.bed1,
@@ -649,20 +1076,88 @@ def main():
                                 g=args.bgsize,
                                 na_label='NA')
 
+        elif command == 'all':
+            config_log(switch=args.debug, logfile=args.log)
+            print_format()
+            from cobindability.ovbootstrap import bootstrap_all
+            from cobindability.utils import append_row
+            logging.info(
+                "Calculate C, J, SD, SS, PMI and NPMI (overall) ...")
+            result = bootstrap_all(args.bed1,
+                                   args.bed2,
+                                   name1=args.nameA,
+                                   name2=args.nameB,
+                                   n_draws=args.iter,
+                                   fraction=args.subsample,
+                                   bg_size=args.bgsize,
+                                   seed=args.seed,
+                                   threads=args.threads)
+            print(result)
+            if args.tsv is not None:
+                logging.info("Append results to \"%s\"" % args.tsv)
+                append_row(result, args.tsv)
+
+        elif command == 'matrix':
+            config_log(switch=args.debug, logfile=args.log)
+            from cobindability.ovmatrix import expand_inputs, coef_matrix
+            from cobindability.ovmatrix import write_matrix
+            bed_files = expand_inputs(args.inputs)
+            if len(bed_files) < 2:
+                logging.error("At least two BED files are required.")
+                sys.exit(1)
+            logging.info(
+                "Calculate C, J, SD, SS, PMI and NPMI (all-vs-all) ...")
+            names, sizes, matrices = coef_matrix(bed_files,
+                                                 bg_size=args.bgsize,
+                                                 threads=args.threads)
+            for outfile in write_matrix(names, sizes, matrices, args.output):
+                logging.info("Save to \"%s\"" % outfile)
+
+        elif command == 'index':
+            config_log(switch=args.debug, logfile=args.log)
+            from cobindability.ovmatrix import expand_inputs
+            from cobindability.ovindex import build_index
+            bed_files = expand_inputs(args.inputs)
+            if len(bed_files) == 0:
+                logging.error("No BED files found.")
+                sys.exit(1)
+            build_index(bed_files, args.index_dir, threads=args.threads)
+
+        elif command == 'query':
+            config_log(switch=args.debug, logfile=args.log)
+            from cobindability.ovindex import query_index
+            results = query_index(args.bed1, args.index_dir,
+                                  name1=args.nameA,
+                                  bg_size=args.bgsize)
+            logging.info("Save to \"%s\"" % args.output)
+            results.to_csv(args.output, sep="\t", index=False)
+
         elif command == 'srog':
             config_log(switch=args.debug, logfile=args.log)
+            print_format()
             logging.info(
                 "Determine the spacial realtions of genomic (SROG) intervals")
-            summary = srog_peak(inbed1=args.bed1,
-                                inbed2=args.bed2,
-                                outfile=args.output,
-                                max_dist=args.max_dist)
+            if len(args.bed2) == 1:
+                from cobindability.BED import srog_peak
+                summary = srog_peak(inbed1=args.bed1,
+                                    inbed2=args.bed2[0],
+                                    outfile=args.output,
+                                    max_dist=args.max_dist)
+            else:
+                from cobindability.ovsrog import srog_multi
+                summary = srog_multi(inbed1=args.bed1,
+                                     targets=args.bed2,
+                                     outfile=args.output,
+                                     max_dist=args.max_dist)
             print(summary)
 
         elif command == 'covary':
             config_log(switch=args.debug, logfile=args.log)
+            print_format()
+            from cobindability.BED import compare_bed, bed_to_array
+            from cobindability.bw import bigwig_corr
             a_uniq_lst, b_uniq_lst, common_lst = compare_bed(
-                args.bed1, args.bed2)
+                bed_to_array(args.bed1), bed_to_array(args.bed2))
             logging.info("Calculate covariabilities of overlapped regions ...")
             c_corr = bigwig_corr(bed=common_lst,
                                  bw1=args.bw1,
@@ -716,6 +1211,8 @@ def main():
 
         elif command == 'cooccur':
             config_log(switch=args.debug, logfile=args.log)
+            print_format()
+            from cobindability.BED import cooccur_peak
             logging.info(
                 "Calculate the co-occurrence of two sets of genomic intervals")
             results = cooccur_peak(inbed1=args.bed1,
@@ -728,8 +1225,68 @@ def main():
                                    p_cut=args.p_cut)
             print(results)
 
+        elif command == 'cooccur-batch':
+            config_log(switch=args.debug, logfile=args.log)
+            from cobindability.ovmatrix import expand_inputs, write_matrix
+            from cobindability.ovcooccur import cooccur_batch, pair_matrices
+            bed_files = expand_inputs(args.inputs)
+            if len(bed_files) < 2:
+                logging.error("At least two BED files are required.")
+                sys.exit(1)
+            logging.info(
+                "Calculate the co-occurrence of %d sets of genomic intervals"
+                % len(bed_files))
+            results = cooccur_batch(bed_files, args.bed3,
+                                    n_cut=args.n_cut,
+                                    p_cut=args.p_cut,
+                                    threads=args.threads)
+            logging.info("Save to \"%s\"" % args.output)
+            results.to_csv(args.output, sep="\t", index=False)
+            if args.matrix is not None:
+                names, counts, matrices = pair_matrices(results)
+                for outfile in write_matrix(names, counts, matrices,
+                                            args.matrix):
+                    logging.info("Save to \"%s\"" % outfile)
+
+        elif command == 'covary-matrix':
+            config_log(switch=args.debug, logfile=args.log)
+            from cobindability.BED import bed_to_array
+            from cobindability.ovmatrix import write_matrix
+            from cobindability.ovcovary import covary_matrix
+            if len(args.bw_files) < 2:
+                logging.error("At least two bigWig files are required.")
+                sys.exit(1)
+            logging.info("Read genomic regions from \"%s\"" % args.bed)
+            bed = bed_to_array(args.bed)
+            names, counts, n_regions, matrices = covary_matrix(
+                bed, args.bw_files, args.output,
+                score_type=args.score_type,
+                exact=args.exact,
+                top_x=args.top_X,
+                min_sig=args.min_signal,
+                methods=args.methods,
+                threads=args.threads)
+            logging.info("%d regions were used to calculate correlations"
+                         % n_regions)
+            for outfile in write_matrix(names, counts, matrices, args.output):
+                logging.info("Save to \"%s\"" % outfile)
+
+        elif command == 'sort':
+            config_log(switch=args.debug, logfile=args.log)
+            from cobindability.extsort import sort_bed
+            try:
+                n = sort_bed(args.bed, args.output, memory=args.memory,
+                             tmp_dir=args.tmpdir)
+            except ValueError as e:
+                logging.error(str(e))
+                sys.exit(1)
+            logging.info("%d sorted intervals saved to \"%s\"" %
+                         (n, args.output))
+
         elif command == 'zscore':
             config_log(switch=args.debug, logfile=args.log)
+            print_format()
+            from cobindability.utils import cal_zscores
             cal_zscores(args.input, args.output)
 
 
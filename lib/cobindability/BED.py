@@ -1,14 +1,13 @@
 #!/usr/bin/env python
 
-import sys,os
+import sys
 import logging
 import numpy as np
 import pandas as pd
 from os.path import basename
-from scipy.stats import fisher_exact
-from bx.bitset_builders import binned_bitsets_from_file, binned_bitsets_from_list
-from bx.intervals.intersection import Interval, Intersecter
-from cobindability import ireader, version
+from cobindability import ireader, intervals, version
+from cobindability.fisher import fisher_exact_batch
+from cobindability.ovsrog import srog_annotate
 
 __author__ = "Liguo Wang"
 __copyright__ = "Copyleft"
@@ -20,6 +19,85 @@ __email__ = "wang.liguo@mayo.edu"
 __status__ = "Development"
 
 
+def _is_intervals(inbed):
+    """
+    Return True if inbed is one of the accepted inputs of genomic intervals:
+    a file name, a list of (chrom, start, end) tuples, an IntervalArray or
+    an IntervalSet.
+    """
+    return type(inbed) in (str, list) or isinstance(
+        inbed, (intervals.IntervalArray, intervals.IntervalSet))
+
+
+def _as_output(coords, *inputs):
+    """
+    Return a dict of intervals as an IntervalArray if any of the inputs is
+    an IntervalArray, or as a list of (chrom, start, end) tuples otherwise.
+    """
+    if any(isinstance(i, intervals.IntervalArray) for i in inputs):
+        return intervals.IntervalArray.from_coords(coords)
+    return intervals.to_list(coords)
+
+
+def _bed_name(inbed):
+    """
+    Name of the input genomic intervals: the base name of a file, or the
+    name of an IntervalArray or IntervalSet.
+    """
+    if type(inbed) is str:
+        return basename(inbed)
+    name = getattr(inbed, 'name', None)
+    return name if name is not None else 'intervals'
+
+
+def unique_names(inbeds):
+    """
+    Names of several inputs (see `_bed_name`) that tell them apart. If some
+    files share a base name, the trailing directories of their paths are
+    added until the names differ; inputs that are still indistinguishable
+    are numbered.
+
+    Examples
+    --------
+    >>> unique_names(['dup/x/p.bed', 'dup/y/p.bed', 'dup/s1.bed'])
+    ['x/p.bed', 'y/p.bed', 's1.bed']
+    """
+    parts = [i.rstrip('/').split('/') if type(i) is str else [_bed_name(i)]
+             for i in inbeds]
+    depth = [1] * len(parts)
+    while True:
+        names = ['/'.join(p[-d:]) for p, d in zip(parts, depth)]
+        counts = {}
+        for name in names:
+            counts[name] = counts.get(name, 0) + 1
+        grow = [i for i, name in enumerate(names)
+                if counts[name] > 1 and depth[i] < len(parts[i])]
+        if not grow:
+            break
+        for i in grow:
+            depth[i] += 1
+    seen = {}
+    for i, name in enumerate(names):
+        if counts[name] > 1:
+            seen[name] = seen.get(name, 0) + 1
+            names[i] = '%s#%d' % (name, seen[name])
+    return names
+
+
+def _merged_intervals(inbed):
+    """
+    Read genomic intervals (file or list) and merge them into sorted,
+    disjoint per-chromosome arrays. Exit if the input cannot be parsed.
+    """
+    if isinstance(inbed, intervals.IntervalSet):
+        return inbed.merged
+    try:
+        return intervals.merged(inbed)
+    except (ValueError, TypeError) as e:
+        logging.error("invalid input: %s (%s)" % (inbed, e))
+        sys.exit(1)
+
+
 def union_bed3(inbed):
     """
     Merge or union genomic intervals. Only consider the first three columns
@@ -27,14 +105,15 @@ def union_bed3(inbed):
 
     Parameters
     ----------
-    inbed : str or list
+    inbed : str, list, IntervalArray or IntervalSet
         Name of a BED file or list of genomic intervals (for example,
         [(chr1 100 200), (chr2 150  300), (chr2 1000 1200)])
 
     Returns
     -------
-    unioned_intervals : list
-        List of genomic intervals with the overlapped regions merged.
+    unioned_intervals : list or IntervalArray
+        Genomic intervals with the overlapped regions merged. An
+        IntervalArray is returned if inbed is an IntervalArray.
 
     Examples
     --------
@@ -46,28 +125,10 @@ def union_bed3(inbed):
     if type(inbed) is list:
         if len(inbed) == 0:
             return unioned_intervals
-        else:
-            bitsets = binned_bitsets_from_list(inbed)
-    elif type(inbed) is str:
-        try:
-            bitsets = binned_bitsets_from_file(ireader.reader(inbed))
-        except:
-            logging.error("invalid input: %s" % inbed)
-            sys.exit(1)
-    else:
+    elif not _is_intervals(inbed):
         logging.error("invalid input: %s" % inbed)
         sys.exit(1)
-
-    for chrom in bitsets:
-        bits = bitsets[chrom]
-        end = 0
-        while 1:
-            start = bits.next_set(end)
-            if start == bits.size:
-                break
-            end = bits.next_clear(start)
-            unioned_intervals.append((chrom, start, end))
-    bitsets = dict()
+    unioned_intervals = _as_output(_merged_intervals(inbed), inbed)
     return unioned_intervals
 
 
@@ -80,74 +141,36 @@ def intersect_bed3(inbed1,inbed2):
 
     Parameters
     ----------
-    inbed1 : str or list
+    inbed1 : str, list, IntervalArray or IntervalSet
         Name of a BED file or list of genomic intervals, for example,
         [(chr1 100 200), (chr2 1000 1200)]
-    inbed2 : str or list
+    inbed2 : str, list, IntervalArray or IntervalSet
         Name of a BED file or list of genomic intervalss, for example,
         [(chr1 150 220), (chr2 1100 1300)]
 
     Returns
     -------
-    shared_intervals : list
-        List of genomic intervals shared between the two input BED files (or lists).
+    shared_intervals : list or IntervalArray
+        Genomic intervals shared between the two input BED files (or lists).
+        An IntervalArray is returned if either input is an IntervalArray.
 
     Examples
     --------
     >>> intersect_bed3([('chr1', 1, 10), ('chr1', 20, 35)], [('chr1',3, 15), ('chr1',20, 50)])
     [('chr1', 3, 10), ('chr1', 20, 35)]
     """
-    shared_intervals = []
-    # read inbed1
-    if type(inbed1) is list:
-        if len(inbed1) == 0:
-            return shared_intervals
-        else:
-            bits1 = binned_bitsets_from_list(inbed1)
-    elif type(inbed1) is str:
-        try:
-            bits1 = binned_bitsets_from_file(ireader.reader(inbed1))
-        except:
-            logging.error("invalid input: %s" % inbed1)
-            sys.exit(1)
-    else:
-        logging.error("invalid input: %s" % inbed1)
-        sys.exit(1)
-
-    # read inbed2
-    if type(inbed2) is list:
-        if len(inbed2) == 0:
-            return shared_intervals
-        else:
-            bits2 = binned_bitsets_from_list(inbed2)
-    elif type(inbed2) is str:
-        try:
-            bits2 = binned_bitsets_from_file(ireader.reader(inbed2))
-        except:
-            logging.error("invalid input: %s" % inbed2)
+    shared_intervals = _as_output({}, inbed1, inbed2)
+    for inbed in (inbed1, inbed2):
+        if type(inbed) is list:
+            if len(inbed) == 0:
+                return shared_intervals
+        elif not _is_intervals(inbed):
+            logging.error("invalid input: %s" % inbed)
             sys.exit(1)
-    else:
-        logging.error("invalid input: %s" % inbed2)
-        sys.exit(1)
-    bitsets = dict()
 
     # determine the shared intervals
-    for key in bits1:
-        if key in bits2:
-            bits1[key].iand(bits2[key])
-            bitsets[key] = bits1[key]
-    for chrom in bitsets:
-        bits = bitsets[chrom]
-        end = 0
-        while 1:
-            start = bits.next_set(end)
-            if start == bits.size:
-                break
-            end = bits.next_clear(start)
-            shared_intervals.append((chrom, start, end))
-    bits1.clear()
-    bits2.clear()
-    bitsets.clear()
+    shared_intervals = _as_output(intervals.intersect_arrays(
+        _merged_intervals(inbed1), _merged_intervals(inbed2)), inbed1, inbed2)
     return shared_intervals
 
 
@@ -157,17 +180,19 @@ def subtract_bed3(inbed1, inbed2):
 
     Parameters
     ----------
-    inbed1 : str or list
+    inbed1 : str, list, IntervalArray or IntervalSet
         Name of a BED file or list of genomic intervals, for example,
         [(chr1 100 200), (chr2 1000 1200)]
-    inbed2 : str or list
+    inbed2 : str, list, IntervalArray or IntervalSet
         Name of a BED file or list of genomic intervals, for example,
         [(chr1 150 220), (chr2 1100 1300)]
 
     Returns
     -------
-    remain_intervals : list
-        List of genomic intervals from inbed1 with those shared regions with inbed2 removed.
+    remain_intervals : list or IntervalArray
+        Genomic intervals from inbed1 with those shared regions with inbed2
+        removed. An IntervalArray is returned if either input is an
+        IntervalArray.
 
     Examples
     --------
@@ -175,57 +200,27 @@ def subtract_bed3(inbed1, inbed2):
     [('chr1', 1, 3)]
 
     """
-    remain_intervals = []
+    remain_intervals = _as_output({}, inbed1, inbed2)
     # read inbed1
     if type(inbed1) is list:
         if len(inbed1) == 0:
             return remain_intervals
-        else:
-            bitsets1 = binned_bitsets_from_list(inbed1)
-    elif type(inbed1) is str:
-        try:
-            bitsets1 = binned_bitsets_from_file(ireader.reader(inbed1))
-        except:
-            logging.error("invalid input: %s" % inbed1)
-            sys.exit(1)
-    else:
+    elif not _is_intervals(inbed1):
         logging.error("invalid input: %s" % inbed1)
         sys.exit(1)
     # read inbed2
     if type(inbed2) is list:
         if len(inbed2) == 0:
-            if type(inbed1) is list:
+            if type(inbed1) is list or \
+                    isinstance(inbed1, intervals.IntervalArray):
                 return inbed1
             else:
                 return bed_to_list(inbed1)
-        else:
-            bitsets2 = binned_bitsets_from_list(inbed2)
-    elif type(inbed2) is str:
-        try:
-            bitsets2 = binned_bitsets_from_file(ireader.reader(inbed2))
-        except:
-            logging.error("invalid input: %s" % inbed2)
-            sys.exit(1)
-    else:
+    elif not _is_intervals(inbed2):
         logging.error("invalid input: %s" % inbed2)
         sys.exit(1)
-    for chrom in bitsets1:
-        if chrom not in bitsets1:
-            continue
-        bits1 = bitsets1[chrom]
-        if chrom in bitsets2:
-            bits2 = bitsets2[chrom]
-            bits2.invert()
-            bits1.iand(bits2)
-        end = 0
-        while 1:
-            start = bits1.next_set(end)
-            if start == bits1.size:
-                break
-            end = bits1.next_clear(start)
-            remain_intervals.append((chrom, start, end))
-    bitsets1 = dict()
-    bitsets2 = dict()
+    remain_intervals = _as_output(intervals.subtract_arrays(
+        _merged_intervals(inbed1), _merged_intervals(inbed2)), inbed1, inbed2)
     return remain_intervals
 
 
@@ -236,9 +231,10 @@ def bed_actual_size(*argv):
     Parameters
     ----------
     argv : list of genomic regions.
-        Each argument can be a list, BED-like file, or a bigBed file. BED file
-        can be regular, compressed, or remote file. The suffix of bigBed file
-        must be one of ('.bb','.bigbed','.bigBed','.BigBed', '.BB',' BIGBED').
+        Each argument can be a list, IntervalArray, IntervalSet, BED-like
+        file, or a bigBed file. BED file can be regular, compressed, or
+        remote file. The suffix of bigBed file must be one of ('.bb',
+        '.bigbed','.bigBed','.BigBed', '.BB',' BIGBED').
 
     Returns
     -------
@@ -254,10 +250,20 @@ def bed_actual_size(*argv):
     sizes = []
     for arg in argv:
         size = 0
-        if type(arg) is list:
+        if isinstance(arg, (intervals.IntervalSet, intervals.IntervalArray)):
+            size = arg.total_size
+        elif type(arg) is list:
             for chrom, start, end in arg:
                 size += (int(end) - int(start))
         elif type(arg) is str:
+            try:
+                df = ireader.read_bed(arg)
+                tmp = (df['end'] - df['start']).to_numpy()
+                sizes.append(int(tmp[tmp > 0].sum()))
+                continue
+            except ValueError:
+                # parse line by line to report the invalid lines
+                pass
             for l in ireader.reader(arg):
                 if l.startswith(('browser', '#', 'track')):
                     continue
@@ -281,9 +287,10 @@ def bed_counts(*argv):
     Parameters
     ----------
     argv : list of genomic regions.
-        Each argument can be a list, BED-like file, or a bigBed file. BED file
-        can be regular, compressed, or remote file. The suffix of bigBed file
-        must be one of ('.bb','.bigbed','.bigBed','.BigBed', '.BB',' BIGBED').
+        Each argument can be a list, IntervalArray, IntervalSet, BED-like
+        file, or a bigBed file. BED file can be regular, compressed, or
+        remote file. The suffix of bigBed file must be one of ('.bb',
+        '.bigbed','.bigBed','.BigBed', '.BB',' BIGBED').
 
     Returns
     -------
@@ -299,9 +306,16 @@ def bed_counts(*argv):
     bed_counts = []
     for arg in argv:
         count = 0
-        if type(arg) is list:
+        if type(arg) is list or isinstance(
+                arg, (intervals.IntervalSet, intervals.IntervalArray)):
             count = len(arg)
         elif type(arg) is str:
+            try:
+                bed_counts.append(len(ireader.read_bed(arg)))
+                continue
+            except ValueError:
+                # parse line by line to report the invalid lines
+                pass
             for l in ireader.reader(arg):
                 if l.startswith(('browser', '#', 'track')):
                     continue
@@ -322,9 +336,10 @@ def bed_genomic_size(*argv):
     Parameters
     ----------
     argv : list of genomic regions.
-        Each argument can be a list, BED-like file, or a bigBed file. BED file
-        can be regular, compressed, or remote file. The suffix of bigBed file
-        must be one of ('.bb','.bigbed','.bigBed','.BigBed', '.BB',' BIGBED').
+        Each argument can be a list, IntervalArray, IntervalSet, BED-like
+        file, or a bigBed file. BED file can be regular, compressed, or
+        remote file. The suffix of bigBed file must be one of ('.bb',
+        '.bigbed','.bigBed','.BigBed', '.BB',' BIGBED').
 
     Returns
     -------
@@ -343,28 +358,13 @@ def bed_genomic_size(*argv):
     '''
     union_sizes = []
     for arg in argv:
-        if type(arg) is list:
-            bitsets = binned_bitsets_from_list(arg)
-        elif type(arg) is str:
-            try:
-                bitsets = binned_bitsets_from_file(ireader.reader(arg))
-            except:
-                logging.error("Invalid input: %s" % arg)
-                sys.exit(1)
-        else:
+        if isinstance(arg, intervals.IntervalSet):
+            union_sizes.append(arg.genomic_size)
+            continue
+        if not _is_intervals(arg):
             logging.error("Invalid input: %s" % arg)
             sys.exit(1)
-        union_size = 0
-        for chrom in bitsets:
-            bits = bitsets[chrom]
-            end = 0
-            while 1:
-                start = bits.next_set(end)
-                if start == bits.size:
-                    break
-                end = bits.next_clear(start)
-                union_size += (end - start)
-        union_sizes.append(union_size)
+        union_sizes.append(intervals.genomic_size(_merged_intervals(arg)))
     return (union_sizes)
 
 
@@ -375,10 +375,10 @@ def bed_overlap_size(bed1, bed2):
 
     Parameters
     ----------
-    bed1 : str or list
+    bed1 : str, list, IntervalArray or IntervalSet
         File name of the first BED file. Can also be a list, such as
         [(chr1 100 200), (chr2 150  300), (chr2 1000 1200)]
-    bed2 : str or list
+    bed2 : str, list, IntervalArray or IntervalSet
         File name of the second BED file. Can also be a list, such as
         [(chr1 100 200), (chr2 150  300), (chr2 1000 1200)]
 
@@ -394,69 +394,49 @@ def bed_overlap_size(bed1, bed2):
     Int. Overlapped size.
 
     """
-    overlap_size = 0
-    if type(bed1) is list:
-        bits1 = binned_bitsets_from_list(bed1)
-    else:
-        bits1 = binned_bitsets_from_file(ireader.reader(bed1))
-    if type(bed2) is list:
-        bits2 = binned_bitsets_from_list(bed2)
-    else:
-        bits2 = binned_bitsets_from_file(ireader.reader(bed2))
-    bitsets = dict()
-    for key in bits1:
-        if key in bits2:
-            bits1[key].iand(bits2[key])
-            bitsets[key] = bits1[key]
-    for chrom in bitsets:
-        bits = bitsets[chrom]
-        end = 0
-        while 1:
-            start = bits.next_set(end)
-            if start == bits.size:
-                break
-            end = bits.next_clear(start)
-            overlap_size += end - start
+    overlap_size = intervals.overlap_size(
+        _merged_intervals(bed1), _merged_intervals(bed2))
     return overlap_size
 
 
 def bed_info(infile):
     """
     Basic information of genomic intervals.
-    """
-    logging.debug("Gathering teh basic statistics of BED file: %s" % infile)
-    bed_infor={}
-    bed_infor['Name'] = basename(infile)
-    bed_infor['Genomic_size'] = bed_genomic_size(infile)[0]
-    bed_infor['Total_size'] = 0
-    bed_infor['Count'] = 0
-    size = 0
-    sizes = []
-    for l in ireader.reader(infile):
-        if l.startswith(('browser', '#', 'track')):
-            continue
-        f = l.split()
-        if len(f) < 3:
-            logging.error("invalid BED line: %s" % l)
-        if (int(f[2]) - int(f[1])) < 0:
-            logging.error("invalid BED line: %s" % l)
-        bed_infor['Count'] += 1
-        size = int(f[2]) - int(f[1])
-        bed_infor['Total_size'] += size
-        sizes.append(size)
-    bed_infor['Mean_size'] = np.mean(sizes)
-    bed_infor['Median_size'] = np.median(sizes)
-    bed_infor['Min_size'] = np.min(sizes)
-    bed_infor['Max_size'] = np.max(sizes)
-    bed_infor['STD'] = np.std(sizes, ddof=1)
 
-    return bed_infor
+    Parameters
+    ----------
+    infile : str, list, IntervalArray or IntervalSet
+        Name of a BED file, genomic intervals, or an IntervalSet returned by
+        `bed_to_intervalset`.
+
+    Returns
+    -------
+    dict
+        'Name', 'Genomic_size', 'Total_size', 'Count', 'Mean_size',
+        'Median_size', 'Min_size', 'Max_size' and 'STD'.
+    """
+    if isinstance(infile, intervals.IntervalSet):
+        bed_set = infile
+    else:
+        logging.debug("Gathering the basic statistics of BED file: %s" % infile)
+        bed_set = bed_to_intervalset(infile)
+    return bed_set.info()
 
 
 def bed_to_list(bedfile):
     """
-    Convert BED file into a list.
+    Convert BED file (or IntervalArray, IntervalSet) into a list.
     """
+    if isinstance(bedfile, (intervals.IntervalSet, intervals.IntervalArray)):
+        return bedfile.to_list()
+    try:
+        df = ireader.read_bed(bedfile)
+        if not np.any(df['end'].to_numpy() < df['start'].to_numpy()):
+            return list(zip(df['chrom'].astype(str).tolist(),
+                            df['start'].tolist(), df['end'].tolist()))
+    except ValueError:
+        pass
+    # parse line by line to report the invalid line
     regions = []
     for l in ireader.reader(bedfile):
         l = l.strip()
@@ -473,6 +453,79 @@ def bed_to_list(bedfile):
     return regions
 
 
+def bed_to_array(bedfile, name=None):
+    """
+    Read BED file (or list of genomic intervals) into an IntervalArray, a
+    compact, column-wise alternative to `bed_to_list` (chromosome codes
+    plus start and end arrays, ~9 bytes per interval instead of ~200).
+    Intervals are kept in input order; only the first three columns are
+    used.
+
+    Parameters
+    ----------
+    bedfile : str, list or IntervalArray
+        Name of a BED file or list of genomic intervals. An IntervalArray is
+        returned unchanged; an IntervalSet is converted.
+    name : str, optional
+        Name of the interval set. If None, the base name of the BED file
+        is used.
+
+    Returns
+    -------
+    IntervalArray
+
+    Examples
+    --------
+    >>> bed = bed_to_array([('chr1', 1, 10), ('chr1', 20, 35)])
+    >>> bed_genomic_size(bed)
+    [24]
+    """
+    if isinstance(bedfile, intervals.IntervalSet):
+        return bedfile.to_array()
+    try:
+        return intervals.IntervalArray.from_bed(bedfile, name=name)
+    except (ValueError, TypeError) as e:
+        logging.error(str(e))
+        sys.exit(1)
+
+
+def bed_to_intervalset(bedfile, name=None, regions=None):
+    """
+    Parse BED file (or list of genomic intervals) once into an IntervalSet.
+
+    The returned object carries the interval counts, sizes, merged intervals
+    and summary statistics, and can be passed to `bed_info`,
+    `bed_genomic_size`, `bed_overlap_size` and `ovstat.ov_stats` in place of
+    the file name, so the file is not read again.
+
+    Parameters
+    ----------
+    bedfile : str, list, IntervalArray or IntervalSet
+        Name of a BED file or list of genomic intervals. An IntervalSet is
+        returned unchanged.
+    name : str, optional
+        Name of the interval set. If None, the base name of the BED file
+        is used.
+    regions : str, list or dict, optional
+        Only keep the intervals overlapping these regions, for example,
+        'chr1,chr2:1000000-2000000' (see `ireader.read_regions`). bigBed
+        files only read the data blocks covering the regions. The default
+        is None (all intervals).
+
+    Returns
+    -------
+    IntervalSet
+    """
+    if isinstance(bedfile, intervals.IntervalSet):
+        return bedfile
+    try:
+        return intervals.IntervalSet.from_bed(bedfile, name=name,
+                                              regions=regions)
+    except (ValueError, TypeError) as e:
+        logging.error("invalid input: %s (%s)" % (bedfile, e))
+        sys.exit(1)
+
+
 def compare_bed(inbed1, inbed2):
 
     """
@@ -480,22 +533,22 @@ def compare_bed(inbed1, inbed2):
 
     Parameters
     ----------
-    inbed1 : str or list
+    inbed1 : str, list, IntervalArray or IntervalSet
         Name of a BED file or list of BED regions, for example,
         [(chr1 100 200), (chr2 150  300), (chr2 1000 1200)]
-    inbed2 : str or list
+    inbed2 : str, list, IntervalArray or IntervalSet
         Name of a BED file or list of BED regions, for example,
         [(chr1 100 200), (chr2 150  300), (chr2 1000 1200)]
 
     Returns
     -------
-    bed1_uniq : list
+    bed1_uniq : list or IntervalArray
         Genomic regions that are inbed1 unique (i.e., regions only present in inbed1 but
         do not overlap with any regions in inbed2).
-    bed2_uniq : list
+    bed2_uniq : list or IntervalArray
         Genomic regions that are inbed2 unique (i.e., regions only present in inbed2 but
         do not overlap with any regions in inbed1).
-    common : list
+    common : list or IntervalArray
         Genomic regions overlapped between inbed1 and inbed2. Note, the
         overlapped regions were merged. For example, (chr1 1 10) and (chr1 5 15)
         will be merged as (chr1 1 15).
@@ -503,68 +556,58 @@ def compare_bed(inbed1, inbed2):
     Note
     ----
     Overlapped regions *within* input BED files (or lists) are merged before
-    comparison.
+    comparison. IntervalArrays are returned if either input is an
+    IntervalArray.
 
+    Examples
+    --------
+    >>> compare_bed([('chr1', 1, 10), ('chr1', 40, 50)], [('chr1', 5, 15), ('chr2', 1, 10)])
+    ([('chr1', 40, 50)], [('chr2', 1, 10)], [('chr1', 1, 15)])
     """
 
     logging.info("Read and union BED file: \"%s\"" % inbed1)
-    bed1_union = union_bed3(inbed1)
-    logging.info("Unioned regions of \"%s\" : %d" % (inbed1, len(bed1_union)))
+    bed1_union = _merged_intervals(inbed1)
+    logging.info("Unioned regions of \"%s\" : %d" %
+                 (inbed1, intervals.interval_count(bed1_union)))
 
     logging.info("Read and union BED file: \"%s\"" % inbed2)
-    bed2_union = union_bed3(inbed2)
-    logging.info("Unioned regions of \"%s\" : %d" % (inbed2, len(bed2_union)))
+    bed2_union = _merged_intervals(inbed2)
+    logging.info("Unioned regions of \"%s\" : %d" %
+                 (inbed2, intervals.interval_count(bed2_union)))
 
     logging.info("Merge BED files \"%s\" and \"%s\"" % (inbed1, inbed2))
-    bed12_union = union_bed3(bed1_union + bed2_union)
-    logging.info("Unioned regions of two BED files : %d" % len(bed12_union))
-
-    logging.info("Build interval tree for unioned BED file: \"%s\"" % inbed1)
-    maps1 = {}
-    for (ichr1, istart1, iend1) in bed1_union:
-        if ichr1 not in maps1:
-            maps1[ichr1] = Intersecter()
-        maps1[ichr1].add_interval(Interval(istart1, iend1))
-
-    logging.info("Build interval tree for unioned BED file: \"%s\"" % inbed2)
-    maps2 = {}
-    for (ichr2, istart2, iend2) in bed2_union:
-        if ichr2 not in maps2:
-            maps2[ichr2] = Intersecter()
-        maps2[ichr2].add_interval(Interval(istart2, iend2))
+    bed12_union = intervals.union_arrays(bed1_union, bed2_union)
+    logging.info("Unioned regions of two BED files : %d" %
+                 intervals.interval_count(bed12_union))
 
     logging.info("Find common and specific regions ...")
-    bed1_uniq = []
-    bed2_uniq = []
-    common = []
-    for (chrom, start, end) in bed12_union:
-        if chrom in maps1 and chrom in maps2:
-            # found in maps1
-            if len(maps1[chrom].find(start, end)) > 0:
-                # found in maps2
-                if len(maps2[chrom].find(start, end)) > 0:
-                    common.append((chrom, start, end))
-                # not found in maps2
-                else:
-                    bed1_uniq.append((chrom, start, end))
-            # not found in maps1
-            else:
-                # found in maps2
-                if len(maps2[chrom].find(start, end)) > 0:
-                    bed2_uniq.append((chrom, start, end))
-                # not found in maps2
-                else:
-                    continue
-        elif chrom in maps1:
-            bed1_uniq.append((chrom, start, end))
-        elif chrom in maps2:
-            bed2_uniq.append((chrom, start, end))
-        else:
-            continue
-    logging.info("\"%s\" unique regions: %d" % (inbed1, len(bed1_uniq)))
-    logging.info("\"%s\" unique regions: %d" % (inbed2, len(bed2_uniq)))
-    logging.info("Common (overlapped) regions: %d" % len(common))
-    return (bed1_uniq, bed2_uniq, common)
+    empty = np.empty(0, dtype=np.int64)
+    bed1_uniq = {}
+    bed2_uniq = {}
+    common = {}
+    for chrom, (starts, ends) in bed12_union.items():
+        # every merged region of inbed1 (inbed2) lies within one unioned
+        # region, so a unioned region overlaps inbed1 (inbed2) if it
+        # contains at least one of its regions
+        found = []
+        for bed_union in (bed1_union, bed2_union):
+            s, e = bed_union.get(chrom, (empty, empty))
+            found.append(np.searchsorted(s, ends, side='left') >
+                         np.searchsorted(e, starts, side='right'))
+        for selected, results in ((found[0] & found[1], common),
+                                  (found[0] & ~found[1], bed1_uniq),
+                                  (~found[0] & found[1], bed2_uniq)):
+            if selected.any():
+                results[chrom] = (starts[selected], ends[selected])
+    logging.info("\"%s\" unique regions: %d" %
+                 (inbed1, intervals.interval_count(bed1_uniq)))
+    logging.info("\"%s\" unique regions: %d" %
+                 (inbed2, intervals.interval_count(bed2_uniq)))
+    logging.info("Common (overlapped) regions: %d" %
+                 intervals.interval_count(common))
+    return (_as_output(bed1_uniq, inbed1, inbed2),
+            _as_output(bed2_uniq, inbed1, inbed2),
+            _as_output(common, inbed1, inbed2))
 
 
 def peakwise_ovcoef(inbed1, inbed2, score_func, g, name1=None, name2=None, na_label='NA'):
@@ -574,10 +617,10 @@ def peakwise_ovcoef(inbed1, inbed2, score_func, g, name1=None, name2=None, na_la
 
     Parameters
     ----------
-    inbed1 : str
-        Name of a BED file.
-    inbed2 : str
-        Name of another BED file.
+    inbed1 : str, list, IntervalArray or IntervalSet
+        Name of a BED file, or genomic intervals.
+    inbed2 : str, list, IntervalArray or IntervalSet
+        Name of another BED file, or genomic intervals.
     score_func : function
         Function to calculate overlap index. Include ov_coef, ov_jaccard, ov_ss, ov_sd.
     name1 : str, optional
@@ -593,101 +636,158 @@ def peakwise_ovcoef(inbed1, inbed2, score_func, g, name1=None, name2=None, na_la
     -------
     None
     """
-    # pattern = re.compile(".bed$", re.IGNORECASE)
-    logging.info("Read and union BED file: \"%s\"" % inbed1)
-    bed1_union = union_bed3(inbed1)
-    logging.info("Unioned regions of \"%s\" : %d" % (inbed1, len(bed1_union)))
-
-    logging.info("Read and union BED file: \"%s\"" % inbed2)
-    bed2_union = union_bed3(inbed2)
-    logging.info("Unioned regions of \"%s\" : %d" % (inbed2, len(bed2_union)))
-
-    # logging.info("Merge BED files \"%s\" and \"%s\"" % (inbed1, inbed2))
-    # bed12_union = union_bed3(bed1_union + bed2_union)
-    # logging.info("Unioned regions of two BED files : %d" % len(bed12_union))
-
-    logging.info("Build interval tree for unioned BED file: \"%s\"" % inbed1)
-    maps1 = {}
-    for (ichr1, istart1, iend1) in bed1_union:
-        if ichr1 not in maps1:
-            maps1[ichr1] = Intersecter()
-        maps1[ichr1].add_interval(Interval(istart1, iend1))
-
-    logging.info("Build interval tree for unioned BED file: \"%s\"" % inbed2)
-    maps2 = {}
-    for (ichr2, istart2, iend2) in bed2_union:
-        if ichr2 not in maps2:
-            maps2[ichr2] = Intersecter()
-        maps2[ichr2].add_interval(Interval(istart2, iend2))
+    logging.info("Read and union BED file: \"%s\"" % _bed_name(inbed1))
+    bed1_union = _merged_intervals(inbed1)
+    logging.info("Unioned regions of \"%s\" : %d" %
+                 (_bed_name(inbed1),
+                  sum(len(v[0]) for v in bed1_union.values())))
+
+    logging.info("Read and union BED file: \"%s\"" % _bed_name(inbed2))
+    bed2_union = _merged_intervals(inbed2)
+    logging.info("Unioned regions of \"%s\" : %d" %
+                 (_bed_name(inbed2),
+                  sum(len(v[0]) for v in bed2_union.values())))
 
     # overlap bed file 1 with bed file 2
-    logging.info("Calculate the overlap coefficient of each genomic region in %s ..." % inbed1)
+    logging.info("Calculate the overlap coefficient of each genomic region in %s ..." % _bed_name(inbed1))
     if name1 is None:
-        outfile_name1 = os.path.basename(inbed1) + '_peakwise_scores.tsv'
+        outfile_name1 = _bed_name(inbed1) + '_peakwise_scores.tsv'
     else:
         outfile_name1 = name1 + '_peakwise_scores.tsv'
-    BED1OUT = open(outfile_name1, 'w')
-    print('\t'.join(['chrom', 'start', 'end', 'A.size', 'B.size', 'A∩B', 'A∪B', 'B.list', 'Score']), file=BED1OUT)
-    for chrom, start, end in bed1_union:
-        try:
-            bed_1_size = end - start
-            if bed_1_size <= 0:
-                logging.debug("Skip %s" % (chrom + ':' + str(start) + '-' + str(end)))
-            bed_1_lst = [(chrom, start, end)]
-            bed_2_size = 0
-            bed_2_lst = []
-
-            overlaps = maps2[chrom].find(start, end)
-            #print (overlaps)
-            if len(overlaps) == 0:
-                print('\t'.join([str(i) for i in (chrom, start, end, bed_1_size, na_label, na_label, na_label, na_label, na_label)]), file=BED1OUT)
-            else:
-                for o in overlaps:
-                    bed_2_size += (o.end - o.start)
-                    bed_2_lst.append((chrom, o.start, o.end))
-                overlap_size = bed_overlap_size(bed_1_lst, bed_2_lst)
-                union_size = bed_genomic_size(bed_1_lst + bed_2_lst)[0]
-                peak_ov_coef = score_func(bed_1_size, bed_2_size, overlap_size, g)
-                target_list = ','.join([i[0] + ':' + str(i[1]) + '-' + str(i[2]) for i in bed_2_lst])
-                print('\t'.join([str(i) for i in (chrom, start, end, bed_1_size, bed_2_size, overlap_size, union_size, target_list, peak_ov_coef)]), file=BED1OUT)
-        except:
-            print('\t'.join([str(i) for i in (chrom, start, end, bed_1_size, na_label, na_label, na_label, na_label, na_label)]), file=BED1OUT)
-    BED1OUT.close()
+    _write_peakwise(bed1_union, bed2_union, score_func, g, outfile_name1,
+                    na_label, query_is_a=True)
     logging.info("Save peakwise scores to %s ..." % outfile_name1)
 
     # overlap bed file 2 with bed file 1
-    logging.info("Calculate the overlap coefficient of each genomic region in %s ..." % inbed2)
+    logging.info("Calculate the overlap coefficient of each genomic region in %s ..." % _bed_name(inbed2))
     if name2 is None:
-        outfile_name2 = os.path.basename(inbed2) + '_peakwise_scores.tsv'
+        outfile_name2 = _bed_name(inbed2) + '_peakwise_scores.tsv'
     else:
         outfile_name2 = name2 + '_peakwise_scores.tsv'
-    BED2OUT = open(outfile_name2, 'w')
-    print('\t'.join(['chrom', 'start', 'end', 'A.size', 'B.size', 'A∩B', 'A∪B','B.list', 'Score']), file=BED2OUT)
-    for chrom, start, end in bed2_union:
-        try:
-            bed_2_size = end - start
-            if bed_2_size <= 0:
-                logging.debug("Skip %s" % (chrom + ':' + str(start) + '-' + str(end)))
-            bed_2_lst = [(chrom, start, end)]
-            bed_1_size = 0
-            bed_1_lst = []
-
-            overlaps = maps1[chrom].find(start, end)
-            if len(overlaps) == 0:
-                print('\t'.join([str(i) for i in (chrom, start, end, bed_1_size, na_label, na_label, na_label, na_label, na_label)]), file=BED2OUT)
-            else:
-                for o in overlaps:
-                    bed_1_size += (o.end - o.start)
-                    bed_1_lst.append((chrom, o.start, o.end))
-                overlap_size = bed_overlap_size(bed_2_lst, bed_1_lst)
-                peak_ov_coef = score_func(bed_1_size, bed_2_size, overlap_size, g)
-                target_list = ','.join([i[0] + ':' + str(i[1]) + '-' + str(i[2]) for i in bed_1_lst])
-                print('\t'.join([str(i) for i in (chrom, start, end, bed_1_size, bed_2_size, overlap_size, union_size, target_list, peak_ov_coef)]), file=BED2OUT)
-        except:
-            print('\t'.join([str(i) for i in (chrom, start, end, bed_1_size, na_label, na_label, na_label, na_label, na_label)]), file=BED2OUT)
-    BED2OUT.close()
+    _write_peakwise(bed2_union, bed1_union, score_func, g, outfile_name2,
+                    na_label, query_is_a=False)
     logging.info("Save peakwise scores to %s ..." % outfile_name2)
 
+
+def _write_peakwise(query, target, score_func, g, outfile, na_label,
+                    query_is_a=True):
+    """
+    Write the peak-wise scores of each merged region in query.
+
+    Both inputs are merged (sorted, disjoint) per-chromosome arrays, so the
+    target regions overlapping each query region form a contiguous block
+    found by two binary searches, and their sizes and overlaps are obtained
+    from prefix sums. Rows are written in blocks.
+
+    Parameters
+    ----------
+    query : dict
+        Chromosome ID => (starts, ends) of merged query regions.
+    target : dict
+        Chromosome ID => (starts, ends) of merged target regions.
+    score_func : function
+        Function to calculate overlap index.
+    g : int
+        Size of the genomic background.
+    outfile : str
+        Name of output file.
+    na_label : str
+        String label used to represent missing value.
+    query_is_a : bool
+        If True, query is reported as 'A' (the 1st file); otherwise query is
+        reported as 'B' and target as 'A'.
+    """
+    nas = '\t'.join([na_label] * 5)
+    with open(outfile, 'w') as OUT:
+        OUT.write('\t'.join(['chrom', 'start', 'end', 'A.size', 'B.size', 'A∩B', 'A∪B', 'B.list', 'Score']) + '\n')
+        for chrom, (q_starts, q_ends) in query.items():
+            q_sizes = (q_ends - q_starts).tolist()
+            if chrom in target and len(target[chrom][0]) > 0:
+                t_starts, t_ends = target[chrom]
+                # target regions [lo, hi) satisfy t_end > q_start and
+                # t_start < q_end
+                lo = np.searchsorted(t_ends, q_starts, side='right')
+                hi = np.searchsorted(t_starts, q_ends, side='left')
+                cum = np.concatenate(([0], np.cumsum(t_ends - t_starts)))
+                t_sizes = (cum[hi] - cum[lo]).tolist()
+                ov_sizes = (intervals.covered_before(t_starts, t_ends, q_ends) -
+                            intervals.covered_before(t_starts, t_ends, q_starts)).tolist()
+                labels = [chrom + ':' + str(i) + '-' + str(j) for i, j in
+                          zip(t_starts.tolist(), t_ends.tolist())]
+                lo = lo.tolist()
+                hi = hi.tolist()
+            else:
+                lo = hi = [0] * len(q_sizes)
+            rows = []
+            for i, (start, end) in enumerate(zip(q_starts.tolist(), q_ends.tolist())):
+                prefix = chrom + '\t' + str(start) + '\t' + str(end) + '\t'
+                if hi[i] <= lo[i]:
+                    rows.append(prefix + str(q_sizes[i] if query_is_a else 0) + '\t' + nas)
+                    continue
+                if query_is_a:
+                    a_size, b_size = q_sizes[i], t_sizes[i]
+                else:
+                    a_size, b_size = t_sizes[i], q_sizes[i]
+                overlap_size = ov_sizes[i]
+                union_size = a_size + b_size - overlap_size
+                try:
+                    peak_ov_coef = score_func(a_size, b_size, overlap_size, g)
+                except Exception:
+                    rows.append(prefix + str(a_size) + '\t' + nas)
+                    continue
+                rows.append(prefix + '\t'.join([str(v) for v in (a_size, b_size, overlap_size, union_size, ','.join(labels[lo[i]:hi[i]]), peak_ov_coef)]))
+            if rows:
+                OUT.write('\n'.join(rows) + '\n')
+
+
+def cooccur_flags(background, peaks, n_cut=1, p_cut=0.0):
+    """
+    Decide which background regions are occupied by a set of peaks.
+
+    A background region is occupied if it overlaps at least one peak, the
+    number of overlapped bases is >= n_cut, and the overlapped bases make
+    up >= p_cut of the overlapping peaks. Both inputs are merged, so the
+    peaks overlapping each background region form a contiguous block found
+    by binary searches, and all regions are classified at once.
+
+    Parameters
+    ----------
+    background : dict
+        Chromosome ID => (starts, ends) of merged background regions.
+    peaks : dict
+        Chromosome ID => (starts, ends) of merged peaks.
+    n_cut : int, optional
+        Threshold of overlap size. The default is 1.
+    p_cut : float, optional
+        Threshold of overlap percentage. The default is 0.0.
+
+    Returns
+    -------
+    numpy.ndarray
+        Boolean flag of each background region, in the order of
+        `background` (chromosome by chromosome).
+    """
+    flags = []
+    for chrom, (bg_starts, bg_ends) in background.items():
+        if chrom not in peaks or len(peaks[chrom][0]) == 0:
+            flags.append(np.zeros(len(bg_starts), dtype=bool))
+            continue
+        starts, ends = peaks[chrom]
+        lo = np.searchsorted(ends, bg_starts, side='right')
+        hi = np.searchsorted(starts, bg_ends, side='left')
+        cum = np.concatenate(([0], np.cumsum(ends - starts)))
+        peak_size = cum[hi] - cum[lo]
+        ov_size = (intervals.covered_before(starts, ends, bg_ends) -
+                   intervals.covered_before(starts, ends, bg_starts))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            ov_ratio = np.where(peak_size > 0,
+                                ov_size / np.maximum(peak_size, 1), 0)
+        flags.append((hi > lo) & (ov_size >= n_cut) & (ov_ratio >= p_cut))
+    if len(flags) == 0:
+        return np.zeros(0, dtype=bool)
+    return np.concatenate(flags)
+
+
 def cooccur_peak(inbed1, inbed2, inbed_bg, outfile, name1=None, name2=None,
                  n_cut=1, p_cut=0.0):
     """
@@ -696,12 +796,13 @@ def cooccur_peak(inbed1, inbed2, inbed_bg, outfile, name1=None, name2=None,
 
     Parameters
     ----------
-    inbed1 : str
-        Name of a BED file.
-    inbed2 : str
-        Name of another BED file.
-    inbed_bg : str
-        Name of the background BED file (e.g., all promoters, all enhancers).
+    inbed1 : str, list, IntervalArray or IntervalSet
+        Name of a BED file, or genomic intervals.
+    inbed2 : str, list, IntervalArray or IntervalSet
+        Name of another BED file, or genomic intervals.
+    inbed_bg : str, list, IntervalArray or IntervalSet
+        Name of the background BED file (e.g., all promoters, all enhancers),
+        or genomic intervals.
     outfile : str
         Name of the output file.
     n_cut : int, optional
@@ -721,154 +822,45 @@ def cooccur_peak(inbed1, inbed2, inbed_bg, outfile, name1=None, name2=None,
     if name2 is None:
         name2 = "B"
     results = {}
-    inbed1_name = os.path.basename(inbed1)
-    inbed2_name = os.path.basename(inbed2)
+    inbed1_name = _bed_name(inbed1)
+    inbed2_name = _bed_name(inbed2)
     results[name1 + '.name'] = inbed1_name
     results[name2 + '.name'] = inbed2_name
     logging.info("Read and union BED file: \"%s\"" % inbed1)
-    bed1_union = union_bed3(inbed1)
-    results[name1 + '.count'] = len(bed1_union)
+    bed1_union = _merged_intervals(inbed1)
+    results[name1 + '.count'] = intervals.interval_count(bed1_union)
 
     logging.info("Read and union BED file: \"%s\"" % inbed2)
-    bed2_union = union_bed3(inbed2)
-    results[name2 + '.count'] = len(bed2_union)
+    bed2_union = _merged_intervals(inbed2)
+    results[name2 + '.count'] = intervals.interval_count(bed2_union)
 
     logging.info("Read and union background BED file: \"%s\"" % inbed_bg)
-    background = union_bed3(inbed_bg)
-    results['G.count'] = len(background)
-
-    logging.info("Build interval tree for : \"%s\"" % inbed1)
-    maps1 = {}
-    for (ichr1, istart1, iend1) in bed1_union:
-        if ichr1 not in maps1:
-            maps1[ichr1] = Intersecter()
-        maps1[ichr1].add_interval(Interval(istart1, iend1))
-
-    logging.info("Build interval tree for: \"%s\"" % inbed2)
-    maps2 = {}
-    for (ichr2, istart2, iend2) in bed2_union:
-        if ichr2 not in maps2:
-            maps2[ichr2] = Intersecter()
-        maps2[ichr2].add_interval(Interval(istart2, iend2))
+    background = _merged_intervals(inbed_bg)
+    results['G.count'] = intervals.interval_count(background)
 
     # background regions will be divided into 4 categories
-    bed1_only = 0
-    bed2_only = 0
-    cooccur = 0
-    neither = 0
-    OUT = open(outfile, 'w')
-
-    for chrom, start, end in background:
-        line = chrom + '\t' + str(start) + '\t' + str(end)
-        bed1_flag = False
-        bed2_flag = False
-
-        if (chrom not in maps1) and (chrom not in maps2):
-            pass
-        elif (chrom not in maps1) and (chrom in maps2):
-            bed2_overlaps = maps2[chrom].find(start, end)
-            if len(bed2_overlaps) == 0:
-                pass
-            else:
-                bed2_overlap_lst = []
-                for o in bed2_overlaps:
-                    bed2_overlap_lst.append((chrom, o.start, o.end))
-                bed2_overlap_size = bed_overlap_size(
-                    [(chrom, start, end)], bed2_overlap_lst)
-                bed2_genomic_size = bed_genomic_size(bed2_overlap_lst)
-                try:
-                    bed2_overlap_ratio = bed2_overlap_size/bed2_genomic_size
-                except:
-                    bed2_overlap_ratio = 0
-                if bed2_overlap_size >= n_cut and bed2_overlap_ratio >= p_cut:
-                    bed2_flag = True
-        elif (chrom in maps1) and (chrom not in maps2):
-            bed1_overlaps = maps1[chrom].find(start, end)
-            if len(bed2_overlaps) == 0:
-                pass
-            else:
-                bed1_overlap_lst = []
-                for o in bed1_overlaps:
-                    bed1_overlap_lst.append((chrom, o.start, o.end))
-                bed1_overlap_size = bed_overlap_size(
-                    [(chrom, start, end)], bed1_overlap_lst)
-                bed1_genomic_size = bed_genomic_size(bed1_overlap_lst)
-                try:
-                    bed1_overlap_ratio = bed1_overlap_size/bed1_genomic_size
-                except:
-                    bed1_overlap_ratio = 0
-                if bed1_overlap_size >= n_cut and bed1_overlap_ratio >= p_cut:
-                    bed1_flag = True
-        else:
-            # overlaps with inbed1
-            bed1_overlaps = maps1[chrom].find(start, end)
-            # overlaps with inbed2
-            bed2_overlaps = maps2[chrom].find(start, end)
-            if len(bed1_overlaps) == 0:
-                if len(bed2_overlaps) == 0:
-                    pass
-                elif len(bed2_overlaps) > 0:
-                    bed2_overlap_lst = []
-                    for o in bed2_overlaps:
-                        bed2_overlap_lst.append((chrom, o.start, o.end))
-                    bed2_overlap_size = bed_overlap_size(
-                        [(chrom, start, end)], bed2_overlap_lst)
-                    bed2_genomic_size = bed_genomic_size(bed2_overlap_lst)
-                    try:
-                        bed2_overlap_ratio = bed2_overlap_size/bed2_genomic_size
-                    except:
-                        bed2_overlap_ratio = 0
-                    if bed2_overlap_size >= n_cut and bed2_overlap_ratio >= p_cut:
-                        bed2_flag = True
-            elif len(bed1_overlaps) > 0:
-                bed1_overlap_lst = []
-                for o in bed1_overlaps:
-                    bed1_overlap_lst.append((chrom, o.start, o.end))
-                bed1_overlap_size = bed_overlap_size(
-                    [(chrom, start, end)], bed1_overlap_lst)
-                bed1_genomic_size = bed_genomic_size(bed1_overlap_lst)
-                try:
-                    bed1_overlap_ratio = bed1_overlap_size/bed1_genomic_size
-                except:
-                    bed1_overlap_ratio = 0
-                if bed1_overlap_size >= n_cut and bed1_overlap_ratio >= p_cut:
-                    bed1_flag = True
-
-                if len(bed2_overlaps) == 0:
-                    pass
-                elif len(bed2_overlaps) > 0:
-                    bed2_overlap_lst = []
-                    for o in bed2_overlaps:
-                        bed2_overlap_lst.append((chrom, o.start, o.end))
-                    bed2_overlap_size = bed_overlap_size(
-                        [(chrom, start, end)], bed2_overlap_lst)
-                    bed2_genomic_size = bed_genomic_size(bed2_overlap_lst)
-                    try:
-                        bed2_overlap_ratio = bed2_overlap_size/bed2_genomic_size
-                    except:
-                        bed2_overlap_ratio = 0
-                    if bed2_overlap_size >= n_cut and bed2_overlap_ratio >= p_cut:
-                        bed2_flag = True
-        if bed1_flag:
-            if bed2_flag:
-                cooccur += 1
-                print(line + '\tCooccur', file=OUT)
-            else:
-                bed1_only += 1
-                if name1 is None:
-                    print(line + '\t%s_only' % inbed1_name, file=OUT)
-                else:
-                    print(line + '\t%s_only' % name1, file=OUT)
-        else:
-            if bed2_flag:
-                bed2_only += 1
-                if name2 is None:
-                    print(line + '\t%s_only' % inbed2_name, file=OUT)
-                else:
-                    print(line + '\t%s_only' % name2, file=OUT)
-            else:
-                neither += 1
-                print(line + '\tNeither', file=OUT)
+    logging.info("Classify background regions ...")
+    bed1_flags = cooccur_flags(background, bed1_union, n_cut, p_cut)
+    bed2_flags = cooccur_flags(background, bed2_union, n_cut, p_cut)
+    cooccur = int(np.sum(bed1_flags & bed2_flags))
+    bed1_only = int(np.sum(bed1_flags & ~bed2_flags))
+    bed2_only = int(np.sum(~bed1_flags & bed2_flags))
+    neither = int(np.sum(~bed1_flags & ~bed2_flags))
+
+    # labels indexed by bed1_flag + 2 * bed2_flag
+    labels = np.array(['Neither', '%s_only' % name1, '%s_only' % name2,
+                       'Cooccur'], dtype=object)
+    codes = bed1_flags.astype(np.int8) + 2 * bed2_flags.astype(np.int8)
+    with open(outfile, 'w') as OUT:
+        offset = 0
+        for chrom, (starts, ends) in background.items():
+            n = len(starts)
+            rows = [chrom + '\t' + str(i) + '\t' + str(j) + '\t' + k for
+                    i, j, k in zip(starts.tolist(), ends.tolist(),
+                                   labels[codes[offset:offset + n]])]
+            if rows:
+                OUT.write('\n'.join(rows) + '\n')
+            offset += n
 
     results['%s+,%s-' % (name1, name2)] = bed1_only
     results['%s-,%s+' % (name1, name2)] = bed2_only
@@ -880,14 +872,14 @@ def cooccur_peak(inbed1, inbed2, inbed_bg, outfile, name1=None, name2=None,
     else:
         table = np.array([[neither, bed2_only], [bed1_only, cooccur]])
     # print (table)
-    oddsr, p = fisher_exact(table, alternative='greater')
+    oddsr, p, log_p = fisher_exact_batch(table, alternative='greater')
     results['odds-ratio'] = oddsr
     results['p-value'] = p
     return pd.Series(data=results, name="Fisher's exact test result")
 
 
 def bed_to_file(bed_list, bed_file):
-    ''' Save list of genomic regions to file'''
+    ''' Save list (or IntervalArray) of genomic regions to file'''
     OUT = open(bed_file, 'w')
     for tmp in bed_list:
         print('\t'.join([str(i) for i in tmp]), file=OUT)
@@ -989,114 +981,34 @@ def srog_peak(inbed1, inbed2, outfile, n_up=1, n_down=1,
     """
     Calculates SROG code for each region in inbed1
 
+    Regions of inbed2 overlapping each region of inbed1 are reported with
+    their SROG codes. For regions of inbed1 without overlap, the nearest
+    upstream and downstream regions of inbed2 (strand-aware, within
+    max_dist) are reported instead. Regions are looked up in sorted arrays,
+    one chromosome at a time (see `ovsrog.SrogIndex`).
+
     Parameters
     ----------
-    inbed1 : str
-        Name of a BED file.
-    inbed2 : str
-        Name of another BED file.
+    inbed1 : str, list, IntervalArray or IntervalSet
+        Name of a BED file, or genomic intervals.
+    inbed2 : str, list, IntervalArray or IntervalSet
+        Name of another BED file, or genomic intervals.
     outfile : str
         Name of output file.
+    n_up : int, optional
+        Number of upstream regions searched. The default is 1.
+    n_down : int, optional
+        Number of downstream regions searched. The default is 1.
+    max_dist : int, optional
+        Maximum distance to the upstream/downstream regions. The default is
+        250000000.
 
     Returns
     -------
     pd Series
     """
-
-    maps = {}
-    OUTPUT = open(outfile, 'w')
-    srog_summary = {
-        'disjoint': 0, 'overlap': 0, 'contain': 0, 'within': 0, 'touch': 0,
-        'equal': 0, 'other': 0}
-    logging.info("Build interval tree from file: \"%s\"" % inbed2)
-    for l in ireader.reader(inbed2):
-        if l.startswith(('browser', '#', 'track')):
-            continue
-        f = l.split()
-        if len(f) < 3:
-            logging.warning(
-                "Invalid BED line (Requires at least 3 columns: chrom, start, end): %s" % l)
-            continue
-        chrom, start, end = f[0], int(f[1]), int(f[2])
-        if start > end:
-            logging.warning("invalid BED line (start > end): %s" % l)
-            continue
-
-        # try to get name from the 4th column
-        try:
-            name = f[3]
-        except:
-            name = f[0] + ':' + f[1] + '-' + f[2]
-
-        # try to get strand from the 6th column
-        try:
-            strandness = f[5]
-            if strandness not in ('+', '-'):
-                strandness = '+'
-        except:
-            strandness = '+'
-
-        if chrom not in maps:
-            maps[chrom] = Intersecter()
-        maps[chrom].add_interval(Interval(start, end, value=name, strand=strandness))
-
-    logging.info("Reading BED file: \"%s\"" % inbed1)
-    for l in ireader.reader(inbed1):
-        if l.startswith(('browser', '#', 'track')):
-            continue
-        f = l.split()
-        if len(f) < 3:
-            logging.warning("Invalid BED line (Requires at least 3 columns: chrom, start, end): %s" % l)
-            continue
-        chrom, start, end = f[0], int(f[1]), int(f[2])
-        if start > end:
-            logging.warning("Invalid BED line (start > end): %s" % l)
-            continue
-
-        # try to get name from the 4th column
-        try:
-            name = f[3]
-        except:
-            name = f[0] + ':' + f[1] + '-' + f[2]
-
-        # try to get strand from the 6th column
-        try:
-            strandness = f[5]
-            if strandness not in ('+', '-'):
-                strandness = '+'
-        except:
-            strandness = '+'
-
-        if chrom not in maps:
-            srog_summary['disjoint'] += 1
-            print(l + '\t' + 'NA' + '\t' + 'NA', file=OUTPUT)
-            continue
-
-        overlaps = maps[chrom].find(start, end)
-        if len(overlaps) == 0:
-            srog_summary['disjoint'] += 1
-            up_interval =  maps[chrom].upstream_of_interval(Interval(start, end, strand=strandness), num_intervals=n_up, max_dist=max_dist)
-            down_interval =  maps[chrom].downstream_of_interval(Interval(start, end, strand=strandness), num_intervals=n_down, max_dist=max_dist)
-            if len(up_interval) == 0:
-                up_interval_name = 'NA'
-            else:
-                up_interval_name = str(up_interval[0].value)
-            if len(down_interval) == 0:
-                down_interval_name = 'NA'
-            else:
-                down_interval_name = str(down_interval[0].value)
-            print(l + '\t' + 'disjoint' + '\t' + 'UpInterval=' + up_interval_name + ',' + 'DownInterval=' + down_interval_name, file=OUTPUT)
-        else:
-            srog_codes = []
-            target_names = []
-            for o in overlaps:
-                tmp = srogcode((chrom, start, end), (chrom, o.start, o.end))
-                srog_codes.append(tmp)
-                target_names.append(o.value)
-            print(l + '\t' + ','.join(srog_codes) + '\t' + ','.join(target_names), file=OUTPUT)
-            for code in srog_codes:
-                srog_summary[code] += 1
-    return pd.Series(data=srog_summary)
+    return srog_annotate(inbed1, inbed2, outfile, n_up=n_up, n_down=n_down,
+                         max_dist=max_dist)
 
 
 if __name__ == '__main__':
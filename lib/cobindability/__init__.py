@@ -0,0 +1,24 @@
+"""
+cobindability: collocation analyses of genomic regions.
+
+Submodules are loaded lazily: ``import cobindability`` is cheap, and
+``cobindability.BED`` (for example) imports the submodule, together with
+the third-party packages it needs, on first access.
+"""
+
+import importlib
+
+__all__ = ['BED', 'bbreader', 'bedcache', 'bw', 'coefcal', 'extsort',
+           'fetch', 'findbed', 'fisher', 'inflate', 'intervals', 'ireader',
+           'ovbootstrap', 'ovcooccur', 'ovcovary', 'ovindex', 'ovmatrix',
+           'ovstat', 'ovsrog', 'ovstream', 'utils', 'version']
+
+
+def __getattr__(name):
+    if name in __all__:
+        return importlib.import_module('.' + name, __name__)
+    raise AttributeError("module %r has no attribute %r" % (__name__, name))
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
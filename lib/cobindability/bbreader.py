@@ -4,9 +4,20 @@
 """
 read bigBed files.
 
+The header, chromosome B+ tree and R-tree index of a bigBed file are parsed
+directly, so the data blocks covering the requested chromosomes (or
+windows) are located before any data is read. Neighbouring blocks are then
+fetched in large coalesced reads (one seek and read, or one HTTP range
+request, per group of blocks), and the records are decoded into numpy
+arrays without building text lines.
 """
 
-import pyBigWig
+import re
+import zlib
+import struct
+from urllib.request import urlopen, Request
+import numpy as np
+from cobindability import fetch
 from cobindability import version
 
 __author__ = "Liguo Wang"
@@ -18,13 +29,416 @@ __maintainer__ = "Liguo Wang"
 __email__ = "wang.liguo@mayo.edu"
 __status__ = "Development"
 
+_bigbed_magic = 0x8789F2EB
+_chrom_tree_magic = 0x78CA8C91
+_rtree_magic = 0x2468ACE0
+# blocks separated by less than _max_gap bytes are fetched in one read of
+# at most _max_read bytes
+_max_gap = 64 * 1024
+_max_read = 32 * 1024**2
+# number of data blocks decoded at once
+_decode_blocks = 64
+# a record: chromId, start, end (uint32) and a NUL-terminated string
+_record_head = re.compile(rb'(.{12})[^\0]*\0', re.S)
+_record_rest = re.compile(rb'.{12}([^\0]*)\0', re.S)
+# end of the window covering a whole chromosome
+whole_chrom = 2**62
+# chromosomes are laid end to end in the R-tree search (coordinates are
+# uint32)
+_chrom_span = 2**33
+
+
+def in_windows(starts, ends, win_starts, win_ends):
+    """
+    Mask of the intervals overlapping any window (start < window end and
+    end > window start). Empty intervals are treated as 1 bp. Windows must
+    be sorted and disjoint.
+
+    Examples
+    --------
+    >>> in_windows(np.array([0, 10, 50]), np.array([5, 20, 50]), np.array([15]), np.array([60]))
+    array([False,  True,  True])
+    """
+    i = np.searchsorted(win_ends, starts, side='right')
+    found = i < len(win_starts)
+    ends = np.maximum(ends, starts + 1)
+    return found & (win_starts[np.minimum(i, len(win_starts) - 1)] < ends)
+
+
+class _FileSource(object):
+    """Local file."""
+
+    def __init__(self, fname):
+        self.fh = open(fname, 'rb')
+
+    def read(self, offset, size):
+        self.fh.seek(offset)
+        return self.fh.read(size)
+
+    def close(self):
+        self.fh.close()
+
+
+class _MemorySource(object):
+    """File content held in memory."""
+
+    def __init__(self, data):
+        self.data = data
+
+    def read(self, offset, size):
+        return self.data[offset:offset + size]
+
+    def close(self):
+        self.data = b''
+
+
+class _HttpSource(object):
+    """
+    Remote file read with HTTP range requests. If the server ignores the
+    Range header, the whole file is kept in memory after the first read.
+    """
+
+    def __init__(self, url):
+        self.url = url
+        self.memory = None
+
+    def read(self, offset, size):
+        if self.memory is not None:
+            return self.memory.read(offset, size)
+        request = Request(self.url, headers={
+            'Range': 'bytes=%d-%d' % (offset, offset + size - 1)})
+        with urlopen(request) as r:
+            data = r.read()
+            if r.status == 206:
+                return data
+        self.memory = _MemorySource(data)
+        return self.memory.read(offset, size)
+
+    def close(self):
+        self.memory = None
+
+
+def _open_source(fname):
+    if fetch.cached(fname) is not None:
+        return _FileSource(fetch.cached(fname))
+    if fname.startswith(('http://', 'https://')):
+        return _HttpSource(fname)
+    if fname.startswith('ftp://'):
+        return _FileSource(fetch.fetch(fname))
+    return _FileSource(fname)
+
+
+class BigBed(object):
+    """
+    A bigBed file, local or remote (http://, https://, ftp://).
+
+    Parameters
+    ----------
+    fname : str
+        Name or URL of the bigBed file.
+
+    Raises
+    ------
+    ValueError
+        If fname is not a bigBed file.
+    """
+
+    def __init__(self, fname):
+        self.fname = fname
+        self._src = _open_source(fname)
+        header = self._src.read(0, 64)
+        for self._endian in ('<', '>'):
+            if len(header) == 64 and struct.unpack(
+                    self._endian + 'I', header[:4])[0] == _bigbed_magic:
+                break
+        else:
+            self.close()
+            raise ValueError("not a bigBed file: %s" % fname)
+        (chrom_tree_offset, self._data_offset, self._index_offset,
+         self.field_count) = struct.unpack(self._endian + 'QQQH',
+                                           header[8:34])
+        self._compressed = struct.unpack(self._endian + 'I',
+                                         header[52:56])[0] > 0
+        self._chroms = self._read_chrom_tree(chrom_tree_offset)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        self._src.close()
+
+    def chroms(self):
+        """
+        Chromosome name => size, in the order of the chromosome tree.
+        """
+        return {name: size for name, (cid, size) in self._chroms.items()}
+
+    def _read_chrom_tree(self, offset):
+        e = self._endian
+        magic, block_size, key_size, val_size = struct.unpack(
+            e + 'IIII', self._src.read(offset, 16))
+        if magic != _chrom_tree_magic:
+            raise ValueError("invalid chromosome tree: %s" % self.fname)
+        chroms = {}
+        nodes = [offset + 32]
+        while nodes:
+            node_offset = nodes.pop(0)
+            data = self._src.read(node_offset,
+                                  4 + block_size * (key_size + 8))
+            is_leaf, count = data[0], struct.unpack(e + 'H', data[2:4])[0]
+            for i in range(count):
+                p = 4 + i * (key_size + 8)
+                key = data[p:p + key_size].rstrip(b'\0').decode('utf8')
+                if is_leaf:
+                    chroms[key] = struct.unpack(
+                        e + 'II', data[p + key_size:p + key_size + 8])
+                else:
+                    nodes.append(struct.unpack(
+                        e + 'Q', data[p + key_size:p + key_size + 8])[0])
+        return chroms
+
+    def read_ranges(self, ranges):
+        """
+        Read (offset, size) byte ranges. Ranges less than `_max_gap` apart
+        are read at once (up to `_max_read` bytes). Returns the data of each
+        range, in the input order.
+        """
+        order = sorted(range(len(ranges)), key=lambda i: ranges[i][0])
+        out = [None] * len(ranges)
+        i = 0
+        while i < len(order):
+            first = ranges[order[i]][0]
+            last = first + ranges[order[i]][1]
+            j = i + 1
+            while j < len(order):
+                offset, size = ranges[order[j]]
+                if offset - last > _max_gap or \
+                        max(last, offset + size) - first > _max_read:
+                    break
+                last = max(last, offset + size)
+                j += 1
+            data = self._src.read(first, last - first)
+            for k in order[i:j]:
+                offset, size = ranges[k]
+                out[k] = data[offset - first:offset - first + size]
+            i = j
+        return out
+
+    def _windows(self, regions):
+        """
+        Windows of all chromosomes as sorted, disjoint (starts, ends) keys
+        (chromId * `_chrom_span` + position).
+        """
+        if regions is None:
+            return (np.array([0]), np.array([len(self._chroms) *
+                                             _chrom_span]))
+        starts, ends = [], []
+        for chrom in sorted(regions, key=lambda c: self._chroms.get(
+                c, (-1,))[0]):
+            if chrom not in self._chroms:
+                continue
+            base = self._chroms[chrom][0] * _chrom_span
+            win_starts, win_ends = regions[chrom]
+            starts.append(base + np.minimum(win_starts, _chrom_span - 1))
+            ends.append(base + np.minimum(win_ends, _chrom_span - 1))
+        if len(starts) == 0:
+            empty = np.empty(0, dtype=np.int64)
+            return (empty, empty)
+        return (np.concatenate(starts).astype(np.int64),
+                np.concatenate(ends).astype(np.int64))
+
+    def _blocks(self, win_starts, win_ends):
+        """
+        (offset, size) of the data blocks overlapping the windows (see
+        `_windows`), in file order. The R-tree is read one level at a time,
+        with the nodes of a level fetched in coalesced reads.
+        """
+        e = self._endian
+        magic, block_size = struct.unpack(
+            e + 'II', self._src.read(self._index_offset, 8))
+        if magic != _rtree_magic:
+            raise ValueError("invalid R-tree index: %s" % self.fname)
+        node_size = 4 + block_size * 32
+        leaf_type = np.dtype([('sc', e + 'u4'), ('sb', e + 'u4'),
+                              ('ec', e + 'u4'), ('eb', e + 'u4'),
+                              ('offset', e + 'u8'), ('size', e + 'u8')])
+        node_type = np.dtype(leaf_type.descr[:5])
+        blocks = []
+        nodes = [self._index_offset + 48] if len(win_starts) > 0 else []
+        while nodes:
+            children = []
+            for data in self.read_ranges([(o, node_size) for o in nodes]):
+                is_leaf = data[0]
+                count = struct.unpack(e + 'H', data[2:4])[0]
+                items = np.frombuffer(
+                    data, dtype=leaf_type if is_leaf else node_type,
+                    count=count, offset=4)
+                lo = items['sc'].astype(np.int64) * _chrom_span + items['sb']
+                hi = items['ec'].astype(np.int64) * _chrom_span + items['eb']
+                keep = in_windows(lo, hi, win_starts, win_ends)
+                if is_leaf:
+                    blocks.extend(zip(items['offset'][keep].tolist(),
+                                      items['size'][keep].tolist()))
+                else:
+                    children.extend(items['offset'][keep].tolist())
+            nodes = children
+        return sorted(set(blocks))
+
+    def _decode(self, data, with_rest):
+        """
+        Decode concatenated (uncompressed) records. Returns (chromIds,
+        starts, ends, rests); rests is None unless with_rest is True.
+        """
+        if self.field_count == 3 and len(data) % 13 == 0 and \
+                not data[12::13].strip(b'\0'):
+            # BED3: fixed-size records with empty strings
+            rec = np.frombuffer(data, dtype=np.dtype(
+                [('chrom', self._endian + 'u4'), ('start', self._endian + 'u4'),
+                 ('end', self._endian + 'u4'), ('nul', 'V1')]))
+            rests = [''] * len(rec) if with_rest else None
+        else:
+            heads = b''.join(_record_head.findall(data))
+            rests = None
+            if with_rest:
+                # fields cannot contain newlines
+                rests = _record_rest.findall(data)
+                rests = b'\n'.join(rests).decode('utf8').split('\n') \
+                    if rests else []
+            rec = np.frombuffer(heads, dtype=np.dtype(
+                [('chrom', self._endian + 'u4'), ('start', self._endian + 'u4'),
+                 ('end', self._endian + 'u4')]))
+        return (rec['chrom'].astype(np.int64), rec['start'].astype(np.int64),
+                rec['end'].astype(np.int64), rests)
+
+    def _data(self, blocks):
+        """
+        Yields the uncompressed content of the data blocks, in groups of
+        `_decode_blocks` blocks. Blocks are read in batches of up to
+        `_max_read` bytes.
+        """
+        i = 0
+        while i < len(blocks):
+            j = i + 1
+            total = blocks[i][1]
+            while j < len(blocks) and total + blocks[j][1] <= _max_read:
+                total += blocks[j][1]
+                j += 1
+            data = self.read_ranges(blocks[i:j])
+            i = j
+            for k in range(0, len(data), _decode_blocks):
+                group = data[k:k + _decode_blocks]
+                if self._compressed:
+                    group = [zlib.decompress(d) for d in group]
+                yield b''.join(group)
+
+    def _runs(self, regions, with_rest):
+        """
+        Yields (chromId, starts, ends, rests) of the records overlapping
+        the regions, one chromosome at a time, in file order.
+        """
+        win_starts, win_ends = self._windows(regions)
+        cid, starts, ends, rests = None, [], [], None
+        for data in self._data(self._blocks(win_starts, win_ends)):
+            chroms, s, e, r = self._decode(data, with_rest)
+            keep = in_windows(chroms * _chrom_span + s,
+                              chroms * _chrom_span + e, win_starts, win_ends)
+            bounds = np.flatnonzero(np.diff(chroms)) + 1
+            for a, b in zip([0] + bounds.tolist(),
+                            bounds.tolist() + [len(chroms)]):
+                if a == b:
+                    continue
+                if int(chroms[a]) != cid:
+                    if len(starts) > 0:
+                        yield (cid, np.concatenate(starts),
+                               np.concatenate(ends), rests)
+                    cid, starts, ends = int(chroms[a]), [], []
+                    rests = [] if with_rest else None
+                rows = np.flatnonzero(keep[a:b]) + a
+                if len(rows) == 0:
+                    continue
+                starts.append(s[rows])
+                ends.append(e[rows])
+                if with_rest and len(rows) == b - a:
+                    rests.extend(r[a:b])
+                elif with_rest:
+                    rests.extend(r[k] for k in rows.tolist())
+        if len(starts) > 0:
+            yield (cid, np.concatenate(starts), np.concatenate(ends), rests)
+
+    def records(self, chrom, windows=None, with_rest=False):
+        """
+        Records of one chromosome.
+
+        Parameters
+        ----------
+        chrom : str
+            Chromosome name.
+        windows : tuple, optional
+            Sorted, disjoint (starts, ends) arrays. Only records overlapping
+            a window are returned (see `in_windows`), and only the data
+            blocks overlapping a window are read. The default is None (the
+            whole chromosome).
+        with_rest : bool, optional
+            If True, also return the fields after the 3rd column (a
+            tab-separated string for each record). The default is False.
+
+        Returns
+        -------
+        tuple
+            (starts, ends, rests) in file order. starts and ends are int64
+            arrays; rests is a list of str, or None.
+        """
+        if windows is None:
+            windows = (np.array([0]), np.array([whole_chrom]))
+        starts, ends, rests = [], [], []
+        for run in self._runs({chrom: windows}, with_rest):
+            starts.append(run[1])
+            ends.append(run[2])
+            if with_rest:
+                rests.extend(run[3])
+        if len(starts) == 0:
+            empty = np.empty(0, dtype=np.int64)
+            return (empty, empty, [] if with_rest else None)
+        return (np.concatenate(starts), np.concatenate(ends),
+                rests if with_rest else None)
+
+    def arrays(self, regions=None):
+        """
+        Yields (chrom, (starts, ends)) for each chromosome with records, in
+        file order (the order of the chromosome tree for files made by
+        bedToBigBed).
+
+        Parameters
+        ----------
+        regions : dict, optional
+            Chromosome => sorted, disjoint (starts, ends) windows (see
+            `ireader.read_regions`). Chromosomes not in regions are not
+            read. The default is None (all records).
+        """
+        names = {cid: name for name, (cid, size) in self._chroms.items()}
+        for cid, starts, ends, rests in self._runs(regions, False):
+            yield (names[cid], (starts, ends))
+
+    def lines(self, regions=None):
+        """
+        Yields the records as text lines (chrom, start, end and the other
+        fields, tab-separated). See `arrays` for regions.
+        """
+        names = {cid: name for name, (cid, size) in self._chroms.items()}
+        for cid, starts, ends, rests in self._runs(regions, True):
+            prefix = names[cid] + '\t'
+            yield from [prefix + str(start) + '\t' + str(end) + '\t' + rest
+                        for start, end, rest in zip(starts.tolist(),
+                                                    ends.tolist(), rests)]
+
 
 def bbreader(fname):
     """
     read bigBed file
     """
-    bb = pyBigWig.open(fname)
-    chrom_dict = bb.chroms()
-    for chr in chrom_dict:
-        for start, end, score in bb.entries(chr, 0, chrom_dict[chr]):
-            yield(chr + '\t' + str(start) + '\t' + str(end) + '\t' + score)
+    with BigBed(fname) as bb:
+        for l in bb.lines():
+            yield l
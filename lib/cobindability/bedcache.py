@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Opt-in on-disk cache of parsed genomic intervals.
+
+Parsed intervals (and their merged, sorted version) of BED, BED-like and
+bigBed inputs are saved as numpy arrays, so that repeated analyses of the
+same files skip parsing entirely. Local files are keyed by path, size and
+modification time; remote files by URL and ETag (or Last-Modified). The
+least recently used entries are removed when the cache exceeds its size
+limit.
+
+The cache is turned off by default. It is turned on by calling `enable`,
+or by setting one of these environment variables:
+    COBIND_CACHE=1 : use the default cache directory (~/.cache/cobind).
+    COBIND_CACHE_DIR : use this cache directory.
+    COBIND_CACHE_SIZE : size limit in bytes (default: 2 GB).
+"""
+
+import os
+import hashlib
+import logging
+import tempfile
+from urllib.request import Request, urlopen
+import numpy as np
+from cobindability import version
+
+__author__ = "Liguo Wang"
+__copyright__ = "Copyleft"
+__credits__ = []
+__license__ = "MIT"
+__version__ = version.version
+__maintainer__ = "Liguo Wang"
+__email__ = "wang.liguo@mayo.edu"
+__status__ = "Development"
+
+# bump when the layout of cached arrays changes
+_format_version = 1
+_settings = {'dir': None, 'max_bytes': 2 * 1024**3}
+
+
+def default_cache_dir():
+    """
+    Default cache directory ($XDG_CACHE_HOME/cobind or ~/.cache/cobind).
+    """
+    root = os.environ.get('XDG_CACHE_HOME',
+                          os.path.join(os.path.expanduser('~'), '.cache'))
+    return os.path.join(root, 'cobind')
+
+
+def enable(cache_dir=None, max_bytes=None):
+    """
+    Turn on the cache.
+
+    Parameters
+    ----------
+    cache_dir : str, optional
+        Cache directory. The default is `default_cache_dir()`.
+    max_bytes : int, optional
+        Size limit of the cache. The default is 2 GB.
+    """
+    _settings['dir'] = cache_dir if cache_dir else default_cache_dir()
+    if max_bytes is not None:
+        _settings['max_bytes'] = int(max_bytes)
+
+
+def disable():
+    """
+    Turn off the cache. Cached files are kept.
+    """
+    _settings['dir'] = None
+
+
+def is_enabled():
+    return _settings['dir'] is not None
+
+
+def cache_dir():
+    """
+    Cache directory, or None if the cache is turned off.
+    """
+    return _settings['dir']
+
+
+def cache_key(fname):
+    """
+    Key of a BED or bigBed file, or None if the file cannot be cached (e.g.
+    standard input, pipes, or remote files without ETag/Last-Modified).
+    """
+    if fname.startswith(('http://', 'https://')):
+        try:
+            with urlopen(Request(fname, method='HEAD'), timeout=30) as r:
+                tag = r.headers.get('ETag') or r.headers.get('Last-Modified')
+                length = r.headers.get('Content-Length')
+        except Exception:
+            return None
+        if tag is None:
+            return None
+        ident = '%s\t%s\t%s' % (fname, tag, length)
+    elif fname == '-' or fname.startswith(('|', 'ftp://')):
+        return None
+    else:
+        try:
+            st = os.stat(fname)
+        except OSError:
+            return None
+        ident = '%s\t%d\t%d' % (os.path.abspath(fname), st.st_size,
+                                st.st_mtime_ns)
+    ident = '%d\t%s' % (_format_version, ident)
+    return hashlib.sha1(ident.encode('utf8')).hexdigest()
+
+
+def _cache_file(key):
+    return os.path.join(_settings['dir'], key + '.npz')
+
+
+def _pack(coords):
+    chroms = list(coords)
+    counts = np.array([len(coords[c][0]) for c in chroms], dtype=np.int64)
+    if len(chroms) == 0:
+        empty = np.empty(0, dtype=np.int64)
+        return (np.array(chroms, dtype=str), counts, empty, empty)
+    return (np.array(chroms, dtype=str), counts,
+            np.concatenate([coords[c][0] for c in chroms]),
+            np.concatenate([coords[c][1] for c in chroms]))
+
+
+def _unpack(chroms, counts, starts, ends):
+    bounds = np.concatenate(([0], np.cumsum(counts)))
+    return {str(c): (starts[bounds[i]:bounds[i + 1]],
+                     ends[bounds[i]:bounds[i + 1]])
+            for i, c in enumerate(chroms)}
+
+
+def load(key):
+    """
+    Load cached intervals.
+
+    Returns
+    -------
+    tuple or None
+        (coords, merged) dicts of chromosome ID => (starts, ends), or None
+        if the key is not in the cache.
+    """
+    fname = _cache_file(key)
+    try:
+        with np.load(fname) as d:
+            coords = _unpack(d['chroms'], d['counts'], d['starts'], d['ends'])
+            merged = _unpack(d['chroms_m'], d['counts_m'], d['starts_m'],
+                             d['ends_m'])
+    except FileNotFoundError:
+        return None
+    except Exception:
+        logging.debug("Remove invalid cache file: %s" % fname)
+        _remove(fname)
+        return None
+    try:
+        # the modification time records the last use (for LRU eviction)
+        os.utime(fname)
+    except OSError:
+        pass
+    logging.debug("Read intervals from cache: %s" % fname)
+    return (coords, merged)
+
+
+def save(key, coords, merged):
+    """
+    Save intervals into the cache, then evict the least recently used
+    entries if the cache is over its size limit. Failures are logged and
+    otherwise ignored.
+    """
+    cache_dir = _settings['dir']
+    chroms, counts, starts, ends = _pack(coords)
+    chroms_m, counts_m, starts_m, ends_m = _pack(merged)
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=cache_dir, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as fh:
+            np.savez(fh, chroms=chroms, counts=counts, starts=starts,
+                     ends=ends, chroms_m=chroms_m, counts_m=counts_m,
+                     starts_m=starts_m, ends_m=ends_m)
+        os.replace(tmp, _cache_file(key))
+    except OSError as e:
+        logging.debug("Cannot write cache (%s): %s" % (cache_dir, e))
+        return
+    evict()
+
+
+def evict(max_bytes=None):
+    """
+    Remove the least recently used cache files until the total size is no
+    more than max_bytes (default: the configured size limit).
+    """
+    if max_bytes is None:
+        max_bytes = _settings['max_bytes']
+    entries = []
+    try:
+        with os.scandir(_settings['dir']) as it:
+            for entry in it:
+                if entry.name.endswith('.npz'):
+                    st = entry.stat()
+                    entries.append((st.st_mtime, st.st_size, entry.path))
+    except OSError:
+        return
+    total = sum(e[1] for e in entries)
+    for mtime, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        logging.debug("Evict cache file: %s" % path)
+        _remove(path)
+        total -= size
+
+
+def _remove(fname):
+    try:
+        os.remove(fname)
+    except OSError:
+        pass
+
+
+if os.environ.get('COBIND_CACHE_DIR') or \
+        os.environ.get('COBIND_CACHE', '').lower() in ('1', 'true', 'yes'):
+    enable(os.environ.get('COBIND_CACHE_DIR'),
+           os.environ.get('COBIND_CACHE_SIZE'))
@@ -7,10 +7,13 @@ Created on Sun Dec 12 18:50:00 2021
 """
 import os
 import logging
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 import pyBigWig
 import pandas as pd
 import numpy as np
 from scipy.stats import pearsonr, spearmanr, kendalltau
+from cobindability.intervals import IntervalArray
+from cobindability.utils import pool_context
 from cobindability import version
 
 __author__ = "Liguo Wang"
@@ -22,15 +25,250 @@ __maintainer__ = "Liguo Wang"
 __email__ = "wang.liguo@mayo.edu"
 __status__ = "Development"
 
+# summary statistics computed from raw bigWig intervals
+_batch_types = ('mean', 'min', 'max')
+# regions separated by less than this (bp) are fetched by one call
+_max_gap = 10000
+# upper limit (bp) of the span of one call
+_max_block = 1000000
+_shared_args = {}
+
+
+def _fetch_intervals(bw, chrom, starts, ends):
+    """
+    Fetch the bigWig intervals covering the given regions of one chromosome
+    with as few calls as possible. Nearby regions are grouped into blocks
+    of no more than _max_block bp, and each block is read once.
+
+    Returns
+    -------
+    tuple
+        (starts, ends, values) of the bigWig intervals, sorted by start.
+    """
+    order = np.argsort(starts, kind='stable')
+    r_starts = starts[order]
+    r_ends = np.maximum.accumulate(ends[order])
+    breaks = np.flatnonzero(r_starts[1:] > r_ends[:-1] + _max_gap) + 1
+    first = np.concatenate(([0], breaks))
+    last = np.concatenate((breaks, [len(order)])) - 1
+
+    iv_starts, iv_ends, values = [], [], []
+    prev_end = 0
+    for block_start, block_end in zip(r_starts[first], r_ends[last]):
+        for bs in range(int(block_start), int(block_end), _max_block):
+            be = min(bs + _max_block, int(block_end))
+            ivs = bw.intervals(chrom, bs, be)
+            if ivs:
+                arr = np.array(ivs, dtype=np.float64).reshape(-1, 3)
+                # intervals spanning two blocks were read with the first one
+                arr = arr[arr[:, 0] >= prev_end]
+                iv_starts.append(arr[:, 0].astype(np.int64))
+                iv_ends.append(arr[:, 1].astype(np.int64))
+                values.append(arr[:, 2])
+            prev_end = be
+    if len(iv_starts) == 0:
+        empty = np.empty(0, dtype=np.int64)
+        return (empty, empty, np.empty(0))
+    return (np.concatenate(iv_starts), np.concatenate(iv_ends),
+            np.concatenate(values))
+
+
+def _sequential_sums(values, offsets, counts):
+    """
+    Sum values[offsets[i]:offsets[i]+counts[i]] from left to right for each
+    i, i.e., in the same order (and with the same rounding) as libBigWig.
+    (numpy's own reductions use pairwise summation.)
+    """
+    order = np.argsort(-counts, kind='stable')
+    offsets = offsets[order]
+    counts = counts[order]
+    acc = np.zeros(len(counts))
+    if len(counts) == 0:
+        return acc
+    # number of segments with more than k values, for each k
+    n_active = np.searchsorted(-counts, -np.arange(counts[0]), 'left')
+    for k, n in enumerate(n_active):
+        acc[:n] += values[offsets[:n] + k]
+    sums = np.empty(len(counts))
+    sums[order] = acc
+    return sums
+
+
+def _region_stats(iv_starts, iv_ends, values, starts, ends,
+                  score_type='mean'):
+    """
+    Exact summary statistics of regions computed from sorted,
+    non-overlapping bigWig intervals. Identical to
+    pyBigWig.stats(..., exact=True). Regions without data are NaN.
+    """
+    # intervals [lo, hi) overlap each region
+    lo = np.searchsorted(iv_ends, starts, 'right')
+    hi = np.searchsorted(iv_starts, ends, 'left')
+    counts = np.maximum(hi - lo, 0)
+    scores = np.full(len(starts), np.nan)
+    has = np.flatnonzero(counts > 0)
+    if len(has) == 0:
+        return scores
+    counts = counts[has]
+    offsets = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    region = np.repeat(has, counts)
+    idx = np.repeat(lo[has] - offsets, counts) + np.arange(counts.sum())
+    vals = values[idx]
+    if score_type == 'min':
+        scores[has] = np.minimum.reduceat(vals, offsets)
+    elif score_type == 'max':
+        scores[has] = np.maximum.reduceat(vals, offsets)
+    else:
+        bases = np.minimum(iv_ends[idx], ends[region]) - \
+            np.maximum(iv_starts[idx], starts[region])
+        scores[has] = _sequential_sums(bases * vals, offsets, counts) / \
+            np.add.reduceat(bases, offsets)
+    return scores
+
+
+def bigwig_scores(bw, chroms, starts, ends, score_type='mean', exact=True):
+    """
+    Summary statistic scores of many genomic regions in a bigWig file.
+
+    With exact scores, regions are sorted by chromosome, raw intervals are
+    read once per block of nearby regions, and the scores of all regions are
+    computed with vectorized reductions. Scores are identical to those
+    returned by pyBigWig's stats(..., exact=True). Zoom-level scores (and
+    statistics other than 'mean', 'min' and 'max') are obtained region by
+    region with pyBigWig's stats().
+
+    Parameters
+    ----------
+    bw : str or pyBigWig object
+        bigWig file (local or remote), or an opened bigWig file.
+    chroms : array_like
+        Chromosome IDs of regions.
+    starts : array_like
+        Start coordinates of regions.
+    ends : array_like
+        End coordinates of regions.
+    score_type : str, optional
+        Summary statistic score type. Default: 'mean'
+    exact : bool, optional
+        If set, calculate the "exact" summary statistic scores rather than
+        "zoom-level" scores. Default: True
+
+    Returns
+    -------
+    numpy.ndarray
+        Scores in the order of input regions. Regions without data are NaN.
+    """
+    if isinstance(bw, str):
+        bw = pyBigWig.open(bw)
+    chroms = np.asarray(chroms, dtype=object)
+    starts = np.asarray(starts, dtype=np.int64)
+    ends = np.asarray(ends, dtype=np.int64)
+    scores = np.full(len(chroms), np.nan)
+    if not (exact and score_type in _batch_types):
+        for i, (chrom, start, end) in enumerate(zip(chroms, starts, ends)):
+            score = bw.stats(chrom, int(start), int(end), type=score_type,
+                             exact=exact)[0]
+            if isinstance(score, (int, float)):
+                scores[i] = score
+        return scores
+
+    # check all regions before reading, so that only the I/O thread uses
+    # the file handle afterwards
+    chrom_sizes = bw.chroms()
+    groups = []
+    for chrom in pd.unique(chroms):
+        rows = np.flatnonzero(chroms == chrom)
+        size = chrom_sizes.get(chrom)
+        valid = (starts[rows] >= 0) & (starts[rows] < ends[rows])
+        if size is not None:
+            valid &= ends[rows] <= size
+        if size is None or not valid.all():
+            # invalid regions: let pyBigWig report the error
+            i = rows[~valid][0] if size is not None else rows[0]
+            bw.stats(chrom, int(starts[i]), int(ends[i]), type=score_type,
+                     exact=exact)
+        groups.append((chrom, rows))
+
+    # read the next chromosome while the current one is reduced
+    with ThreadPoolExecutor(max_workers=1) as io:
+        pending = None
+        for k, (chrom, rows) in enumerate(groups):
+            if pending is None:
+                pending = io.submit(_fetch_intervals, bw, chrom, starts[rows],
+                                    ends[rows])
+            iv_starts, iv_ends, values = pending.result()
+            pending = None
+            if k + 1 < len(groups):
+                next_chrom, next_rows = groups[k + 1]
+                pending = io.submit(_fetch_intervals, bw, next_chrom,
+                                    starts[next_rows], ends[next_rows])
+            logging.debug("Read %d regions on %s ..." % (len(rows), chrom))
+            scores[rows] = _region_stats(iv_starts, iv_ends, values,
+                                         starts[rows], ends[rows], score_type)
+    return scores
+
+
+def _init_worker(chroms, starts, ends, score_type, exact):
+    _shared_args['args'] = (chroms, starts, ends, score_type, exact)
+
+
+def _worker_scores(bw_file):
+    chroms, starts, ends, score_type, exact = _shared_args['args']
+    return bigwig_scores(bw_file, chroms, starts, ends, score_type, exact)
+
+
+def bigwig_scores_multi(bw_files, chroms, starts, ends, score_type='mean',
+                        exact=True, threads=None):
+    """
+    Summary statistic scores of the same genomic regions in several bigWig
+    files (see `bigwig_scores`). Files are read concurrently, each by its
+    own process with its own file handle, so that the wall time of remote
+    files approaches that of the slowest file rather than the sum.
+
+    Parameters
+    ----------
+    bw_files : list
+        bigWig files (local or remote).
+    chroms, starts, ends : array_like
+        Genomic regions.
+    score_type : str, optional
+        Summary statistic score type. Default: 'mean'
+    exact : bool, optional
+        If set, calculate the "exact" summary statistic scores rather than
+        "zoom-level" scores. Default: True
+    threads : int, optional
+        Number of processes. Default: one per file.
+
+    Returns
+    -------
+    list
+        numpy arrays of scores, one per bigWig file.
+    """
+    if threads is None:
+        threads = len(bw_files)
+    threads = min(threads, len(bw_files))
+    chroms = np.asarray(chroms, dtype=object)
+    starts = np.asarray(starts, dtype=np.int64)
+    ends = np.asarray(ends, dtype=np.int64)
+    if threads <= 1:
+        return [bigwig_scores(f, chroms, starts, ends, score_type, exact)
+                for f in bw_files]
+    with ProcessPoolExecutor(
+            max_workers=threads, mp_context=pool_context(),
+            initializer=_init_worker,
+            initargs=(chroms, starts, ends, score_type, exact)) as pool:
+        return list(pool.map(_worker_scores, bw_files))
+
 
 def bigwig_corr(bed, bw1, bw2, outfile, na_label='nan', score_type='mean',
-                exact_scores=True, keep_NA=False, top_x=1.0, min_sig=0):
+                exact_scores=True, keep_NA=False, top_x=1.0, min_sig=0,
+                threads=2):
     """
     Calculate Pearson's and Spearman's correlations between two bigWig files
 
     Parameters
     ----------
-    bed : list
+    bed : list or IntervalArray
         List of genomic regions.
     bw1 : str
         Name of one bigWig file.
@@ -58,7 +296,9 @@ def bigwig_corr(bed, bw1, bw2, outfile, na_label='nan', score_type='mean',
         Genomic regions with summary statistic equal or less than this
         value will be filtered out. default: 0 (i.e., use all genomic regions
         to calculate correlation coefficients).
-
+    threads : int, optional
+        Number of processes used to read the two bigWig files concurrently.
+        default: 2
 
     Returns
     -------
@@ -84,28 +324,25 @@ def bigwig_corr(bed, bw1, bw2, outfile, na_label='nan', score_type='mean',
     # all_chroms1 = bw_1.chroms().keys()
     # all_chroms2 = bw_2.chroms().keys()
 
-    names = []
-    scores_1 = []
-    scores_2 = []
-    for (chrom, start, end) in bed:
-        region_id = chrom + ':' + str(start) + '-' + str(end)
-        score_1 = bw_1.stats(
-            chrom, start, end, type=score_type, exact=exact_scores).pop()
-        score_2 = bw_2.stats(
-            chrom, start, end, type=score_type, exact=exact_scores).pop()
-        if (isinstance(score_1, (int, float)) is False):
-            if keep_NA:
-                score_1 = np.nan
-            else:
-                continue
-        if (isinstance(score_2, (int, float)) is False):
-            if keep_NA:
-                score_2 = np.nan
-            else:
-                continue
-        names.append(region_id)
-        scores_1.append(score_1)
-        scores_2.append(score_2)
+    if isinstance(bed, IntervalArray):
+        chroms, starts, ends = bed.chroms, bed.starts, bed.ends
+    else:
+        chroms = [r[0] for r in bed]
+        starts = [r[1] for r in bed]
+        ends = [r[2] for r in bed]
+    scores_1, scores_2 = bigwig_scores_multi(
+        [bw1, bw2], chroms, starts, ends, score_type, exact=exact_scores,
+        threads=threads)
+    if not keep_NA:
+        keep = ~(np.isnan(scores_1) | np.isnan(scores_2))
+        scores_1 = scores_1[keep]
+        scores_2 = scores_2[keep]
+        if isinstance(bed, IntervalArray):
+            bed = bed[keep]
+        else:
+            bed = [r for r, k in zip(bed, keep) if k]
+    names = [chrom + ':' + str(start) + '-' + str(end)
+             for (chrom, start, end) in bed]
 
     bw1_name = os.path.basename(bw1) + '.' + score_type
     bw2_name = os.path.basename(bw2) + '.' + score_type
@@ -220,3 +220,48 @@ def npmi_value(x, y, xy, g):
         return -1
     else:
         return np.log(px*py)/np.log(pxy) - 1
+
+
+def coef_arrays(x, y, xy, g):
+    """
+    Calculate all six collocation measurements for arrays of cardinalities
+    (e.g., every pair of an all-vs-all comparison). Values are the same as
+    those returned by ov_coef, ov_jaccard, ov_sd, ov_ss, pmi_value and
+    npmi_value, including their conventions for empty sets.
+
+    Parameters
+    ----------
+    x : numpy.ndarray
+        The cardinalities of A.
+    y : numpy.ndarray
+        The cardinalities of B.
+    xy : numpy.ndarray
+        The cardinalities of A AND B.
+    g : int
+        The cardinality of background.
+
+    Returns
+    -------
+    dict
+        'C', 'J', 'SD', 'SS', 'PMI' and 'NPMI' => numpy.ndarray.
+    """
+    x, y, xy = np.broadcast_arrays(np.asarray(x, dtype=float),
+                                   np.asarray(y, dtype=float),
+                                   np.asarray(xy, dtype=float))
+    if np.any(xy > np.minimum(x, y)) or np.any(np.minimum(x, y) < 0):
+        logging.error("Invalid parameters.")
+    if g <= 0:
+        logging.error(
+            "The cardinality of background must be a postive integer.")
+    empty = (x == 0) | (y == 0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        coefs = {
+            'C': np.where(empty | (xy == 0), 0.0, xy/np.sqrt(x * y)),
+            'J': np.where(empty, 0.0, xy/(x + y - xy)),
+            'SD': np.where(empty, 0.0, 2*xy/(x + y)),
+            'SS': np.where(empty, 0.0, xy/np.minimum(x, y)),
+            'PMI': np.where(xy == 0, -np.inf,
+                            np.log(xy/g) - np.log(x/g) - np.log(y/g)),
+            'NPMI': np.where(xy == 0, -1.0,
+                             np.log((x/g) * (y/g))/np.log(xy/g) - 1)}
+    return coefs
@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+External merge sort of genomic intervals.
+
+Unsorted BED files (e.g., peaks sorted by score) of any size are sorted by
+chromosome (lexicographic, as "LC_ALL=C sort -k1,1") and then by start and
+end coordinates (numeric, as "sort -k2,2n -k3,3n") within a memory budget:
+the input is read in chunks, each chunk is sorted and spilled to a
+temporary binary file (a "run"), and the runs are then merged block by
+block.
+
+@author: m102324
+"""
+
+import os
+import re
+import shutil
+import logging
+import tempfile
+import numpy as np
+import pandas as pd
+from cobindability import ireader
+from cobindability import version
+
+
+__author__ = "Liguo Wang"
+__copyright__ = "Copyleft"
+__credits__ = []
+__license__ = "MIT"
+__version__ = version.version
+__maintainer__ = "Liguo Wang"
+__email__ = "wang.liguo@mayo.edu"
+__status__ = "Development"
+
+# record of a run file: chromosome ID (in order of first appearance), start
+# and end
+_run_dtype = np.dtype([('chrom', '<i4'), ('start', '<i8'), ('end', '<i8')])
+_default_memory = 512 * 1024**2
+
+
+def parse_size(size):
+    """
+    Convert a memory size such as 512M or 2G into bytes.
+
+    Examples
+    --------
+    >>> parse_size('512M')
+    536870912
+    >>> parse_size(1000)
+    1000
+    """
+    if isinstance(size, (int, np.integer)):
+        return int(size)
+    m = re.fullmatch(r'\s*(\d+(?:\.\d+)?)\s*([KMGT]?)B?\s*', str(size),
+                     re.IGNORECASE)
+    if m is None:
+        raise ValueError("invalid memory size: %s" % size)
+    unit = 1024**'KMGT'.find(m.group(2).upper()) * 1024 if m.group(2) else 1
+    return int(float(m.group(1)) * unit)
+
+
+def _write_runs(fname, run_dir, memory, regions=None):
+    """
+    Read fname in chunks, sort each chunk, and write it as a run file.
+    Returns (chromosome IDs, run files).
+    """
+    chrom_ids = {}
+    runs = []
+    # a parsed line takes several times its text size (pandas + arrays)
+    chunk_bytes = max(memory // 8, 1024**2)
+    for df in ireader.read_bed_chunks(fname, chunk_bytes=chunk_bytes,
+                                      regions=regions):
+        names = [str(c) for c in df['chrom'].cat.categories]
+        for c in names:
+            chrom_ids.setdefault(c, len(chrom_ids))
+        lut = np.array([chrom_ids[c] for c in names], dtype=np.int32)
+        # lexicographic rank of each chromosome of this chunk
+        rank = np.empty(len(names), dtype=np.int64)
+        rank[sorted(range(len(names)), key=names.__getitem__)] = \
+            np.arange(len(names))
+        codes = df['chrom'].cat.codes.to_numpy()
+        starts = df['start'].to_numpy(dtype=np.int64)
+        ends = df['end'].to_numpy(dtype=np.int64)
+        order = np.lexsort((ends, starts, rank[codes]))
+        run = np.empty(len(order), dtype=_run_dtype)
+        run['chrom'] = lut[codes[order]]
+        run['start'] = starts[order]
+        run['end'] = ends[order]
+        runs.append(os.path.join(run_dir, 'run%d.bin' % len(runs)))
+        run.tofile(runs[-1])
+        logging.debug("Write %d sorted intervals to %s" % (len(run),
+                                                           runs[-1]))
+    return (chrom_ids, runs)
+
+
+def _keys(block, rank):
+    """
+    Primary sort key (chromosome rank and start in one int64) and secondary
+    key (end) of run records.
+    """
+    return ((rank[block['chrom']] << 32) | block['start'], block['end'])
+
+
+def _count_le(primary, secondary, b_primary, b_secondary):
+    """
+    Number of leading (sorted) records whose key is <= the given key.
+    """
+    lo = np.searchsorted(primary, b_primary, side='left')
+    hi = np.searchsorted(primary, b_primary, side='right')
+    return lo + np.searchsorted(secondary[lo:hi], b_secondary, side='right')
+
+
+def sorted_chunks(fname, memory=_default_memory, tmp_dir=None,
+                  regions=None):
+    """
+    Read a BED, BED-like or bigBed file in sorted order (chromosome, start,
+    end) with an external merge sort. Only the first three columns are
+    read.
+
+    Parameters
+    ----------
+    fname : str
+        Name of a BED, BED-like or bigBed file. Can be regular, compressed
+        or remote.
+    memory : int or str, optional
+        Memory budget, in bytes or with a unit (e.g., '2G'). The default is
+        512 MB.
+    tmp_dir : str, optional
+        Parent directory of the temporary run files. The default is the
+        system temporary directory.
+    regions : str, list or dict, optional
+        Only sort the intervals overlapping these regions (see
+        `ireader.read_regions`). The default is None (all intervals).
+
+    Yields
+    ------
+    pandas.DataFrame
+        Consecutive sorted chunks with columns 'chrom' (categorical),
+        'start' and 'end' (int64).
+    """
+    memory = parse_size(_default_memory if memory is None else memory)
+    run_dir = tempfile.mkdtemp(prefix='cobind_sort_', dir=tmp_dir)
+    try:
+        chrom_ids, runs = _write_runs(fname, run_dir, memory, regions)
+        names = list(chrom_ids)
+        # chromosome ID => lexicographic rank
+        rank = np.empty(len(names), dtype=np.int64)
+        rank[sorted(range(len(names)), key=names.__getitem__)] = \
+            np.arange(len(names))
+        chrom_type = pd.CategoricalDtype(sorted(names))
+        logging.info("Merge %d sorted runs of \"%s\" ..." %
+                     (len(runs), fname))
+
+        files = [np.memmap(r, dtype=_run_dtype, mode='r') for r in runs]
+        pos = [0] * len(files)
+        block_rows = max(memory // (3 * _run_dtype.itemsize *
+                                    max(len(files), 1)), 1024)
+        while True:
+            blocks = []
+            bound = None
+            for i, f in enumerate(files):
+                block = np.array(f[pos[i]:pos[i] + block_rows])
+                blocks.append(block)
+                if len(block) > 0 and pos[i] + len(block) < len(f):
+                    # records after this block are > its last key
+                    last = _keys(block[-1:], rank)
+                    key = (int(last[0][0]), int(last[1][0]))
+                    if bound is None or key < bound:
+                        bound = key
+            if all(len(b) == 0 for b in blocks):
+                break
+            parts = []
+            for i, block in enumerate(blocks):
+                if bound is None:
+                    n = len(block)
+                else:
+                    primary, secondary = _keys(block, rank)
+                    n = int(_count_le(primary, secondary, *bound))
+                parts.append(block[:n])
+                pos[i] += n
+            merged = np.concatenate(parts)
+            primary, secondary = _keys(merged, rank)
+            merged = merged[np.lexsort((secondary, primary))]
+            yield pd.DataFrame({
+                'chrom': pd.Categorical.from_codes(
+                    rank[merged['chrom']], dtype=chrom_type),
+                'start': merged['start'],
+                'end': merged['end']})
+        del files
+    finally:
+        shutil.rmtree(run_dir, ignore_errors=True)
+
+
+def sort_bed(fname, outfile, memory=_default_memory, tmp_dir=None):
+    """
+    Sort a BED file by chromosome, start and end (the same order as
+    "LC_ALL=C sort -k1,1 -k2,2n -k3,3n") into a BED3 file, within a memory
+    budget. See `sorted_chunks`.
+
+    Returns
+    -------
+    int
+        Number of intervals written.
+    """
+    n = 0
+    with open(outfile, 'w') as fh:
+        for df in ireader.read_bed_chunks(fname, sort=True, memory=memory,
+                                          tmp_dir=tmp_dir):
+            df.to_csv(fh, sep="\t", header=False, index=False)
+            n += len(df)
+    return n
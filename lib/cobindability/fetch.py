@@ -0,0 +1,365 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Download manager of remote (http://, https://, ftp://) input files.
+
+A remote file is downloaded once, and all later reads of the same URL are
+served from the local copy. Files of servers accepting range requests are
+downloaded in chunks by several threads; each chunk is retried on failure,
+and an interrupted download resumes from the chunks already saved.
+
+By default, downloads are kept in a temporary directory that is removed
+when the process exits. If the cache is turned on (see `enable` and
+`bedcache`), downloads are kept in the cache directory instead, keyed by
+URL and ETag (or Last-Modified), so that unchanged files are not
+downloaded again by later runs. The least recently used downloads are
+removed when the cache exceeds its size limit.
+
+Environment variables:
+    COBIND_DOWNLOAD_DIR : keep downloads in this directory.
+    COBIND_DOWNLOAD_SIZE : size limit in bytes (default: 20 GB).
+    COBIND_DOWNLOAD_THREADS : number of download threads (default: 4).
+"""
+
+import os
+import time
+import shutil
+import hashlib
+import logging
+import tempfile
+import http.client
+import multiprocessing.util
+from urllib.parse import urlparse, unquote
+from urllib.request import Request, urlopen
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from cobindability import bedcache
+from cobindability import version
+
+__author__ = "Liguo Wang"
+__copyright__ = "Copyleft"
+__credits__ = []
+__license__ = "MIT"
+__version__ = version.version
+__maintainer__ = "Liguo Wang"
+__email__ = "wang.liguo@mayo.edu"
+__status__ = "Development"
+
+_settings = {'dir': None, 'max_bytes': 20 * 1024**3, 'threads': 4,
+             'chunk_bytes': 16 * 1024**2}
+# temporary directory and downloaded files (URL => local file) of this
+# process
+_session = {'dir': None, 'files': {}}
+# errors of a failed (e.g. truncated) transfer; http.client.IncompleteRead
+# is not an OSError
+_transfer_errors = (OSError, http.client.HTTPException)
+_retries = 3
+_timeout = 60
+_copy_bytes = 1024**2
+
+
+def is_remote(fname):
+    return fname.startswith(('http://', 'https://', 'ftp://'))
+
+
+def default_download_dir():
+    """
+    Default download directory (the "downloads" directory of the cache,
+    see `bedcache.default_cache_dir`).
+    """
+    return os.path.join(bedcache.default_cache_dir(), 'downloads')
+
+
+def enable(download_dir=None, max_bytes=None, threads=None):
+    """
+    Keep downloads across runs.
+
+    Parameters
+    ----------
+    download_dir : str, optional
+        Download directory. The default is `default_download_dir()`.
+    max_bytes : int, optional
+        Size limit of the download directory. The default is 20 GB.
+    threads : int, optional
+        Number of download threads. The default is 4.
+    """
+    _settings['dir'] = download_dir if download_dir else \
+        default_download_dir()
+    if max_bytes is not None:
+        _settings['max_bytes'] = int(max_bytes)
+    if threads is not None:
+        _settings['threads'] = max(int(threads), 1)
+
+
+def disable():
+    """
+    Keep downloads only until the process exits. Saved files are kept.
+    """
+    _settings['dir'] = None
+
+
+def _download_dir():
+    """
+    Persistent download directory, or None.
+    """
+    if _settings['dir'] is not None:
+        return _settings['dir']
+    if bedcache.is_enabled():
+        return os.path.join(bedcache.cache_dir(), 'downloads')
+    return None
+
+
+def _session_dir():
+    if _session['dir'] is None:
+        _session['dir'] = tempfile.mkdtemp(prefix='cobind_download_')
+        # unlike atexit, finalizers also run in worker processes (of a
+        # ProcessPoolExecutor), which end with os._exit; forked workers
+        # drop the finalizers of the parent, so they never remove its
+        # directory
+        multiprocessing.util.Finalize(None, shutil.rmtree,
+                                      args=(_session['dir'], True),
+                                      exitpriority=0)
+    return _session['dir']
+
+
+def _local_name(url):
+    """
+    Base name of the URL (so that the extension, e.g. ".gz", is kept).
+    """
+    name = os.path.basename(unquote(urlparse(url).path))
+    name = ''.join(c if c.isalnum() or c in '._-' else '_' for c in name)
+    return name if name.strip('.') else 'download'
+
+
+def probe(url):
+    """
+    Size and validator of a remote file (HTTP HEAD request).
+
+    Returns
+    -------
+    tuple
+        (size, validator, ranges). size is None if unknown; validator is
+        the ETag (or Last-Modified) header, or None; ranges is True if the
+        server accepts range requests.
+    """
+    if not url.startswith(('http://', 'https://')):
+        return (None, None, False)
+    try:
+        with urlopen(Request(url, method='HEAD'), timeout=_timeout) as r:
+            headers = r.headers
+    except Exception as e:
+        logging.debug("HEAD request failed (%s): %s" % (url, e))
+        return (None, None, False)
+    size = headers.get('Content-Length')
+    return (int(size) if size is not None and size.isdigit() else None,
+            headers.get('ETag') or headers.get('Last-Modified'),
+            headers.get('Accept-Ranges', '').lower() == 'bytes')
+
+
+def prefetch(fnames):
+    """
+    Download the remote files of a list in the main process before they
+    are read by worker processes, so that (forked) workers read the same
+    local copies instead of downloading every file again. bigBed files on
+    HTTP servers are skipped: they are read with range requests.
+    """
+    # imported here: ireader reads remote files with this module
+    from cobindability.ireader import is_bigbed
+    for f in fnames:
+        if type(f) is str and is_remote(f) and \
+                not (is_bigbed(f) and f.startswith(('http://', 'https://'))):
+            fetch(f)
+
+
+def cached(url):
+    """
+    Local copy of a URL downloaded by this process, or None.
+    """
+    path = _session['files'].get(url)
+    return path if path is not None and os.path.exists(path) else None
+
+
+def fetch(url, threads=None, chunk_bytes=None):
+    """
+    Download a remote file (once), and return the name of the local copy.
+
+    Parameters
+    ----------
+    url : str
+        URL (http://, https://, ftp://).
+    threads : int, optional
+        Number of download threads. The default is 4 (see `enable`).
+    chunk_bytes : int, optional
+        Size of the chunks downloaded by each range request. The default
+        is 16 MB.
+
+    Returns
+    -------
+    str
+        Name of the local file.
+
+    Raises
+    ------
+    OSError
+        If the file cannot be downloaded.
+    """
+    path = cached(url)
+    if path is not None:
+        return path
+    size, validator, ranges = probe(url)
+    directory = _download_dir()
+    if directory is not None and validator is not None:
+        key = '%s\t%s\t%s' % (url, validator, size)
+    else:
+        # cannot tell if a later download would be the same file
+        directory = _session_dir()
+        key = url
+    key = hashlib.sha1(key.encode('utf8')).hexdigest()
+    path = os.path.join(directory, key[:16] + '-' + _local_name(url))
+    if os.path.exists(path):
+        logging.debug("Use downloaded file: %s" % path)
+        try:
+            # the modification time records the last use (for eviction)
+            os.utime(path)
+        except OSError:
+            pass
+    else:
+        os.makedirs(directory, exist_ok=True)
+        logging.info("Download \"%s\" ..." % url)
+        if ranges and size:
+            _download_chunks(url, path, size,
+                             threads or _settings['threads'],
+                             chunk_bytes or _settings['chunk_bytes'])
+        else:
+            _download(url, path, size)
+    _session['files'][url] = path
+    if directory != _session['dir']:
+        evict()
+    return path
+
+
+def _download(url, path, size):
+    """
+    Download with a single request (restarted on failure).
+    """
+    part = path + '.part'
+    for attempt in range(_retries):
+        try:
+            with urlopen(url, timeout=_timeout) as r, open(part, 'wb') as fh:
+                shutil.copyfileobj(r, fh, _copy_bytes)
+            if size is not None and os.path.getsize(part) != size:
+                raise OSError("incomplete download: %d of %d bytes" %
+                              (os.path.getsize(part), size))
+            os.replace(part, path)
+            return
+        except _transfer_errors as e:
+            logging.warning("Download failed (%s), attempt %d of %d: %s" %
+                            (url, attempt + 1, _retries, e))
+            time.sleep(attempt)
+    raise OSError("cannot download %s" % url)
+
+
+def _download_chunks(url, path, size, threads, chunk_bytes):
+    """
+    Download with parallel range requests. Finished chunks are recorded in
+    a ".done" file, so that an interrupted download is resumed.
+    """
+    part = path + '.part'
+    done_file = part + '.done'
+    done = set()
+    if os.path.exists(part) and os.path.getsize(part) == size and \
+            os.path.exists(done_file):
+        with open(done_file) as fh:
+            done = set(int(l) for l in fh if l.strip().isdigit())
+    else:
+        with open(part, 'wb') as fh:
+            fh.truncate(size)
+        open(done_file, 'w').close()
+    chunks = [(offset, min(chunk_bytes, size - offset))
+              for offset in range(0, size, chunk_bytes)
+              if offset not in done]
+    logging.debug("Download %d bytes in %d chunks (%d done) with %d threads"
+                  % (size, len(chunks) + len(done), len(done), threads))
+    with ThreadPoolExecutor(max_workers=max(min(threads, len(chunks)), 1)) \
+            as pool, open(done_file, 'a') as log:
+        jobs = [pool.submit(_download_range, url, part, offset, n)
+                for offset, n in chunks]
+        for job in as_completed(jobs):
+            log.write('%d\n' % job.result())
+            log.flush()
+    os.replace(part, path)
+    os.remove(done_file)
+
+
+def _download_range(url, part, offset, size):
+    """
+    Download bytes [offset, offset + size) into the same range of part.
+    Returns offset.
+    """
+    for attempt in range(_retries):
+        try:
+            request = Request(url, headers={
+                'Range': 'bytes=%d-%d' % (offset, offset + size - 1)})
+            n = 0
+            with urlopen(request, timeout=_timeout) as r, \
+                    open(part, 'r+b') as fh:
+                if r.status != 206:
+                    raise OSError("range request not honored")
+                fh.seek(offset)
+                while True:
+                    block = r.read(min(_copy_bytes, size - n))
+                    if not block:
+                        break
+                    fh.write(block)
+                    n += len(block)
+            if n != size:
+                raise OSError("incomplete chunk: %d of %d bytes" % (n, size))
+            return offset
+        except _transfer_errors as e:
+            logging.debug("Chunk %d-%d of %s failed, attempt %d of %d: %s" %
+                          (offset, offset + size, url, attempt + 1, _retries,
+                           e))
+            time.sleep(attempt)
+    raise OSError("cannot download %s (bytes %d-%d)" %
+                  (url, offset, offset + size))
+
+
+def evict(max_bytes=None):
+    """
+    Remove the least recently used downloads until the download directory
+    is no larger than max_bytes (default: the configured size limit).
+    """
+    if max_bytes is None:
+        max_bytes = _settings['max_bytes']
+    directory = _download_dir()
+    if directory is None:
+        return
+    entries = []
+    try:
+        with os.scandir(directory) as it:
+            for entry in it:
+                if entry.is_file() and \
+                        not entry.name.endswith(('.part', '.done')):
+                    st = entry.stat()
+                    entries.append((st.st_mtime, st.st_size, entry.path))
+    except OSError:
+        return
+    total = sum(e[1] for e in entries)
+    for mtime, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        if path in _session['files'].values():
+            continue
+        logging.debug("Remove downloaded file: %s" % path)
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        total -= size
+
+
+if os.environ.get('COBIND_DOWNLOAD_DIR'):
+    enable(os.environ.get('COBIND_DOWNLOAD_DIR'))
+if os.environ.get('COBIND_DOWNLOAD_SIZE'):
+    _settings['max_bytes'] = int(os.environ['COBIND_DOWNLOAD_SIZE'])
+if os.environ.get('COBIND_DOWNLOAD_THREADS'):
+    _settings['threads'] = max(int(os.environ['COBIND_DOWNLOAD_THREADS']), 1)
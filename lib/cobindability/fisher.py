@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Vectorized Fisher's exact tests and multiple testing correction.
+
+@author: m102324
+"""
+
+import logging
+import numpy as np
+from cobindability import version
+
+
+__author__ = "Liguo Wang"
+__copyright__ = "Copyleft"
+__credits__ = []
+__license__ = "MIT"
+__version__ = version.version
+__maintainer__ = "Liguo Wang"
+__email__ = "wang.liguo@mayo.edu"
+__status__ = "Development"
+
+
+def fisher_exact_batch(tables, alternative='greater'):
+    """
+    One-sided Fisher's exact tests of many 2 x 2 tables at once.
+
+    For each table [[a, b], [c, d]], the odds ratio is a*d/(b*c), and the
+    p-value is the upper (alternative='greater') or lower ('less') tail of
+    the hypergeometric distribution of 'a' given the margins. Values are
+    the same as those returned by scipy.stats.fisher_exact. The tails are
+    also returned in log space, which do not underflow for very strong
+    associations (where the p-value is reported as 0).
+
+    Parameters
+    ----------
+    tables : array_like
+        Array of shape (n, 2, 2) (or (2, 2) for a single table) of
+        non-negative integers.
+    alternative : str, optional
+        'greater' or 'less'. The default is 'greater'.
+
+    Returns
+    -------
+    tuple
+        (odds_ratio, pvalue, log_pvalue). numpy arrays of shape (n,) (or
+        scalars for a single table). log_pvalue is the natural logarithm of
+        the p-value.
+
+    Examples
+    --------
+    >>> oddsr, p, logp = fisher_exact_batch([[8, 2], [1, 5]])
+    >>> print('%.2f %.4f' % (oddsr, p))
+    20.00 0.0245
+    """
+    # scipy.stats is slow to import, so only load it when needed
+    from scipy.stats import hypergeom
+    tables = np.asarray(tables, dtype=np.int64)
+    single = tables.ndim == 2
+    tables = tables.reshape(-1, 2, 2)
+    if np.any(tables < 0):
+        logging.error("All values in tables must be nonnegative.")
+        raise ValueError("All values in tables must be nonnegative.")
+    a = tables[:, 0, 0]
+    b = tables[:, 0, 1]
+    c = tables[:, 1, 0]
+    d = tables[:, 1, 1]
+    n = a + b + c + d
+    row1 = a + b
+    col1 = a + c
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        odds_ratio = np.where((b > 0) & (c > 0),
+                              (a * d) / np.maximum(b * c, 1), np.inf)
+    if alternative == 'greater':
+        # same formula as 'less', with the second column (as scipy does)
+        pvalue = hypergeom.cdf(b, n, row1, b + d)
+        log_pvalue = hypergeom.logcdf(b, n, row1, b + d)
+    elif alternative == 'less':
+        pvalue = hypergeom.cdf(a, n, row1, col1)
+        log_pvalue = hypergeom.logcdf(a, n, row1, col1)
+    else:
+        raise ValueError("alternative should be 'greater' or 'less'")
+    pvalue = np.clip(pvalue, 0, 1)
+    log_pvalue = np.minimum(log_pvalue, 0)
+
+    # any zero row or column sum makes the test uninformative
+    degenerate = (np.minimum(row1, c + d) == 0) | \
+        (np.minimum(col1, b + d) == 0)
+    odds_ratio = np.where(degenerate, np.nan, odds_ratio)
+    pvalue = np.where(degenerate, 1.0, pvalue)
+    log_pvalue = np.where(degenerate, 0.0, log_pvalue)
+    if single:
+        return (odds_ratio[0], pvalue[0], log_pvalue[0])
+    return (odds_ratio, pvalue, log_pvalue)
+
+
+def adjust_pvalues(pvalues, method='BH', log=False):
+    """
+    Adjust p-values for multiple testing.
+
+    Parameters
+    ----------
+    pvalues : array_like
+        P-values (or natural logarithms of p-values if log is True). NaN
+        values are ignored and kept as NaN.
+    method : str, optional
+        'BH' (Benjamini-Hochberg false discovery rate) or 'bonferroni'.
+        The default is 'BH'.
+    log : bool, optional
+        If True, input and output are natural logarithms, so that tiny
+        p-values keep their precision. The default is False.
+
+    Returns
+    -------
+    numpy.ndarray
+        Adjusted p-values (q-values), capped at 1.
+
+    Examples
+    --------
+    >>> adjust_pvalues([0.01, 0.04, 0.03, 0.5]).round(4).tolist()
+    [0.04, 0.0533, 0.0533, 0.5]
+    >>> adjust_pvalues([0.01, 0.04, 0.03, 0.5], method='bonferroni').tolist()
+    [0.04, 0.16, 0.12, 1.0]
+    """
+    values = np.asarray(pvalues, dtype=float)
+    qvalues = np.full(values.shape, np.nan)
+    ok = ~np.isnan(values)
+    m = int(ok.sum())
+    if m == 0:
+        return qvalues
+    p = values[ok]
+    if method == 'bonferroni':
+        q = p + np.log(m) if log else p * m
+    elif method in ('BH', 'fdr_bh'):
+        order = np.argsort(p, kind='stable')
+        ranks = np.arange(1, m + 1)
+        if log:
+            q_sorted = p[order] + np.log(m) - np.log(ranks)
+        else:
+            q_sorted = p[order] * m / ranks
+        # enforce monotonicity from the largest p-value downwards
+        q_sorted = np.minimum.accumulate(q_sorted[::-1])[::-1]
+        q = np.empty(m)
+        q[order] = q_sorted
+    else:
+        raise ValueError("method should be 'BH' or 'bonferroni'")
+    qvalues[ok] = np.minimum(q, 0) if log else np.minimum(q, 1)
+    return qvalues
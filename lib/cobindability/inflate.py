@@ -0,0 +1,283 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Read compressed (.gz, .bz2) files with decompression in background threads.
+
+A producer thread decompresses the file and passes large blocks of
+decompressed bytes to the reader through a bounded queue, so that
+decompression and parsing (pandas' C parser releases the GIL, and so do
+zlib and bz2) run on different cores, while memory use stays bounded.
+
+BGZF files (written by bgzip) are series of independent gzip members of
+at most 64 KB, each recording its own size in the header. Batches of
+members are decompressed in parallel by a thread pool, and returned in
+file order. Other gzip files (including multi-member ones) and bzip2 files
+are decompressed sequentially by the producer thread.
+"""
+
+import io
+import os
+import bz2
+import zlib
+import queue
+import threading
+import collections
+from concurrent.futures import ThreadPoolExecutor
+from cobindability import version
+
+__author__ = "Liguo Wang"
+__copyright__ = "Copyleft"
+__credits__ = []
+__license__ = "MIT"
+__version__ = version.version
+__maintainer__ = "Liguo Wang"
+__email__ = "wang.liguo@mayo.edu"
+__status__ = "Development"
+
+# compressed bytes read at once (also the size of a BGZF batch)
+_read_bytes = 1024**2
+# maximum size of a decompressed block (sequential decompression)
+_block_bytes = 4 * 1024**2
+# maximum number of decompressed blocks waiting to be read
+_queue_blocks = 8
+_buffer_bytes = 1024**2
+_threads = min(os.cpu_count() or 1, 4)
+_gzip_magic = b'\x1f\x8b\x08\x04'
+
+
+def open_reader(fname, threads=None):
+    """
+    Open a compressed file for reading. The file is decompressed by
+    background threads.
+
+    Parameters
+    ----------
+    fname : str
+        Name of a gzip (.gz, .z, .Z) or bzip2 (.bz, .bz2, .bzip2) file.
+    threads : int, optional
+        Number of threads decompressing BGZF files. The default is the
+        number of CPUs (at most 4). With 1, BGZF files are decompressed
+        sequentially.
+
+    Returns
+    -------
+    io.BufferedReader
+        Binary file object (supports read, readline and iteration).
+    """
+    fh = open(fname, 'rb')
+    if fname.endswith(('.bz', '.bz2', '.bzip2')):
+        blocks = _bz2_file_blocks(fh)
+    else:
+        blocks = _gzip_file_blocks(fh, threads or _threads)
+    return io.BufferedReader(ThreadedReader(blocks, fname), _buffer_bytes)
+
+
+class ThreadedReader(io.RawIOBase):
+    """
+    Read-only raw binary stream of the blocks (bytes) produced by an
+    iterator running in a background thread. At most `queue_blocks` blocks
+    are kept waiting. Exceptions raised by the iterator are raised by the
+    reader.
+    """
+
+    def __init__(self, blocks, name=None, queue_blocks=_queue_blocks):
+        super().__init__()
+        self.name = name
+        self._queue = queue.Queue(queue_blocks)
+        self._stop = threading.Event()
+        self._block = b''
+        self._pos = 0
+        self._done = False
+        self._thread = threading.Thread(target=self._produce, args=(blocks,),
+                                        daemon=True)
+        self._thread.start()
+
+    def _produce(self, blocks):
+        try:
+            for block in blocks:
+                if block and not self._put(block):
+                    return
+            item = None
+        except zlib.error as e:
+            item = OSError("invalid gzip file: %s (%s)" % (self.name, e))
+        except Exception as e:
+            item = e
+        finally:
+            if hasattr(blocks, 'close'):
+                blocks.close()
+        self._put(item)
+
+    def _put(self, item):
+        """
+        Put item into the queue, unless the reader is closed.
+        """
+        while not self._stop.is_set():
+            try:
+                self._queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _next_block(self):
+        if self._done:
+            return False
+        item = self._queue.get()
+        if item is None or isinstance(item, Exception):
+            self._done = True
+            self._block, self._pos = b'', 0
+            if item is not None:
+                raise item
+            return False
+        self._block, self._pos = item, 0
+        return True
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        while self._pos >= len(self._block):
+            if not self._next_block():
+                return 0
+        n = min(len(b), len(self._block) - self._pos)
+        b[:n] = memoryview(self._block)[self._pos:self._pos + n]
+        self._pos += n
+        return n
+
+    def readall(self):
+        blocks = [memoryview(self._block)[self._pos:]]
+        while self._next_block():
+            blocks.append(self._block)
+        self._pos = len(self._block)
+        return b''.join(blocks)
+
+    def close(self):
+        if not self.closed:
+            self._stop.set()
+            self._thread.join()
+        super().close()
+
+
+def _bz2_file_blocks(fh):
+    try:
+        with bz2.BZ2File(fh) as bh:
+            while True:
+                block = bh.read(_block_bytes)
+                if not block:
+                    break
+                yield block
+    finally:
+        fh.close()
+
+
+def _gzip_file_blocks(fh, threads):
+    try:
+        data = fh.read(_read_bytes)
+        if threads > 1 and _bgzf_size(data, 0):
+            blocks = _bgzf_blocks(fh, data, threads)
+        else:
+            blocks = _gzip_blocks(fh, data)
+        for block in blocks:
+            yield block
+    finally:
+        fh.close()
+
+
+def _gzip_blocks(fh, data=b''):
+    """
+    Decompress the gzip members read from fh (data: bytes already read).
+    As with the gzip module, members are concatenated, and zero bytes
+    between or after members are skipped.
+    """
+    d = None
+    while True:
+        if not data:
+            data = fh.read(_read_bytes)
+        if not data:
+            if d is None:
+                return
+            block = d.flush()
+            if not d.eof:
+                raise EOFError("Compressed file ended before the "
+                               "end-of-stream marker was reached")
+            yield block
+            data, d = d.unused_data, None
+            continue
+        if d is None:
+            data = data.lstrip(b'\0')
+            if not data:
+                continue
+            d = zlib.decompressobj(31)
+        yield d.decompress(data, _block_bytes)
+        if d.eof:
+            data, d = d.unused_data, None
+        else:
+            data = d.unconsumed_tail
+
+
+def _bgzf_size(data, pos):
+    """
+    Size of the BGZF block starting at data[pos]. Returns None if it is not
+    a BGZF block, or 0 if data is too short to tell.
+    """
+    if len(data) - pos < 12:
+        return 0
+    if data[pos:pos + 4] != _gzip_magic:
+        return None
+    end = pos + 12 + int.from_bytes(data[pos + 10:pos + 12], 'little')
+    if len(data) < end:
+        return 0
+    i = pos + 12
+    while i + 4 <= end:
+        n = int.from_bytes(data[i + 2:i + 4], 'little')
+        if data[i:i + 2] == b'BC' and n == 2 and i + 6 <= end:
+            return int.from_bytes(data[i + 4:i + 6], 'little') + 1
+        i += 4 + n
+    return None
+
+
+def _bgzf_blocks(fh, data, threads):
+    """
+    Decompress a BGZF file (data: bytes already read). Batches of about
+    `_read_bytes` are decompressed in parallel and yielded in order. If a
+    member is not a BGZF block, the rest is decompressed sequentially.
+    """
+    pending = collections.deque()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        while True:
+            pos = 0
+            while True:
+                size = _bgzf_size(data, pos)
+                if not size or pos + size > len(data):
+                    break
+                pos += size
+            if pos > 0:
+                pending.append(pool.submit(_inflate_members, data[:pos]))
+                data = data[pos:]
+            while len(pending) > 2 * threads:
+                yield pending.popleft().result()
+            if size is None:
+                break
+            more = fh.read(_read_bytes)
+            if not more:
+                break
+            data += more
+        while pending:
+            yield pending.popleft().result()
+    if data:
+        for block in _gzip_blocks(fh, data):
+            yield block
+
+
+def _inflate_members(data):
+    """
+    Decompress a series of complete BGZF blocks.
+    """
+    blocks = []
+    view = memoryview(data)
+    pos = 0
+    while pos < len(data):
+        size = _bgzf_size(data, pos)
+        blocks.append(zlib.decompress(view[pos:pos + size], 31, 65536))
+        pos += size
+    return b''.join(blocks)
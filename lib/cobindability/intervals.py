@@ -0,0 +1,725 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Sorted-array interval engine.
+
+Genomic intervals are stored per chromosome as a pair of sorted int64 numpy
+arrays (starts, ends). Merge, union, intersection and subtraction are done
+with vectorized sweeps over the interval boundaries, so the cost is
+O(n log n) in the number of intervals rather than proportional to the
+chromosome length.
+"""
+
+import logging
+import numpy as np
+from os.path import basename
+from cobindability import ireader, bbreader, bedcache, version
+
+__author__ = "Liguo Wang"
+__copyright__ = "Copyleft"
+__credits__ = []
+__license__ = "MIT"
+__version__ = version.version
+__maintainer__ = "Liguo Wang"
+__email__ = "wang.liguo@mayo.edu"
+__status__ = "Development"
+
+
+def read_arrays(inbed, regions=None):
+    """
+    Read genomic intervals into per-chromosome coordinate arrays. Only the
+    first three columns (chrom, start, end) are used.
+
+    Parameters
+    ----------
+    inbed : str, list or IntervalArray
+        Name of a BED file or list of genomic intervals, for example,
+        [(chr1 100 200), (chr2 150  300), (chr2 1000 1200)]
+    regions : str, list or dict, optional
+        Only keep the intervals overlapping these regions (see
+        `ireader.read_regions`). bigBed files only read the data blocks
+        covering the regions. The default is None (all intervals).
+
+    Returns
+    -------
+    dict
+        Chromosome ID => (starts, ends). Chromosomes are kept in the order
+        of their first appearance; intervals are kept in input order.
+    """
+    if regions is not None:
+        regions = ireader.read_regions(regions)
+        if type(inbed) is str and ireader.is_bigbed(inbed):
+            return dict(ireader.bbarrays(inbed, regions))
+        return restrict_arrays(read_arrays(inbed), regions)
+    coords = {}
+    if isinstance(inbed, IntervalArray):
+        return inbed.to_coords()
+    elif type(inbed) is list:
+        for i in inbed:
+            if i[0] not in coords:
+                coords[i[0]] = ([], [])
+            coords[i[0]][0].append(int(i[1]))
+            coords[i[0]][1].append(int(i[2]))
+    elif type(inbed) is str and ireader.is_bigbed(inbed):
+        return dict(ireader.bbarrays(inbed))
+    elif type(inbed) is str:
+        try:
+            return frame_to_arrays(ireader.read_bed(inbed))
+        except ValueError:
+            # parse line by line, so that the error (passed on to the user
+            # by the callers) names the invalid line
+            pass
+        for l in ireader.reader(inbed):
+            if not l or l.startswith(('browser', '#', 'track')):
+                continue
+            f = l.split()
+            try:
+                start, end = int(f[1]), int(f[2])
+            except (IndexError, ValueError):
+                raise ValueError("invalid BED line: %s" % l)
+            if end < start:
+                raise ValueError("invalid BED line: %s" % l)
+            if f[0] not in coords:
+                coords[f[0]] = ([], [])
+            coords[f[0]][0].append(start)
+            coords[f[0]][1].append(end)
+    else:
+        raise TypeError("invalid input: %s" % str(inbed))
+    return {chrom: (np.array(s, dtype=np.int64), np.array(e, dtype=np.int64))
+            for chrom, (s, e) in coords.items()}
+
+
+def restrict_arrays(coords, regions):
+    """
+    Keep the intervals overlapping the regions (see `ireader.read_regions`
+    and `bbreader.in_windows`). Chromosomes without regions are dropped.
+    """
+    regions = ireader.read_regions(regions)
+    restricted = {}
+    for chrom, (starts, ends) in coords.items():
+        if chrom not in regions:
+            continue
+        keep = bbreader.in_windows(starts, ends, *regions[chrom])
+        if keep.any():
+            restricted[chrom] = (starts[keep], ends[keep])
+    return restricted
+
+
+def frame_to_arrays(df):
+    """
+    Split the columns returned by `ireader.read_bed` into per-chromosome
+    coordinate arrays (same layout as `read_arrays`).
+
+    Raises
+    ------
+    ValueError
+        If any interval has end < start.
+    """
+    starts = df['start'].to_numpy(dtype=np.int64)
+    ends = df['end'].to_numpy(dtype=np.int64)
+    if np.any(ends < starts):
+        raise ValueError("invalid BED line (start > end)")
+    codes = df['chrom'].cat.codes.to_numpy()
+    names = df['chrom'].cat.categories
+    # chromosomes in the order of their first appearance
+    present, first = np.unique(codes, return_index=True)
+    order = np.argsort(codes, kind='stable')
+    bounds = np.searchsorted(codes[order], present, side='left')
+    bounds = np.append(bounds, len(order))
+    coords = {}
+    for i in np.argsort(first, kind='stable'):
+        idx = order[bounds[i]:bounds[i + 1]]
+        coords[str(names[present[i]])] = (starts[idx], ends[idx])
+    return coords
+
+
+def merge_intervals(starts, ends):
+    """
+    Merge overlapped or book-ended intervals of one chromosome.
+
+    Parameters
+    ----------
+    starts : numpy.ndarray
+        Start coordinates.
+    ends : numpy.ndarray
+        End coordinates.
+
+    Returns
+    -------
+    tuple
+        Sorted, disjoint (starts, ends) arrays. Empty intervals (end <=
+        start) are dropped.
+
+    Examples
+    --------
+    >>> merge_intervals(np.array([1, 3, 20, 20]), np.array([10, 15, 35, 50]))
+    (array([ 1, 20]), array([15, 50]))
+    """
+    starts = np.asarray(starts, dtype=np.int64)
+    ends = np.asarray(ends, dtype=np.int64)
+    keep = ends > starts
+    if not keep.all():
+        starts = starts[keep]
+        ends = ends[keep]
+    if len(starts) == 0:
+        return (starts, ends)
+    order = np.argsort(starts, kind='stable')
+    return merge_sorted(starts[order], ends[order])
+
+
+def merge_sorted(starts, ends):
+    """
+    Merge intervals that are already sorted by start coordinate. This is the
+    O(n) part of `merge_intervals`, used when the same sorted arrays are
+    subsampled repeatedly (e.g. bootstrap).
+    """
+    if len(starts) == 0:
+        return (starts, ends)
+    reach = np.maximum.accumulate(ends)
+    first = np.empty(len(starts), dtype=bool)
+    first[0] = True
+    np.greater(starts[1:], reach[:-1], out=first[1:])
+    idx = np.flatnonzero(first)
+    return (starts[idx], np.maximum.reduceat(ends, idx))
+
+
+def merge_arrays(coords):
+    """
+    Merge the intervals of every chromosome in a dict returned by
+    `read_arrays`.
+    """
+    merged = {}
+    for chrom, (starts, ends) in coords.items():
+        s, e = merge_intervals(starts, ends)
+        if len(s) > 0:
+            merged[chrom] = (s, e)
+    return merged
+
+
+def _sweep(starts1, ends1, starts2, ends2):
+    """
+    Sweep the boundaries of two merged (sorted, disjoint) interval sets.
+
+    Returns the sorted unique boundaries and the state of every elementary
+    segment [bounds[i], bounds[i+1]): bit 1 is set if the segment is covered
+    by set 1 and bit 2 if it is covered by set 2.
+    """
+    pos = np.concatenate((starts1, ends1, starts2, ends2))
+    delta = np.concatenate((
+        np.full(len(starts1), 1, dtype=np.int8),
+        np.full(len(ends1), -1, dtype=np.int8),
+        np.full(len(starts2), 2, dtype=np.int8),
+        np.full(len(ends2), -2, dtype=np.int8)))
+    order = np.argsort(pos, kind='stable')
+    pos = pos[order]
+    delta = delta[order]
+    bounds, idx = np.unique(pos, return_index=True)
+    state = np.cumsum(np.add.reduceat(delta, idx))
+    return (bounds, state)
+
+
+def _segments(bounds, selected):
+    """
+    Join consecutive selected elementary segments into intervals.
+    """
+    sel = selected[:-1]
+    if not sel.any():
+        empty = np.empty(0, dtype=np.int64)
+        return (empty, empty)
+    edge = np.diff(np.concatenate(([0], sel.astype(np.int8), [0])))
+    first = np.flatnonzero(edge == 1)
+    last = np.flatnonzero(edge == -1)
+    return (bounds[first], bounds[last])
+
+
+def _combine(coords1, coords2, op):
+    """
+    Apply a set operation ('and', 'or', 'not') chromosome by chromosome to
+    two dicts of merged intervals.
+    """
+    empty = np.empty(0, dtype=np.int64)
+    if op == 'and':
+        chroms = [c for c in coords1 if c in coords2]
+    elif op == 'or':
+        chroms = list(coords1) + [c for c in coords2 if c not in coords1]
+    else:
+        chroms = list(coords1)
+    results = {}
+    for chrom in chroms:
+        s1, e1 = coords1.get(chrom, (empty, empty))
+        s2, e2 = coords2.get(chrom, (empty, empty))
+        if op == 'not' and len(s2) == 0:
+            results[chrom] = (s1, e1)
+            continue
+        bounds, state = _sweep(s1, e1, s2, e2)
+        if op == 'and':
+            s, e = _segments(bounds, state == 3)
+        elif op == 'or':
+            s, e = _segments(bounds, state > 0)
+        else:
+            s, e = _segments(bounds, state == 1)
+        if len(s) > 0:
+            results[chrom] = (s, e)
+    return results
+
+
+def union_arrays(coords1, coords2):
+    """Union of two dicts of merged intervals."""
+    return _combine(coords1, coords2, 'or')
+
+
+def intersect_arrays(coords1, coords2):
+    """Intersection of two dicts of merged intervals."""
+    return _combine(coords1, coords2, 'and')
+
+
+def subtract_arrays(coords1, coords2):
+    """Subtract coords2 from coords1 (both are dicts of merged intervals)."""
+    return _combine(coords1, coords2, 'not')
+
+
+def overlap_size(coords1, coords2):
+    """
+    Number of bases shared by two dicts of merged intervals.
+    """
+    size = 0
+    for chrom in coords1:
+        if chrom not in coords2:
+            continue
+        bounds, state = _sweep(*coords1[chrom], *coords2[chrom])
+        size += int(np.diff(bounds)[state[:-1] == 3].sum())
+    return size
+
+
+def covered_before(starts, ends, points):
+    """
+    Number of bases of merged (sorted, disjoint) intervals that lie before
+    each of the given points.
+    """
+    points = np.asarray(points, dtype=np.int64)
+    if len(starts) == 0:
+        return np.zeros(len(points), dtype=np.int64)
+    cum = np.concatenate(([0], np.cumsum(ends - starts)))
+    j = np.searchsorted(starts, points, side='right')
+    last = np.maximum(j - 1, 0)
+    beyond = np.where(j > 0, ends[last] - np.minimum(points, ends[last]), 0)
+    return cum[j] - beyond
+
+
+def overlap_sorted(starts1, ends1, starts2, ends2):
+    """
+    Number of bases shared by two merged (sorted, disjoint) interval arrays,
+    computed with binary searches instead of a boundary sort.
+    """
+    if len(starts1) == 0 or len(starts2) == 0:
+        return 0
+    return int((covered_before(starts2, ends2, ends1) -
+                covered_before(starts2, ends2, starts1)).sum())
+
+
+def linearize(*coord_dicts):
+    """
+    Lay several dicts of per-chromosome intervals on one coordinate axis.
+
+    Chromosomes are concatenated end to end (using the same offsets for all
+    inputs), so that intervals on different chromosomes can never overlap
+    and every set operation becomes a single 1-D array operation.
+
+    Returns
+    -------
+    list
+        One (starts, ends) pair per input, sorted by start.
+    """
+    span = {}
+    for coords in coord_dicts:
+        for chrom, (starts, ends) in coords.items():
+            top = int(ends.max()) if len(ends) > 0 else 0
+            span[chrom] = max(span.get(chrom, 0), top)
+    offsets = {}
+    total = 0
+    for chrom in span:
+        offsets[chrom] = total
+        total += span[chrom] + 1
+    flat = []
+    for coords in coord_dicts:
+        if len(coords) == 0:
+            empty = np.empty(0, dtype=np.int64)
+            flat.append((empty, empty))
+            continue
+        starts = np.concatenate(
+            [s + offsets[c] for c, (s, e) in coords.items()])
+        ends = np.concatenate(
+            [e + offsets[c] for c, (s, e) in coords.items()])
+        order = np.argsort(starts, kind='stable')
+        flat.append((starts[order], ends[order]))
+    return flat
+
+
+def interval_count(coords):
+    """
+    Number of intervals in a dict of per-chromosome arrays.
+    """
+    return int(sum(len(s) for s, e in coords.values()))
+
+
+def genomic_size(coords):
+    """
+    Total number of bases covered by a dict of merged intervals.
+    """
+    return int(sum((e - s).sum() for s, e in coords.values()))
+
+
+def to_list(coords):
+    """
+    Convert a dict of intervals into a list of (chrom, start, end) tuples.
+    """
+    intervals = []
+    for chrom, (starts, ends) in coords.items():
+        intervals.extend(zip([chrom] * len(starts),
+                             starts.tolist(), ends.tolist()))
+    return intervals
+
+
+def merged(inbed):
+    """
+    Read and merge genomic intervals.
+
+    Parameters
+    ----------
+    inbed : str, list or IntervalArray
+        Name of a BED file or list of genomic intervals.
+
+    Returns
+    -------
+    dict
+        Chromosome ID => sorted, disjoint (starts, ends) arrays.
+    """
+    logging.debug("Merge genomic intervals: %s" %
+                  (inbed if type(inbed) is str else type(inbed).__name__))
+    if type(inbed) is str:
+        return IntervalSet.from_bed(inbed).merged
+    return merge_arrays(read_arrays(inbed))
+
+
+class IntervalSet(object):
+    """
+    Genomic intervals parsed once and kept as per-chromosome arrays.
+
+    An IntervalSet carries everything the downstream functions need from an
+    input file: interval counts, raw interval sizes, the merged (sorted,
+    disjoint) intervals and the summary statistics reported by `bed_info`.
+    Merged intervals and statistics are computed on first use and cached,
+    so a file (including a remote or compressed one) is only read once.
+
+    Parameters
+    ----------
+    coords : dict
+        Chromosome ID => (starts, ends), as returned by `read_arrays`.
+    name : str, optional
+        Name of the interval set. The default is None.
+    """
+
+    def __init__(self, coords, name=None):
+        self.coords = coords
+        self.name = name
+        self._merged = None
+        self._info = None
+
+    @classmethod
+    def from_bed(cls, inbed, name=None, regions=None):
+        """
+        Parse a BED file (or list or IntervalArray of genomic intervals)
+        into an IntervalSet.
+        If name is None, the base name of the BED file is used. If the
+        cache is enabled (see `bedcache`), parsed and merged intervals are
+        read from, or saved to, the cache. If regions is given, only the
+        intervals overlapping the regions are kept (see `read_arrays`), and
+        the cache is not used.
+        """
+        if name is None and type(inbed) is str:
+            name = basename(inbed)
+        elif name is None and isinstance(inbed, IntervalArray):
+            name = inbed.name
+        if regions is not None:
+            return cls(read_arrays(inbed, regions), name=name)
+        if type(inbed) is not str or not bedcache.is_enabled():
+            return cls(read_arrays(inbed), name=name)
+        key = bedcache.cache_key(inbed)
+        cached = bedcache.load(key) if key is not None else None
+        if cached is not None:
+            bed_set = cls(cached[0], name=name)
+            bed_set._merged = cached[1]
+            return bed_set
+        bed_set = cls(read_arrays(inbed), name=name)
+        if key is not None:
+            bedcache.save(key, bed_set.coords, bed_set.merged)
+        return bed_set
+
+    def __len__(self):
+        return self.count
+
+    @property
+    def count(self):
+        """Number of intervals."""
+        return int(sum(len(s) for s, e in self.coords.values()))
+
+    @property
+    def sizes(self):
+        """Sizes (end - start) of all intervals."""
+        if len(self.coords) == 0:
+            return np.empty(0, dtype=np.int64)
+        return np.concatenate([e - s for s, e in self.coords.values()])
+
+    @property
+    def total_size(self):
+        """Aggregated size of all intervals (overlaps counted repeatedly)."""
+        return int(self.sizes.sum())
+
+    @property
+    def merged(self):
+        """Chromosome ID => sorted, disjoint (starts, ends) arrays."""
+        if self._merged is None:
+            self._merged = merge_arrays(self.coords)
+        return self._merged
+
+    @property
+    def genomic_size(self):
+        """Number of bases covered by the intervals."""
+        return genomic_size(self.merged)
+
+    def info(self):
+        """
+        Basic statistics of the intervals. Keys are the same as those
+        returned by `BED.bed_info`.
+        """
+        if self._info is None:
+            sizes = self.sizes
+            self._info = {
+                'Name': self.name,
+                'Genomic_size': self.genomic_size,
+                'Total_size': int(sizes.sum()),
+                'Count': len(sizes),
+                'Mean_size': np.mean(sizes),
+                'Median_size': np.median(sizes),
+                'Min_size': np.min(sizes),
+                'Max_size': np.max(sizes),
+                'STD': np.std(sizes, ddof=1)}
+        return dict(self._info)
+
+    def to_list(self):
+        """
+        Convert into a list of (chrom, start, end) tuples.
+        """
+        return to_list(self.coords)
+
+    def to_array(self):
+        """
+        Convert into an IntervalArray.
+        """
+        return IntervalArray.from_coords(self.coords, name=self.name)
+
+
+def _code_dtype(n):
+    """Smallest unsigned integer type able to index n chromosomes."""
+    return np.min_scalar_type(max(n - 1, 0))
+
+
+def _coord_dtype(starts, ends):
+    """int32 if all coordinates fit, int64 otherwise."""
+    limits = np.iinfo(np.int32)
+    for a in (starts, ends):
+        if len(a) > 0 and (a.min() < limits.min or a.max() > limits.max):
+            return np.int64
+    return np.int32
+
+
+class IntervalArray(object):
+    """
+    Genomic intervals stored column-wise, in input order.
+
+    Chromosome names are kept once in a name table, and each interval is
+    stored as a chromosome code (uint8 for up to 256 chromosomes) plus a
+    start and an end coordinate (int32 when all coordinates fit, int64
+    otherwise), i.e., about 9 bytes per interval instead of ~200 bytes for
+    a (chrom, start, end) tuple in a list. An IntervalArray can be passed
+    to the functions of `BED` in place of a list of tuples; iterating over
+    it yields (chrom, start, end) tuples.
+
+    Parameters
+    ----------
+    chrom_names : list
+        Chromosome name table.
+    codes : array_like
+        Index of each interval's chromosome in chrom_names.
+    starts : array_like
+        Start coordinates.
+    ends : array_like
+        End coordinates.
+    name : str, optional
+        Name of the interval set. The default is None.
+
+    Examples
+    --------
+    >>> bed = IntervalArray.from_list([('chr1', 1, 10), ('chr2', 3, 15)])
+    >>> len(bed), bed.chrom_names, bed[1]
+    (2, ['chr1', 'chr2'], ('chr2', 3, 15))
+    """
+
+    # number of intervals converted to tuples at once when iterating
+    _block = 65536
+
+    def __init__(self, chrom_names, codes, starts, ends, name=None):
+        self.chrom_names = [str(c) for c in chrom_names]
+        starts = np.asarray(starts)
+        ends = np.asarray(ends)
+        dtype = _coord_dtype(starts, ends)
+        self.codes = np.asarray(codes).astype(
+            _code_dtype(len(self.chrom_names)), copy=False)
+        self.starts = starts.astype(dtype, copy=False)
+        self.ends = ends.astype(dtype, copy=False)
+        self.name = name
+
+    @classmethod
+    def from_list(cls, regions, name=None):
+        """
+        Convert a list of (chrom, start, end) tuples.
+        """
+        chrom_ids = {}
+        codes = [chrom_ids.setdefault(r[0], len(chrom_ids)) for r in regions]
+        starts = np.array([int(r[1]) for r in regions], dtype=np.int64)
+        ends = np.array([int(r[2]) for r in regions], dtype=np.int64)
+        return cls(list(chrom_ids), codes, starts, ends, name=name)
+
+    @classmethod
+    def from_frame(cls, df, name=None):
+        """
+        Convert the columns returned by `ireader.read_bed`.
+
+        Raises
+        ------
+        ValueError
+            If any interval has end < start.
+        """
+        starts = df['start'].to_numpy()
+        ends = df['end'].to_numpy()
+        if np.any(ends < starts):
+            raise ValueError("invalid BED line (start > end)")
+        return cls(df['chrom'].cat.categories, df['chrom'].cat.codes,
+                   starts, ends, name=name)
+
+    @classmethod
+    def from_coords(cls, coords, name=None):
+        """
+        Convert a dict of per-chromosome (starts, ends) arrays, e.g., as
+        returned by `read_arrays` or by the set operations of this module.
+        Intervals are laid out chromosome by chromosome.
+        """
+        if len(coords) == 0:
+            empty = np.empty(0, dtype=np.int64)
+            return cls([], empty, empty, empty, name=name)
+        counts = [len(s) for s, e in coords.values()]
+        codes = np.repeat(np.arange(len(coords)), counts)
+        starts = np.concatenate([s for s, e in coords.values()])
+        ends = np.concatenate([e for s, e in coords.values()])
+        return cls(list(coords), codes, starts, ends, name=name)
+
+    @classmethod
+    def from_bed(cls, inbed, name=None):
+        """
+        Read a BED, BED-like or bigBed file (or list of genomic intervals)
+        into an IntervalArray. Only the first three columns are used. If
+        name is None, the base name of the BED file is used.
+
+        Raises
+        ------
+        ValueError
+            If the file contains an invalid line.
+        """
+        if isinstance(inbed, cls):
+            return inbed
+        if type(inbed) is list:
+            return cls.from_list(inbed, name=name)
+        if type(inbed) is not str:
+            raise TypeError("invalid input: %s" % str(inbed))
+        if name is None:
+            name = basename(inbed)
+        if not ireader.is_bigbed(inbed):
+            try:
+                return cls.from_frame(ireader.read_bed(inbed), name=name)
+            except ValueError:
+                # read_arrays reports the invalid line
+                pass
+        return cls.from_coords(read_arrays(inbed), name=name)
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __iter__(self):
+        for i in range(0, len(self), self._block):
+            yield from zip(self.chroms[i:i + self._block].tolist(),
+                           self.starts[i:i + self._block].tolist(),
+                           self.ends[i:i + self._block].tolist())
+
+    def __getitem__(self, key):
+        """
+        An int returns one (chrom, start, end) tuple. A slice, an index
+        array or a boolean mask returns an IntervalArray sharing the same
+        chromosome name table.
+        """
+        if isinstance(key, (int, np.integer)):
+            return (self.chrom_names[self.codes[key]], int(self.starts[key]),
+                    int(self.ends[key]))
+        return IntervalArray(self.chrom_names, self.codes[key],
+                             self.starts[key], self.ends[key], name=self.name)
+
+    def __repr__(self):
+        return "IntervalArray(name=%r, intervals=%d, chroms=%d)" % (
+            self.name, len(self), len(self.chrom_names))
+
+    def __str__(self):
+        return self.name if self.name is not None else self.__repr__()
+
+    @property
+    def chroms(self):
+        """Chromosome name of each interval (numpy object array)."""
+        return np.array(self.chrom_names, dtype=object)[self.codes]
+
+    @property
+    def sizes(self):
+        """Sizes (end - start) of all intervals."""
+        return self.ends.astype(np.int64) - self.starts
+
+    @property
+    def total_size(self):
+        """Aggregated size of all intervals (overlaps counted repeatedly)."""
+        return int(self.sizes.sum())
+
+    @property
+    def nbytes(self):
+        """Memory used by the coordinate arrays."""
+        return self.codes.nbytes + self.starts.nbytes + self.ends.nbytes
+
+    def to_coords(self):
+        """
+        Split into per-chromosome int64 (starts, ends) arrays (same layout as
+        `read_arrays`).
+        """
+        codes = self.codes
+        # chromosomes in the order of their first appearance
+        present, first = np.unique(codes, return_index=True)
+        order = np.argsort(codes, kind='stable')
+        bounds = np.searchsorted(codes[order], present, side='left')
+        bounds = np.append(bounds, len(order))
+        coords = {}
+        for i in np.argsort(first, kind='stable'):
+            idx = order[bounds[i]:bounds[i + 1]]
+            coords[self.chrom_names[present[i]]] = (
+                self.starts[idx].astype(np.int64),
+                self.ends[idx].astype(np.int64))
+        return coords
+
+    def to_list(self):
+        """
+        Convert into a list of (chrom, start, end) tuples.
+        """
+        return list(self)
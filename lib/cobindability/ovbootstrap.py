@@ -7,13 +7,15 @@ Created on Wed Jan  5 13:06:22 2022
 """
 
 import sys
-from cobindability.BED import bed_genomic_size, bed_overlap_size
-from cobindability.BED import bed_to_list, bed_counts
-from os.path import basename
+from concurrent.futures import ProcessPoolExecutor
+from cobindability.BED import bed_overlap_size, bed_to_intervalset
+from cobindability.intervals import linearize, merge_sorted, overlap_sorted
+from cobindability.coefcal import ov_coef, ov_jaccard, ov_ss, ov_sd
+from cobindability.coefcal import pmi_value, npmi_value
+from cobindability.utils import pool_context
 import logging
 import numpy as np
 import pandas as pd
-from random import sample
 from cobindability import version
 
 
@@ -27,8 +29,188 @@ __email__ = "wang.liguo@mayo.edu"
 __status__ = "Development"
 
 
+# Sorted coordinate arrays shared with the bootstrap worker processes. They
+# are set by the pool initializer, which is inherited (not pickled) by the
+# workers when the 'fork' start method is available.
+_shared_arrays = {}
+
+
+def bootstrap_sizes(bed1, bed2, n_draws=20, fraction=0.75, seed=None,
+                    threads=1):
+    """
+    Bootstrap the genomic sizes and the overlap size of two interval sets.
+
+    In each draw, int(count * fraction) intervals are selected (without
+    replacement) from each set by an index mask. The intervals are laid on
+    one coordinate axis and sorted once, so every draw only needs an O(n)
+    merge of the selected intervals and a binary-search overlap.
+
+    Parameters
+    ----------
+    bed1 : IntervalSet
+        The 1st set of genomic intervals.
+    bed2 : IntervalSet
+        The 2nd set of genomic intervals.
+    n_draws : int, optional
+        Times of resampling. The default is 20.
+    fraction : float, optional
+        The fraction of subsample. The default is 0.75.
+    seed : int, optional
+        Seed of the random number generator. Each draw uses its own
+        generator spawned from this seed, so the results do not depend on
+        the order in which draws are computed or on the number of worker
+        processes. The default is None.
+    threads : int, optional
+        Number of worker processes. The default is 1.
+
+    Returns
+    -------
+    tuple
+        Three numpy arrays of length n_draws: genomic size of the subsample
+        of bed1, genomic size of the subsample of bed2 and their overlap
+        size.
+    """
+    (starts1, ends1), (starts2, ends2) = linearize(bed1.coords, bed2.coords)
+    seeds = np.random.SeedSequence(seed).spawn(n_draws)
+    if threads <= 1 or n_draws <= 1:
+        sizes = _draw_sizes(starts1, ends1, starts2, ends2, fraction, seeds)
+    else:
+        chunks = [list(c) for c in np.array_split(
+            np.arange(n_draws), min(n_draws, threads * 4)) if len(c) > 0]
+        logging.debug("Bootstrap with %d processes ..." % threads)
+        with ProcessPoolExecutor(
+                max_workers=threads, mp_context=pool_context(),
+                initializer=_init_worker,
+                initargs=(starts1, ends1, starts2, ends2, fraction)) as pool:
+            sizes = np.concatenate(list(pool.map(
+                _worker_draw_sizes, [[seeds[i] for i in c] for c in chunks])),
+                axis=1)
+    return (sizes[0], sizes[1], sizes[2])
+
+
+def _draw_sizes(starts1, ends1, starts2, ends2, fraction, seeds):
+    """
+    Run one bootstrap draw per seed over two sorted coordinate arrays.
+    Returns a 3 x len(seeds) array of (size1, size2, overlap).
+    """
+    sizes = np.zeros((3, len(seeds)), dtype=np.int64)
+    for i, seed in enumerate(seeds):
+        logging.debug("Bootstrap resampling %d ..." % i)
+        rng = np.random.default_rng(seed)
+        mask1 = _subsample_mask(rng, len(starts1), fraction)
+        mask2 = _subsample_mask(rng, len(starts2), fraction)
+        s1, e1 = merge_sorted(starts1[mask1], ends1[mask1])
+        s2, e2 = merge_sorted(starts2[mask2], ends2[mask2])
+        sizes[0, i] = (e1 - s1).sum()
+        sizes[1, i] = (e2 - s2).sum()
+        sizes[2, i] = overlap_sorted(s1, e1, s2, e2)
+    return sizes
+
+
+def _init_worker(starts1, ends1, starts2, ends2, fraction):
+    _shared_arrays['args'] = (starts1, ends1, starts2, ends2, fraction)
+
+
+def _worker_draw_sizes(seeds):
+    return _draw_sizes(*_shared_arrays['args'], seeds)
+
+
+def _subsample_mask(rng, n, fraction):
+    """
+    Boolean mask selecting int(n * fraction) of n items at random.
+    """
+    mask = np.zeros(n, dtype=bool)
+    mask[rng.choice(n, int(n * fraction), replace=False)] = True
+    return mask
+
+
+def _size_summary(file1, file2, name1=None, name2=None):
+    """
+    Read both inputs once and report their names, interval counts, genomic
+    sizes and overlap size. Returns (results, bed1, bed2).
+    """
+    results = {}
+
+    bed1 = bed_to_intervalset(file1)
+    bed2 = bed_to_intervalset(file2)
+    if name1 is None:
+        results['A.name'] = bed1.name
+    else:
+        results['A.name'] = name1
+    if name2 is None:
+        results['B.name'] = bed2.name
+    else:
+        results['B.name'] = name2
+
+    # calculate interval counts
+    logging.debug("Calculating bed counts ...")
+    results['A.interval_count'] = bed1.count
+    results['B.interval_count'] = bed2.count
+
+    uniqBase1 = bed1.genomic_size
+    uniqBase2 = bed2.genomic_size
+    overlapBases = bed_overlap_size(bed1, bed2)
+    results['A.size'] = uniqBase1
+    results['B.size'] = uniqBase2
+    results['A_or_B.size'] = uniqBase1 + uniqBase2 - overlapBases
+    results['A_and_B.size'] = overlapBases
+    return (results, bed1, bed2)
+
+
+def _confidence_interval(score_func, draws, size_factor, sample_bg_size):
+    """
+    Format the 95% confidence interval of score_func over bootstrap draws
+    (as returned by `bootstrap_sizes`).
+    """
+    tmp = []
+    for sample1_size, sample2_size, sample_overlapBases in zip(
+            draws[0].tolist(), draws[1].tolist(), draws[2].tolist()):
+        if size_factor != 1:
+            sample_overlapBases = sample_overlapBases * size_factor
+        tmp.append(score_func(sample1_size, sample2_size,
+                              sample_overlapBases, sample_bg_size))
+    ci_lower = np.percentile(np.array(tmp), 2.5)
+    ci_upper = np.percentile(np.array(tmp), 97.5)
+    return '[%.4f,%.4f]' % (ci_lower, ci_upper)
+
+
+def _bootstrap(file1, file2, score_func, size_factor, name1, name2, n_draws,
+               fraction, bg_size, sample_bg_size, seed, threads):
+    """
+    Shared implementation of `bootstrap_coef` and `bootstrap_npmi`.
+    sample_bg_size is the background size used to score the subsamples.
+    """
+    # calculate overall overlap coef
+    logging.info("Calculating coefficient ...")
+    results, bed1, bed2 = _size_summary(file1, file2, name1, name2)
+    uniqBase1 = results['A.size']
+    uniqBase2 = results['B.size']
+    overlapBases = results['A_and_B.size']
+    overlapBases_exp = uniqBase1*uniqBase2/bg_size
+
+    results['Coef'] = score_func(uniqBase1, uniqBase2, overlapBases, bg_size)
+    results['Coef(expected)'] = score_func(
+        uniqBase1, uniqBase2, overlapBases_exp, bg_size)
+
+    if n_draws > 0:
+        if not (fraction > 0 and fraction < 1):
+            logging.error("Fraction must be > 0 and < 1.")
+            sys.exit(0)
+        logging.debug("Bootstraping is on. Iterate %d times. " % n_draws)
+        draws = bootstrap_sizes(bed1, bed2, n_draws=n_draws,
+                                fraction=fraction, seed=seed, threads=threads)
+        results['Coef(95% CI)'] = _confidence_interval(
+            score_func, draws, size_factor, sample_bg_size)
+    else:
+        logging.info("Bootstraping is off ...")
+        results['Coef(95% CI)'] = '[NA,NA]'
+
+    return pd.Series(data=results)
+
+
 def bootstrap_coef(file1, file2, score_func, size_factor, name1=None,
-                   name2=None, n_draws=20, fraction=0.75, bg_size=1.4e9):
+                   name2=None, n_draws=20, fraction=0.75, bg_size=1.4e9,
+                   seed=None, threads=1):
     """
     Calculate the following indices:
     - Collocation coefficient,
@@ -76,6 +258,10 @@ def bootstrap_coef(file1, file2, score_func, size_factor, name1=None,
         genomic reginos will be selected).
     bg_size : int, optional
         The effective background genome size. The default is 1.4e9.
+    seed : int, optional
+        Seed of the bootstrap random number generator. The default is None.
+    threads : int, optional
+        Number of processes used for bootstrap draws. The default is 1.
 
     Note
     ----
@@ -99,75 +285,13 @@ def bootstrap_coef(file1, file2, score_func, size_factor, name1=None,
             The upper bound of 95% confidence interval of 'coef_ratio'.
 
     """
-
-    results = {}
-
-    file1_lst = bed_to_list(file1)
-    file2_lst = bed_to_list(file2)
-    if name1 is None:
-        results['A.name'] = basename(file1)
-    else:
-        results['A.name'] = name1
-    if name2 is None:
-        results['B.name'] = basename(file2)
-    else:
-        results['B.name'] = name2
-
-    # calculate interval counts
-    logging.debug("Calculating bed counts ...")
-    totalCount1, totalCount2 = bed_counts(file1, file2)
-    results['A.interval_count'] = totalCount1
-    results['B.interval_count'] = totalCount2
-
-    # calculate overall overlap coef
-    logging.info("Calculating coefficient ...")
-    (uniqBase1, uniqBase2) = bed_genomic_size(file1_lst, file2_lst)
-
-    overlapBases = bed_overlap_size(file1_lst, file2_lst)
-    overlapBases_exp = uniqBase1*uniqBase2/bg_size
-    [unionBases] = bed_genomic_size(file1_lst + file2_lst)
-
-    results['A.size'] = uniqBase1
-    results['B.size'] = uniqBase2
-    results['A_or_B.size'] = unionBases
-    results['A_and_B.size'] = overlapBases
-    results['Coef'] = score_func(uniqBase1, uniqBase2, overlapBases, bg_size)
-    results['Coef(expected)'] = score_func(
-        uniqBase1, uniqBase2, overlapBases_exp, bg_size)
-
-    if n_draws > 0:
-        if fraction > 0 and fraction < 1:
-            resample_size1 = int(totalCount1 * fraction)
-            resample_size2 = int(totalCount2 * fraction)
-        else:
-            logging.error("Fraction must be > 0 and < 1.")
-            sys.exit(0)
-        logging.debug("Bootstraping is on. Iterate %d times. " % n_draws)
-        tmp = []
-        for i in range(n_draws):
-            logging.debug("Bootstrap resampling %d ..." % i)
-            sample_1 = sample(file1_lst, resample_size1)
-            sample_2 = sample(file2_lst, resample_size2)
-
-            sample_overlapBases = bed_overlap_size(sample_1, sample_2)
-            if size_factor != 1:
-                sample_overlapBases = sample_overlapBases * size_factor
-            (sample1_size, sample2_size) = bed_genomic_size(sample_1, sample_2)
-            sample_ovcoef = score_func(
-                sample1_size, sample2_size, sample_overlapBases, bg_size)
-            tmp.append(sample_ovcoef)
-        ci_lower = np.percentile(np.array(tmp), 2.5)
-        ci_upper = np.percentile(np.array(tmp), 97.5)
-        results['Coef(95% CI)'] = '[%.4f,%.4f]' % (ci_lower, ci_upper)
-    else:
-        logging.info("Bootstraping is off ...")
-        results['Coef(95% CI)'] = '[NA,NA]'
-
-    return pd.Series(data=results)
+    return _bootstrap(file1, file2, score_func, size_factor, name1, name2,
+                      n_draws, fraction, bg_size, bg_size, seed, threads)
 
 
 def bootstrap_npmi(file1, file2, score_func, size_factor, name1=None,
-                   name2=None, n_draws=20, fraction=0.75, bg_size=1.4e9):
+                   name2=None, n_draws=20, fraction=0.75, bg_size=1.4e9,
+                   seed=None, threads=1):
     """
     Calculate the following indices:
     - Normalized pointwise mutual information.
@@ -207,6 +331,10 @@ def bootstrap_npmi(file1, file2, score_func, size_factor, name1=None,
         genomic reginos will be selected).
     bg_size : int, optional
         The effective background genome size. The default is 1.4e9.
+    seed : int, optional
+        Seed of the bootstrap random number generator. The default is None.
+    threads : int, optional
+        Number of processes used for bootstrap draws. The default is 1.
 
     Returns
     -------
@@ -224,70 +352,90 @@ def bootstrap_npmi(file1, file2, score_func, size_factor, name1=None,
         'coef_ratio_high' :
             The upper bound of 95% confidence interval of 'coef_ratio'.
     """
+    return _bootstrap(file1, file2, score_func, size_factor, name1, name2,
+                      n_draws, fraction, bg_size, bg_size*fraction, seed,
+                      threads)
 
-    results = {}
 
-    file1_lst = bed_to_list(file1)
-    file2_lst = bed_to_list(file2)
-
-    if name1 is None:
-        results['A.name'] = basename(file1)
-    else:
-        results['A.name'] = name1
-    if name2 is None:
-        results['B.name'] = basename(file2)
-    else:
-        results['B.name'] = name2
+def bootstrap_all(file1, file2, name1=None, name2=None, n_draws=20,
+                  fraction=0.75, bg_size=1.4e9, seed=None, threads=1):
+    """
+    Calculate all six collocation measurements (C, J, SD, SS, PMI and NPMI)
+    and their bootstrap confidence intervals in one pass.
 
-    # calculate interval counts
-    logging.debug("Calculating bed counts ...")
-    totalCount1, totalCount2 = bed_counts(file1, file2)
-    results['A.interval_count'] = totalCount1
-    results['B.interval_count'] = totalCount2
+    The genomic sizes (|A|, |B|, |A and B|) are computed once and the same
+    bootstrap draws are shared by all six measurements. Each measurement
+    (and its confidence interval) is identical to that reported by the
+    corresponding sub-command (overlap, jaccard, dice, simpson, pmi, npmi)
+    run with the same seed.
 
-    # calculate overall overlap coef
-    logging.info("Calculating coefficient ...")
-    (uniqBase1, uniqBase2) = bed_genomic_size(file1_lst, file2_lst)
+    Parameters
+    ----------
+    file1 : str or IntervalSet
+        The 1st set of genomic regions (BED, BED-like or bigBed file).
+    file2 : str or IntervalSet
+        The 2nd set of genomic regions (BED, BED-like or bigBed file).
+    name1 : str, optional
+        Name to represent the 1st set of genomic intervals.
+    name2 : str, optional
+        Name to represent the 2nd set of genomic intervals.
+    n_draws : int, optional
+        Times of resampling. Set to '0' to turn off bootstraping. The
+        default is 20.
+    fraction : float, optional
+        The fraction of subsample. The default is 0.75.
+    bg_size : int, optional
+        The effective background genome size. The default is 1.4e9.
+    seed : int, optional
+        Seed of the bootstrap random number generator. The default is None.
+    threads : int, optional
+        Number of processes used for bootstrap draws. The default is 1.
 
-    overlapBases = bed_overlap_size(file1_lst, file2_lst)
-    overlapBases_exp = uniqBase1*uniqBase2/bg_size
-    [unionBases] = bed_genomic_size(file1_lst + file2_lst)
+    Returns
+    -------
+    pandas.Series
+        Names, interval counts and sizes of the two inputs, followed by
+        'C', 'J', 'SD', 'SS', 'PMI', 'NPMI' (the column names expected by
+        `utils.cal_zscores`) and their 95% confidence intervals
+        ('C(95% CI)', ...).
+    """
+    logging.info("Calculating coefficients ...")
+    results, bed1, bed2 = _size_summary(file1, file2, name1, name2)
+    uniqBase1 = results['A.size']
+    uniqBase2 = results['B.size']
+    overlapBases = results['A_and_B.size']
 
-    results['A.size'] = uniqBase1
-    results['B.size'] = uniqBase2
-    results['A_or_B.size'] = unionBases
-    results['A_and_B.size'] = overlapBases
-    results['Coef'] = score_func(uniqBase1, uniqBase2, overlapBases, bg_size)
-    results['Coef(expected)'] = score_func(
-        uniqBase1, uniqBase2, overlapBases_exp, bg_size)
+    for label, score_func, size_factor, sample_bg_size in _all_coefs(
+            fraction, bg_size):
+        results[label] = score_func(
+            uniqBase1, uniqBase2, overlapBases, bg_size)
 
     if n_draws > 0:
-        if fraction > 0 and fraction < 1:
-            resample_size1 = int(totalCount1 * fraction)
-            resample_size2 = int(totalCount2 * fraction)
-        else:
+        if not (fraction > 0 and fraction < 1):
             logging.error("Fraction must be > 0 and < 1.")
             sys.exit(0)
         logging.debug("Bootstraping is on. Iterate %d times. " % n_draws)
-        tmp = []
-        for i in range(n_draws):
-            logging.debug("Bootstrap resampling %d ..." % i)
-            sample_1 = sample(file1_lst, resample_size1)
-            sample_2 = sample(file2_lst, resample_size2)
-
-            sample_overlapBases = bed_overlap_size(sample_1, sample_2)
-            if size_factor != 1:
-                sample_overlapBases = sample_overlapBases * size_factor
-            (sample1_size, sample2_size) = bed_genomic_size(sample_1, sample_2)
-            sample_ovcoef = score_func(
-                sample1_size, sample2_size,
-                sample_overlapBases, bg_size*fraction)
-            tmp.append(sample_ovcoef)
-        ci_lower = np.percentile(np.array(tmp), 2.5)
-        ci_upper = np.percentile(np.array(tmp), 97.5)
-        results['Coef(95% CI)'] = '[%.4f,%.4f]' % (ci_lower, ci_upper)
-    else:
-        logging.info("Bootstraping is off ...")
-        results['Coef(95% CI)'] = '[NA,NA]'
+        draws = bootstrap_sizes(bed1, bed2, n_draws=n_draws,
+                                fraction=fraction, seed=seed, threads=threads)
+    for label, score_func, size_factor, sample_bg_size in _all_coefs(
+            fraction, bg_size):
+        if n_draws > 0:
+            results[label + '(95% CI)'] = _confidence_interval(
+                score_func, draws, size_factor, sample_bg_size)
+        else:
+            results[label + '(95% CI)'] = '[NA,NA]'
+    return pd.Series(data=results, name=results['B.name'])
 
-    return pd.Series(data=results)
+
+def _all_coefs(fraction, bg_size):
+    """
+    (label, score function, size factor, subsample background size) of the
+    six measurements, matching the settings used by the sub-commands.
+    """
+    return [
+        ('C', ov_coef, 1/fraction, bg_size),
+        ('J', ov_jaccard, 1/fraction, bg_size),
+        ('SD', ov_sd, 1/fraction, bg_size),
+        ('SS', ov_ss, 1/fraction, bg_size),
+        ('PMI', pmi_value, 1, bg_size),
+        ('NPMI', npmi_value, 1/fraction, bg_size*fraction)]
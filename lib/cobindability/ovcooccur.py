@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Co-occurrence of many sets of genomic regions in one shared background.
+
+@author: m102324
+"""
+
+import logging
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from cobindability.BED import bed_to_intervalset, cooccur_flags
+from cobindability.BED import unique_names
+from cobindability.intervals import interval_count
+from cobindability.fisher import fisher_exact_batch, adjust_pvalues
+from cobindability.utils import pool_context
+from cobindability import fetch, version
+
+
+__author__ = "Liguo Wang"
+__copyright__ = "Copyleft"
+__credits__ = []
+__license__ = "MIT"
+__version__ = version.version
+__maintainer__ = "Liguo Wang"
+__email__ = "wang.liguo@mayo.edu"
+__status__ = "Development"
+
+# number of set bits of every byte value
+_popcount_table = np.array([bin(i).count('1') for i in range(256)],
+                           dtype=np.int64)
+_shared_args = {}
+
+
+def popcount(packed, axis=-1):
+    """
+    Number of set bits in arrays of packed bits (uint8), summed over axis.
+    """
+    return _popcount_table[packed].sum(axis=axis)
+
+
+def _init_worker(background, n_cut, p_cut):
+    _shared_args['args'] = (background, n_cut, p_cut)
+
+
+def _worker_membership(bedfile):
+    background, n_cut, p_cut = _shared_args['args']
+    return _membership(bedfile, background, n_cut, p_cut)
+
+
+def _membership(bedfile, background, n_cut, p_cut):
+    """
+    Read one peak file. Returns (name, count, packed flags).
+    """
+    logging.info("Read and union BED file: \"%s\"" % bedfile)
+    bed_set = bed_to_intervalset(bedfile)
+    flags = cooccur_flags(background, bed_set.merged, n_cut, p_cut)
+    return (bed_set.name, interval_count(bed_set.merged), np.packbits(flags))
+
+
+def membership_bits(bed_files, inbed_bg, n_cut=1, p_cut=0.0, threads=1):
+    """
+    Build a packed bit vector over the background regions for each peak
+    file. Bit k of file i is set if background region k is occupied by file
+    i (see `BED.cooccur_flags`). The background is read and merged once.
+
+    Parameters
+    ----------
+    bed_files : list
+        BED files of peak sets.
+    inbed_bg : str
+        Background BED file (e.g., all promoters, all enhancers).
+    n_cut : int, optional
+        Threshold of overlap size. The default is 1.
+    p_cut : float, optional
+        Threshold of overlap percentage. The default is 0.0.
+    threads : int, optional
+        Number of processes used to read peak files. The default is 1.
+
+    Returns
+    -------
+    tuple
+        (names, counts, bits, n_bg). bits is an N x ceil(n_bg/8) uint8
+        array; n_bg is the number of (merged) background regions.
+    """
+    logging.info("Read and union background BED file: \"%s\"" % inbed_bg)
+    background = bed_to_intervalset(inbed_bg).merged
+    n_bg = interval_count(background)
+    if threads <= 1 or len(bed_files) <= 1:
+        members = [_membership(f, background, n_cut, p_cut)
+                   for f in bed_files]
+    else:
+        # download remote files once, in this process (see `fetch.prefetch`)
+        fetch.prefetch(bed_files)
+        with ProcessPoolExecutor(
+                max_workers=threads, mp_context=pool_context(),
+                initializer=_init_worker,
+                initargs=(background, n_cut, p_cut)) as pool:
+            members = list(pool.map(_worker_membership, bed_files))
+    names = [m[0] for m in members]
+    counts = [m[1] for m in members]
+    bits = np.vstack([m[2] for m in members]) if members else \
+        np.zeros((0, (n_bg + 7) // 8), dtype=np.uint8)
+    return (names, counts, bits, n_bg)
+
+
+def pair_tables(bits, n_bg):
+    """
+    Derive the 2 x 2 contingency table of every pair of peak sets from
+    their packed bit vectors (bitwise AND + popcount).
+
+    Returns
+    -------
+    tuple
+        (idx1, idx2, a_only, b_only, both, neither). Each is an int64 array
+        with one element per pair (i < j).
+    """
+    totals = popcount(bits)
+    idx1, idx2, both = [], [], []
+    for i in range(len(bits) - 1):
+        idx1.append(np.full(len(bits) - i - 1, i))
+        idx2.append(np.arange(i + 1, len(bits)))
+        both.append(popcount(bits[i] & bits[i + 1:]))
+    if len(idx1) == 0:
+        empty = np.empty(0, dtype=np.int64)
+        return (empty, empty, empty, empty, empty, empty)
+    idx1 = np.concatenate(idx1)
+    idx2 = np.concatenate(idx2)
+    both = np.concatenate(both)
+    a_only = totals[idx1] - both
+    b_only = totals[idx2] - both
+    neither = n_bg - a_only - b_only - both
+    return (idx1, idx2, a_only, b_only, both, neither)
+
+
+def cooccur_batch(bed_files, inbed_bg, n_cut=1, p_cut=0.0, threads=1):
+    """
+    Evaluate the co-occurrence of every pair of peak sets in the same
+    background regions, using Fisher's exact test (one-sided, 'greater').
+    Counts and p-values are the same as those reported by
+    `BED.cooccur_peak` for each pair. P-values are adjusted for all pairs
+    (Benjamini-Hochberg and Bonferroni) in log space.
+
+    Parameters
+    ----------
+    bed_files : list
+        BED files of peak sets.
+    inbed_bg : str
+        Background BED file (e.g., all promoters, all enhancers).
+    n_cut : int, optional
+        Threshold of overlap size. The default is 1.
+    p_cut : float, optional
+        Threshold of overlap percentage. The default is 0.0.
+    threads : int, optional
+        Number of processes used to read peak files. The default is 1.
+
+    Returns
+    -------
+    pandas.DataFrame
+        One row per pair, indexed by the positions (in bed_files) of the
+        two peak sets. Peak sets are named by `BED.unique_names`.
+    """
+    names, counts, bits, n_bg = membership_bits(
+        bed_files, inbed_bg, n_cut=n_cut, p_cut=p_cut, threads=threads)
+    logging.info("Compare %d pairs ..." % (len(names) * (len(names) - 1) // 2))
+    idx1, idx2, a_only, b_only, both, neither = pair_tables(bits, n_bg)
+
+    # the same table as cooccur_peak: [[neither, a_only], [b_only, both]]
+    tables = np.stack([neither, a_only, b_only, both],
+                      axis=1).reshape(-1, 2, 2)
+    odds, pvalues, log_p = fisher_exact_batch(tables, alternative='greater')
+
+    names = np.array(unique_names(bed_files), dtype=object)
+    counts = np.array(counts, dtype=np.int64)
+    return pd.DataFrame({
+        'A.name': names[idx1],
+        'B.name': names[idx2],
+        'A.count': counts[idx1],
+        'B.count': counts[idx2],
+        'G.count': n_bg,
+        'A+,B-': a_only,
+        'A-,B+': b_only,
+        'A+,B+': both,
+        'A-,B-': neither,
+        'odds-ratio': odds,
+        'p-value': pvalues,
+        'log10(p-value)': log_p / np.log(10),
+        'q-value(BH)': np.exp(adjust_pvalues(log_p, 'BH', log=True)),
+        'q-value(Bonferroni)': np.exp(
+            adjust_pvalues(log_p, 'bonferroni', log=True))},
+        index=pd.MultiIndex.from_arrays([idx1, idx2], names=['A', 'B']))
+
+
+def pair_matrices(results, names=None):
+    """
+    Reshape the pairwise results of `cooccur_batch` into symmetric N x N
+    matrices (odds ratios, p-values, log10 p-values and q-values), which
+    can be saved with `ovmatrix.write_matrix`. Diagonals are NaN.
+
+    Parameters
+    ----------
+    results : pandas.DataFrame
+        Returned by `cooccur_batch`. Rows and columns are placed by the
+        positions in its index, so names do not need to be unique.
+    names : list, optional
+        Names of the peak sets, in the order of the input files. The
+        default is taken from results.
+
+    Returns
+    -------
+    tuple
+        (names, counts, matrices). counts is the number of (merged) regions
+        of each peak set; matrices is a dict of N x N numpy arrays.
+    """
+    idx1 = results.index.get_level_values(0).to_numpy()
+    idx2 = results.index.get_level_values(1).to_numpy()
+    if names is None:
+        labels = dict(zip(idx1, results['A.name']))
+        labels.update(zip(idx2, results['B.name']))
+        names = [labels[i] for i in range(len(labels))]
+    counts = np.zeros(len(names), dtype=np.int64)
+    counts[idx1] = results['A.count'].to_numpy()
+    counts[idx2] = results['B.count'].to_numpy()
+    matrices = {}
+    for key, column in (('odds_ratio', 'odds-ratio'),
+                        ('pvalue', 'p-value'),
+                        ('log10_pvalue', 'log10(p-value)'),
+                        ('qvalue_BH', 'q-value(BH)'),
+                        ('qvalue_bonferroni', 'q-value(Bonferroni)')):
+        mat = np.full((len(names), len(names)), np.nan)
+        mat[idx1, idx2] = results[column].to_numpy()
+        mat[idx2, idx1] = results[column].to_numpy()
+        matrices[key] = mat
+    return (names, counts, matrices)
@@ -0,0 +1,311 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Covariation (correlation) of many bigWig tracks over shared genomic regions.
+
+@author: m102324
+"""
+
+import os
+import logging
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from scipy.stats import rankdata, kendalltau
+from scipy.stats import beta as beta_dist
+from scipy.stats import t as t_dist
+from cobindability.bw import bigwig_scores
+from cobindability.intervals import IntervalArray
+from cobindability.utils import pool_context
+from cobindability import version
+
+
+__author__ = "Liguo Wang"
+__copyright__ = "Copyleft"
+__credits__ = []
+__license__ = "MIT"
+__version__ = version.version
+__maintainer__ = "Liguo Wang"
+__email__ = "wang.liguo@mayo.edu"
+__status__ = "Development"
+
+# number of regions (rows) processed at once when accumulating products
+_chunk_rows = 100000
+_shared_args = {}
+
+
+def _init_worker(*args):
+    _shared_args['args'] = args
+
+
+def _worker_column(column):
+    chroms, starts, ends, score_type, exact, bw_files, outfile = \
+        _shared_args['args']
+    _fill_column(column, bw_files[column], chroms, starts, ends, score_type,
+                 exact, outfile)
+
+
+def _fill_column(column, bw_file, chroms, starts, ends, score_type, exact,
+                 outfile):
+    logging.info("Reading \"%s\" ..." % bw_file)
+    scores = bigwig_scores(bw_file, chroms, starts, ends, score_type, exact)
+    mat = np.load(outfile, mmap_mode='r+')
+    mat[:, column] = scores
+    mat.flush()
+
+
+def signal_matrix(bed, bw_files, outfile, score_type='mean', exact=True,
+                  threads=1):
+    """
+    Extract the region-by-track signal matrix of many bigWig files.
+
+    Each bigWig file is read once (see `bw.bigwig_scores`), and its scores
+    are written into one column of a float32 numpy array saved as a ".npy"
+    file. The array is stored in Fortran (column-major) order, so that the
+    scores of each track are contiguous on disk.
+
+    Parameters
+    ----------
+    bed : list or IntervalArray
+        List of genomic regions (chrom, start, end).
+    bw_files : list
+        bigWig files (local or remote).
+    outfile : str
+        Output ".npy" file.
+    score_type : str, optional
+        Summary statistic score type ('min','mean' or 'max') of a genomic
+        region. Default: 'mean'
+    exact : bool, optional
+        If set, calculate the "exact" summary statistic scores rather than
+        "zoom-level" scores. Default: True
+    threads : int, optional
+        Number of processes used to read bigWig files. Default: 1
+
+    Returns
+    -------
+    numpy.memmap
+        Read-only, memory-mapped array of shape (regions, tracks). Missing
+        scores are NaN.
+    """
+    if isinstance(bed, IntervalArray):
+        chroms, starts, ends = bed.chroms, bed.starts, bed.ends
+    else:
+        chroms = np.array([r[0] for r in bed], dtype=object)
+        starts = np.array([r[1] for r in bed], dtype=np.int64)
+        ends = np.array([r[2] for r in bed], dtype=np.int64)
+    mat = np.lib.format.open_memmap(
+        outfile, mode='w+', dtype=np.float32,
+        shape=(len(bed), len(bw_files)), fortran_order=True)
+    mat[:] = np.nan
+    mat.flush()
+    del mat
+
+    if threads <= 1 or len(bw_files) <= 1:
+        for column, bw_file in enumerate(bw_files):
+            _fill_column(column, bw_file, chroms, starts, ends, score_type,
+                         exact, outfile)
+    else:
+        with ProcessPoolExecutor(
+                max_workers=threads, mp_context=pool_context(),
+                initializer=_init_worker,
+                initargs=(chroms, starts, ends, score_type, exact, bw_files,
+                          outfile)) as pool:
+            list(pool.map(_worker_column, range(len(bw_files))))
+    return np.load(outfile, mmap_mode='r')
+
+
+def select_regions(mat, top_x=1.0, min_sig=0):
+    """
+    Select the regions used to calculate correlations, with the same
+    filters as `bw.bigwig_corr`: regions whose score is missing or equal or
+    less than min_sig in any track are removed, and then the top regions
+    (ranked by the mean log2 score of all tracks) are kept.
+
+    Parameters
+    ----------
+    mat : numpy.ndarray
+        Signal matrix of shape (regions, tracks).
+    top_x : float, optional
+        Percentage ( if top_x in (0,1]) or number (if top_x > 1) of genomic
+        regions to keep. default: 1.0
+    min_sig : float, optional
+        Minimum score. default: 0
+
+    Returns
+    -------
+    numpy.ndarray
+        Row numbers of the selected regions (sorted).
+    """
+    keep = np.ones(mat.shape[0], dtype=bool)
+    for j in range(mat.shape[1]):
+        # comparisons with NaN are False
+        keep &= np.asarray(mat[:, j]) > min_sig
+    rows = np.flatnonzero(keep)
+    if top_x > 0 and top_x <= 1:
+        top_n = int(len(rows) * top_x)
+    elif top_x > 1:
+        top_n = int(top_x)
+    else:
+        top_n = len(rows)
+    if top_n < len(rows):
+        means = np.zeros(len(rows))
+        for j in range(mat.shape[1]):
+            means += np.log2(np.asarray(mat[rows, j], dtype=np.float64))
+        order = np.argsort(-means, kind='stable')[:top_n]
+        rows = np.sort(rows[order])
+    logging.info("Select %d regions ..." % len(rows))
+    return rows
+
+
+def _corr_matrix(mat, transform=None):
+    """
+    Pearson correlation matrix of the columns of mat, accumulated in
+    float64 over chunks of rows (two passes: means, then centered
+    products).
+    """
+    n, k = mat.shape
+    sums = np.zeros(k)
+    for i in range(0, n, _chunk_rows):
+        chunk = np.asarray(mat[i:i + _chunk_rows], dtype=np.float64)
+        if transform is not None:
+            chunk = transform(chunk)
+        sums += chunk.sum(axis=0)
+    means = sums / n
+    prods = np.zeros((k, k))
+    for i in range(0, n, _chunk_rows):
+        chunk = np.asarray(mat[i:i + _chunk_rows], dtype=np.float64)
+        if transform is not None:
+            chunk = transform(chunk)
+        chunk -= means
+        prods += chunk.T @ chunk
+    with np.errstate(divide='ignore', invalid='ignore'):
+        norms = np.sqrt(np.diag(prods))
+        r = prods / np.outer(norms, norms)
+    r = np.clip(r, -1, 1)
+    np.fill_diagonal(r, np.where(norms > 0, 1.0, np.nan))
+    return r
+
+
+def _pearson_pvalues(r, n):
+    # two-sided, the same null distribution as scipy.stats.pearsonr
+    if n <= 2:
+        return np.full(r.shape, np.nan)
+    ab = n / 2 - 1
+    return 2 * beta_dist.sf(np.abs(r), ab, ab, loc=-1, scale=2)
+
+
+def _spearman_pvalues(rho, n):
+    # two-sided t-test, as scipy.stats.spearmanr
+    if n <= 2:
+        return np.full(rho.shape, np.nan)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t = rho * np.sqrt((n - 2) / ((rho + 1.0) * (1.0 - rho)))
+    return 2 * t_dist.sf(np.abs(t), n - 2)
+
+
+def _worker_kendall(pair):
+    ranks = _shared_args['args'][0]
+    i, j = pair
+    return kendalltau(ranks[:, i], ranks[:, j])
+
+
+def signal_corr(mat, top_x=1.0, min_sig=0,
+                methods=('pearson', 'spearman', 'kendall'), threads=1):
+    """
+    Calculate Pearson's, Spearman's and Kendall's correlation matrices of
+    the log2 scores of all tracks.
+
+    Regions are filtered by `select_regions`. Spearman's correlations are
+    Pearson's correlations of ranks (ties are averaged), which are obtained
+    once per track. Kendall's tau (tau-b) is calculated pair by pair.
+
+    Parameters
+    ----------
+    mat : numpy.ndarray
+        Signal matrix of shape (regions, tracks), e.g., returned by
+        `signal_matrix`.
+    top_x : float, optional
+        See `select_regions`. default: 1.0
+    min_sig : float, optional
+        See `select_regions`. default: 0
+    methods : tuple, optional
+        Any of 'pearson', 'spearman' and 'kendall'. default: all three.
+    threads : int, optional
+        Number of processes used to calculate Kendall's tau. Default: 1
+
+    Returns
+    -------
+    tuple
+        (n_regions, matrices). matrices is a dict of N x N numpy arrays
+        (e.g., 'pearson' and 'pearson_p' for correlations and p-values).
+    """
+    rows = select_regions(mat, top_x=top_x, min_sig=min_sig)
+    n = len(rows)
+    k = mat.shape[1]
+    matrices = {}
+    if 'pearson' in methods:
+        logging.info("Calculate Pearson's correlations ...")
+        selected = np.asarray(mat[rows], dtype=np.float32)
+        matrices['pearson'] = _corr_matrix(selected, np.log2)
+        matrices['pearson_p'] = _pearson_pvalues(matrices['pearson'], n)
+        del selected
+    if 'spearman' in methods or 'kendall' in methods:
+        # average ranks up to 2^24 are exact in float32
+        ranks = np.empty((n, k), dtype=np.float32, order='F')
+        for j in range(k):
+            ranks[:, j] = rankdata(np.asarray(mat[rows, j]))
+    if 'spearman' in methods:
+        logging.info("Calculate Spearman's correlations ...")
+        matrices['spearman'] = _corr_matrix(ranks)
+        matrices['spearman_p'] = _spearman_pvalues(matrices['spearman'], n)
+    if 'kendall' in methods:
+        logging.info("Calculate Kendall's correlations ...")
+        pairs = [(i, j) for i in range(k) for j in range(i + 1, k)]
+        if threads <= 1 or len(pairs) <= 1:
+            _init_worker(ranks)
+            results = [_worker_kendall(p) for p in pairs]
+        else:
+            with ProcessPoolExecutor(
+                    max_workers=threads, mp_context=pool_context(),
+                    initializer=_init_worker, initargs=(ranks,)) as pool:
+                results = list(pool.map(_worker_kendall, pairs,
+                                         chunksize=max(1, len(pairs) //
+                                                       (threads * 4))))
+        tau = np.eye(k)
+        tau_p = np.zeros((k, k))
+        for (i, j), (t, p) in zip(pairs, results):
+            tau[i, j] = tau[j, i] = t
+            tau_p[i, j] = tau_p[j, i] = p
+        matrices['kendall'] = tau
+        matrices['kendall_p'] = tau_p
+    return (n, matrices)
+
+
+def covary_matrix(bed, bw_files, outfile_prefix, score_type='mean',
+                  exact=True, top_x=1.0, min_sig=0,
+                  methods=('pearson', 'spearman', 'kendall'), threads=1):
+    """
+    Extract the signal matrix of many bigWig files over the same genomic
+    regions (saved as "prefix_signal.npy", with regions saved in
+    "prefix_regions.bed"), then calculate the correlation matrices between
+    tracks.
+
+    Returns
+    -------
+    tuple
+        (names, counts, n_regions, matrices). counts is the number of
+        regions with scores > min_sig in each track; n_regions is the number
+        of regions used to calculate correlations.
+    """
+    names = [os.path.basename(f) + '.' + score_type for f in bw_files]
+    region_file = outfile_prefix + '_regions.bed'
+    logging.info("Save regions to: \"%s\"" % region_file)
+    with open(region_file, 'w') as fh:
+        for (chrom, start, end) in bed:
+            fh.write('%s\t%d\t%d\n' % (chrom, start, end))
+    mat = signal_matrix(bed, bw_files, outfile_prefix + '_signal.npy',
+                        score_type=score_type, exact=exact, threads=threads)
+    counts = np.array([np.count_nonzero(np.asarray(mat[:, j]) > min_sig)
+                       for j in range(mat.shape[1])], dtype=np.int64)
+    n, matrices = signal_corr(mat, top_x=top_x, min_sig=min_sig,
+                              methods=methods, threads=threads)
+    return (names, counts, n, matrices)
@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Prebuilt on-disk index of a collection (library) of BED files, and
+one-vs-many queries against it.
+
+@author: m102324
+"""
+
+import os
+import sys
+import logging
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from cobindability.BED import bed_to_intervalset, bed_info, unique_names
+from cobindability.intervals import covered_before
+from cobindability.coefcal import coef_arrays
+from cobindability.utils import pool_context
+from cobindability import fetch, version
+
+
+__author__ = "Liguo Wang"
+__copyright__ = "Copyleft"
+__credits__ = []
+__license__ = "MIT"
+__version__ = version.version
+__maintainer__ = "Liguo Wang"
+__email__ = "wang.liguo@mayo.edu"
+__status__ = "Development"
+
+# statistics of each library member saved in "members.tsv"
+_member_fields = ['Name', 'Path', 'Count', 'Total_size', 'Mean_size',
+                  'Median_size', 'Min_size', 'Max_size', 'STD',
+                  'Genomic_size']
+
+
+def _read_member(bedfile):
+    """
+    Read and merge one library file. Returns (info, merged).
+    """
+    bed_set = bed_to_intervalset(bedfile)
+    info = bed_info(bed_set)
+    info['Path'] = bedfile
+    return (info, bed_set.merged)
+
+
+def build_index(bed_files, index_dir, threads=1):
+    """
+    Build an on-disk index of a collection of BED files.
+
+    Each file is read and merged (the same merge used by `BED.union_bed3`)
+    once. The merged intervals of all files are stored chromosome by
+    chromosome in three numpy arrays (starts, ends and member IDs) that are
+    memory-mapped by `query_index`, so the library is never parsed again.
+
+    The index directory contains:
+        members.tsv : name (see `BED.unique_names`), path and interval
+            statistics of each member.
+        chroms.tsv : chromosome ID, first row and number of rows.
+        starts.npy, ends.npy : int64 coordinates of merged intervals.
+        member_ids.npy : int32 row number (in members.tsv) of each interval.
+
+    Parameters
+    ----------
+    bed_files : list
+        BED files of the library.
+    index_dir : str
+        Output directory. Created if it does not exist.
+    threads : int, optional
+        Number of processes used to read the library. The default is 1.
+
+    Returns
+    -------
+    pandas.DataFrame
+        The content of members.tsv.
+    """
+    if threads <= 1:
+        members = map(_read_member, bed_files)
+        pool = None
+    else:
+        # download remote files once, in this process (see `fetch.prefetch`)
+        fetch.prefetch(bed_files)
+        pool = ProcessPoolExecutor(max_workers=threads,
+                                   mp_context=pool_context())
+        members = pool.map(_read_member, bed_files)
+
+    infos = []
+    chrom_coords = {}
+    names = unique_names(bed_files)
+    for member_id, (info, merged) in enumerate(members):
+        logging.info("Indexing \"%s\" ..." % info['Path'])
+        info['Name'] = names[member_id]
+        infos.append(info)
+        for chrom, (starts, ends) in merged.items():
+            chrom_coords.setdefault(chrom, []).append(
+                (member_id, starts, ends))
+    if pool is not None:
+        pool.shutdown()
+
+    os.makedirs(index_dir, exist_ok=True)
+    n_rows = sum(len(s) for c in chrom_coords.values() for m, s, e in c)
+    starts_mm = np.lib.format.open_memmap(
+        os.path.join(index_dir, 'starts.npy'), mode='w+', dtype=np.int64,
+        shape=(n_rows,))
+    ends_mm = np.lib.format.open_memmap(
+        os.path.join(index_dir, 'ends.npy'), mode='w+', dtype=np.int64,
+        shape=(n_rows,))
+    ids_mm = np.lib.format.open_memmap(
+        os.path.join(index_dir, 'member_ids.npy'), mode='w+', dtype=np.int32,
+        shape=(n_rows,))
+    chrom_rows = []
+    row = 0
+    for chrom in sorted(chrom_coords):
+        first = row
+        for member_id, starts, ends in chrom_coords[chrom]:
+            n = len(starts)
+            starts_mm[row:row + n] = starts
+            ends_mm[row:row + n] = ends
+            ids_mm[row:row + n] = member_id
+            row += n
+        chrom_rows.append((chrom, first, row - first))
+    for mm in (starts_mm, ends_mm, ids_mm):
+        mm.flush()
+    del starts_mm, ends_mm, ids_mm
+
+    pd.DataFrame(chrom_rows, columns=['Chrom', 'First', 'Rows']).to_csv(
+        os.path.join(index_dir, 'chroms.tsv'), sep="\t", index=False)
+    members = pd.DataFrame(infos, columns=_member_fields)
+    members.to_csv(os.path.join(index_dir, 'members.tsv'), sep="\t",
+                   index=False)
+    logging.info("%d files (%d merged intervals) indexed in \"%s\"" %
+                 (len(members), n_rows, index_dir))
+    return members
+
+
+def load_index(index_dir):
+    """
+    Open an index built by `build_index`. Coordinate arrays are
+    memory-mapped (read-only), not loaded.
+
+    Returns
+    -------
+    tuple
+        (members, chroms, starts, ends, member_ids). members is a
+        pandas.DataFrame; chroms is a dict of chromosome ID => (first, rows).
+    """
+    try:
+        members = pd.read_csv(os.path.join(index_dir, 'members.tsv'),
+                              sep="\t", keep_default_na=False,
+                              dtype={'Name': str, 'Path': str},
+                              float_precision='round_trip')
+        chrom_df = pd.read_csv(os.path.join(index_dir, 'chroms.tsv'),
+                               sep="\t", dtype={'Chrom': str})
+        starts = np.load(os.path.join(index_dir, 'starts.npy'), mmap_mode='r')
+        ends = np.load(os.path.join(index_dir, 'ends.npy'), mmap_mode='r')
+        member_ids = np.load(os.path.join(index_dir, 'member_ids.npy'),
+                             mmap_mode='r')
+    except (OSError, ValueError):
+        logging.error("Invalid index: \"%s\"" % index_dir)
+        sys.exit(1)
+    chroms = {c: (f, n) for c, f, n in
+              zip(chrom_df['Chrom'], chrom_df['First'], chrom_df['Rows'])}
+    return (members, chroms, starts, ends, member_ids)
+
+
+def query_index(file1, index_dir, name1=None, bg_size=1400000000):
+    """
+    Compare one set of genomic regions with every member of an index.
+
+    The query is read once. For each chromosome, the overlap between the
+    query and every indexed interval is obtained by binary searches, and
+    summed per member, so the library is scanned in a single pass.
+
+    Parameters
+    ----------
+    file1 : str or IntervalSet
+        Genomic regions in BED, BED-like or BigBed format.
+    index_dir : str
+        Index directory built by `build_index`.
+    name1 : str, optional
+        Name of the query. The default is None.
+    bg_size : int, optional
+        The effective background genome size. The default is 1400000000.
+
+    Returns
+    -------
+    pandas.DataFrame
+        One row per library member, with the same fields as returned by
+        `ovstat.ov_stats` (A is the query, B is the library member).
+    """
+    members, chroms, starts, ends, member_ids = load_index(index_dir)
+    bed1 = bed_to_intervalset(file1)
+    logging.info("Gathering information for \"%s\" ..." % bed1.name)
+    info1 = bed_info(bed1)
+
+    logging.info("Scanning %d indexed files ..." % len(members))
+    ov = np.zeros(len(members), dtype=np.int64)
+    for chrom, (qs, qe) in bed1.merged.items():
+        if chrom not in chroms or len(qs) == 0:
+            continue
+        first, n = chroms[chrom]
+        ls = starts[first:first + n]
+        le = ends[first:first + n]
+        sizes = covered_before(qs, qe, le) - covered_before(qs, qe, ls)
+        ov += np.bincount(member_ids[first:first + n], weights=sizes,
+                          minlength=len(members)).astype(np.int64)
+
+    x = info1['Genomic_size']
+    y = members['Genomic_size'].to_numpy(dtype=np.int64)
+    coefs = coef_arrays(x, y, ov, bg_size)
+    results = pd.DataFrame({
+        'A.name': info1['Name'] if name1 is None else name1,
+        'A.interval_count': info1['Count'],
+        'A.interval_total_size': info1['Total_size'],
+        'A.interval_mean_size': info1['Mean_size'],
+        'A.interval_median_size': info1['Median_size'],
+        'A.interval_min_size': info1['Min_size'],
+        'A.interval_max_size': info1['Max_size'],
+        'A.interval_size_SD': info1['STD'],
+        'B.name': members['Name'],
+        'B.interval_count': members['Count'],
+        'B.interval_total_size': members['Total_size'],
+        'B.interval_mean_size': members['Mean_size'],
+        'B.interval_median_size': members['Median_size'],
+        'B.interval_min_size': members['Min_size'],
+        'B.interval_max_size': members['Max_size'],
+        'B.interval_size_SD': members['STD'],
+        'G.size': bg_size,
+        'A.size': x,
+        'Not_A.size': bg_size - x,
+        'B.size': y,
+        'Not_B.size': bg_size - y,
+        'A_not_B.size': x - ov,
+        'B_not_A.size': y - ov,
+        'A_and_B.size': ov,
+        'A_and_B.exp_size': x * y/bg_size,
+        'A_or_B.size': x + y - ov,
+        'Neither_A_nor_B.size': bg_size - x - y + ov,
+        'coef.Collocation': coefs['C'],
+        'coef.Jaccard': coefs['J'],
+        'coef.Dice': coefs['SD'],
+        'coef.SS': coefs['SS'],
+        'A_and_B.PMI': coefs['PMI'],
+        'A_and_B.NPMI': coefs['NPMI']})
+    return results
@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+All-vs-all comparison of many BED files.
+
+@author: m102324
+"""
+
+import os
+import sys
+import logging
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from cobindability.BED import bed_to_intervalset, unique_names
+from cobindability.intervals import linearize, overlap_sorted
+from cobindability.coefcal import coef_arrays
+from cobindability.findbed import findBedFiles
+from cobindability.utils import pool_context
+from cobindability import version
+
+
+__author__ = "Liguo Wang"
+__copyright__ = "Copyleft"
+__credits__ = []
+__license__ = "MIT"
+__version__ = version.version
+__maintainer__ = "Liguo Wang"
+__email__ = "wang.liguo@mayo.edu"
+__status__ = "Development"
+
+_shared_arrays = {}
+
+
+def expand_inputs(inputs):
+    """
+    Expand a list of BED files and/or directories into a list of BED files.
+    Directories are searched (recursively) by findBedFiles.
+
+    Parameters
+    ----------
+    inputs : list
+        BED files or directories containing BED files.
+
+    Returns
+    -------
+    list
+        BED files in input order. Duplicates are removed.
+    """
+    bed_files = []
+    for path in inputs:
+        if os.path.isdir(path):
+            found = sorted(findBedFiles(path))
+            logging.info("Found %d BED files in \"%s\"" % (len(found), path))
+            bed_files.extend(found)
+        elif os.path.isfile(path) or path.startswith(('http://', 'https://')):
+            bed_files.append(path)
+        else:
+            logging.error("Cannot find \"%s\"" % path)
+            sys.exit(1)
+    return list(dict.fromkeys(bed_files))
+
+
+def overlap_matrix(bed_files, threads=1):
+    """
+    Calculate the overlap size (in bp) between every pair of BED files.
+
+    Each file is read and merged only once. All sets are laid on one
+    coordinate axis, and every pair is then compared with binary searches.
+    Rows of the (symmetric) matrix are distributed over worker processes.
+
+    Parameters
+    ----------
+    bed_files : list
+        BED files (or IntervalSet objects).
+    threads : int, optional
+        Number of worker processes. The default is 1.
+
+    Returns
+    -------
+    tuple
+        (names, matrix). names is a list of set names (see
+        `BED.unique_names`); matrix is an N x N int64 numpy array whose
+        diagonal is the genomic size of each set.
+    """
+    coords = []
+    for f in bed_files:
+        logging.info("Reading \"%s\" ..." % f)
+        coords.append(bed_to_intervalset(f).merged)
+    names = unique_names(bed_files)
+    flat = linearize(*coords)
+    n = len(flat)
+    if threads <= 1 or n <= 2:
+        _init_worker(flat)
+        rows = [_worker_overlap_row(i) for i in range(n)]
+    else:
+        logging.info("Comparing %d sets with %d processes ..." % (n, threads))
+        with ProcessPoolExecutor(
+                max_workers=threads, mp_context=pool_context(),
+                initializer=_init_worker, initargs=(flat,)) as pool:
+            rows = list(pool.map(_worker_overlap_row, range(n)))
+    mat = np.zeros((n, n), dtype=np.int64)
+    for i, row in enumerate(rows):
+        mat[i, i:] = row
+        mat[i:, i] = row
+    return (names, mat)
+
+
+def _init_worker(flat):
+    _shared_arrays['flat'] = flat
+
+
+def _worker_overlap_row(i):
+    """
+    Overlap sizes between set i and sets i, i+1, ..., N-1.
+    """
+    flat = _shared_arrays['flat']
+    starts1, ends1 = flat[i]
+    row = np.zeros(len(flat) - i, dtype=np.int64)
+    for k, j in enumerate(range(i, len(flat))):
+        if j == i:
+            row[k] = (ends1 - starts1).sum()
+        else:
+            row[k] = overlap_sorted(starts1, ends1, *flat[j])
+    return row
+
+
+def coef_matrix(bed_files, bg_size=1400000000, threads=1):
+    """
+    Calculate all collocation coefficients between every pair of BED files.
+
+    Parameters
+    ----------
+    bed_files : list
+        BED files (or IntervalSet objects).
+    bg_size : int, optional
+        The size of background. The default is 1400000000.
+    threads : int, optional
+        Number of worker processes. The default is 1.
+
+    Returns
+    -------
+    tuple
+        (names, sizes, matrices). sizes is the genomic size of each set;
+        matrices is a dict of N x N numpy arrays keyed by 'overlap', 'C',
+        'J', 'SD', 'SS', 'PMI' and 'NPMI'.
+    """
+    names, ov = overlap_matrix(bed_files, threads=threads)
+    sizes = np.diag(ov).copy()
+    matrices = {'overlap': ov}
+    matrices.update(coef_arrays(sizes[:, None], sizes[None, :], ov, bg_size))
+    return (names, sizes, matrices)
+
+
+def write_matrix(names, sizes, matrices, outfile_prefix):
+    """
+    Save matrices as TSV files ("prefix_<name>.tsv") and as one numpy
+    archive ("prefix.npz"; load with numpy.load).
+
+    Returns
+    -------
+    list
+        Names of the files written.
+    """
+    outfiles = []
+    for key, mat in matrices.items():
+        outfile = outfile_prefix + '_' + key + '.tsv'
+        df = pd.DataFrame(mat, index=names, columns=names)
+        df.to_csv(outfile, sep="\t", index_label='Name')
+        outfiles.append(outfile)
+    outfile = outfile_prefix + '.npz'
+    np.savez_compressed(outfile, names=np.array(names), sizes=sizes,
+                        **matrices)
+    outfiles.append(outfile)
+    return outfiles
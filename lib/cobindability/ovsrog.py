@@ -0,0 +1,481 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Spatial relations of genomic regions (SROG) with sorted arrays.
+
+The target regions of each chromosome are kept in sorted numpy arrays, and
+the overlapping targets, relation codes and nearest upstream/downstream
+targets of all query regions of a chromosome are found at once with binary
+searches (numpy.searchsorted). Results (including the order of the
+reported targets and the choice of neighbours) are the same as those of
+the bx-python interval tree previously used by `BED.srog_peak`.
+
+@author: m102324
+"""
+
+import logging
+from os.path import basename
+import numpy as np
+import pandas as pd
+from cobindability import ireader, intervals
+from cobindability import version
+
+
+__author__ = "Liguo Wang"
+__copyright__ = "Copyleft"
+__credits__ = []
+__license__ = "MIT"
+__version__ = version.version
+__maintainer__ = "Liguo Wang"
+__email__ = "wang.liguo@mayo.edu"
+__status__ = "Development"
+
+# relation codes, indexed by the values returned by `relation_codes`
+srog_labels = np.array(['disjoint', 'touch', 'equal', 'within', 'contain',
+                        'overlap'], dtype=object)
+# number of query regions processed at once
+_block = 100000
+
+
+def _srog_records(inbed):
+    """
+    Read a BED file for `srog_peak`. Yields (line, chrom, start, end, name,
+    strand) for each valid line. The name is taken from the 4th column
+    (default: 'chrom:start-end') and the strand from the 6th column
+    (default: '+'). Genomic intervals given as a list, IntervalArray or
+    IntervalSet are reported as BED3 lines.
+    """
+    if type(inbed) is not str:
+        if isinstance(inbed, intervals.IntervalSet):
+            inbed = inbed.to_list()
+        for chrom, start, end in inbed:
+            l = chrom + '\t' + str(start) + '\t' + str(end)
+            if start > end:
+                logging.warning("Invalid BED line (start > end): %s" % l)
+                continue
+            yield (l, chrom, start, end, chrom + ':' + str(start) + '-' +
+                   str(end), '+')
+        return
+
+    # parse line by line to report the invalid lines
+    for l in ireader.reader(inbed):
+        if l.startswith(('browser', '#', 'track')):
+            continue
+        f = l.split()
+        if len(f) < 3:
+            logging.warning("Invalid BED line (Requires at least 3 columns: chrom, start, end): %s" % l)
+            continue
+        chrom, start, end = f[0], int(f[1]), int(f[2])
+        if start > end:
+            logging.warning("Invalid BED line (start > end): %s" % l)
+            continue
+
+        # try to get name from the 4th column
+        try:
+            name = f[3]
+        except:
+            name = f[0] + ':' + f[1] + '-' + f[2]
+
+        # try to get strand from the 6th column
+        try:
+            strandness = f[5]
+            if strandness not in ('+', '-'):
+                strandness = '+'
+        except:
+            strandness = '+'
+        yield (l, chrom, start, end, name, strandness)
+
+
+def read_srog(inbed):
+    """
+    Read the regions of a SROG query or target file.
+
+    Parameters
+    ----------
+    inbed : str, list, IntervalArray or IntervalSet
+        Name of a BED file, or genomic intervals.
+
+    Returns
+    -------
+    pandas.DataFrame
+        One row per valid line, with columns 'line' (the original line),
+        'chrom' (categorical), 'start', 'end', 'name' (4th column, default:
+        'chrom:start-end') and 'strand' ('+' or '-', default: '+'). Lines
+        with start > end are skipped with a warning.
+    """
+    df = None
+    if type(inbed) is str:
+        try:
+            df = ireader.read_bed(inbed, columns=(0, 1, 2, 3, 5), lines=True)
+        except ValueError:
+            df = None
+    if df is None:
+        df = pd.DataFrame(list(_srog_records(inbed)),
+                          columns=['line', 'chrom', 'start', 'end', 'name',
+                                   'strand'])
+        df['chrom'] = df['chrom'].astype(str).astype('category')
+        df['start'] = df['start'].astype(np.int64)
+        df['end'] = df['end'].astype(np.int64)
+        return df
+
+    bad = (df['start'] > df['end']).to_numpy()
+    if bad.any():
+        for l in df['line'][bad]:
+            logging.warning("Invalid BED line (start > end): %s" % l)
+        df = df[~bad].reset_index(drop=True)
+    if 'name' in df:
+        names = df['name'].to_numpy(dtype=object)
+    else:
+        names = np.full(len(df), '', dtype=object)
+    missing = names == ''
+    if missing.any():
+        names[missing] = (df['chrom'].astype(str)[missing] + ':' +
+                          df['start'][missing].astype(str) + '-' +
+                          df['end'][missing].astype(str)).to_numpy()
+    if 'strand' in df:
+        strands = df['strand'].to_numpy(dtype=object)
+        strands = np.where(strands == '-', '-', '+').astype(object)
+    else:
+        strands = np.full(len(df), '+', dtype=object)
+    return pd.DataFrame({'line': df['line'], 'chrom': df['chrom'],
+                         'start': df['start'], 'end': df['end'],
+                         'name': names, 'strand': strands})
+
+
+def _groups(df):
+    """
+    Yield (chrom, row numbers) of each chromosome of a `read_srog` frame.
+    """
+    codes = df['chrom'].cat.codes.to_numpy()
+    order = np.argsort(codes, kind='stable')
+    present, bounds = np.unique(codes[order], return_index=True)
+    bounds = np.append(bounds, len(order))
+    categories = df['chrom'].cat.categories
+    for i, code in enumerate(present):
+        yield (str(categories[code]), order[bounds[i]:bounds[i + 1]])
+
+
+def relation_codes(start1, end1, start2, end2):
+    """
+    Vectorized `BED.srogcode`: spatial relation of region 1 to region 2 (on
+    the same chromosome). Returns indexes into `srog_labels`.
+
+    Examples
+    --------
+    >>> srog_labels[relation_codes([1, 5, 10], [100, 60, 20], [15, 1, 20], [60, 100, 30])]
+    array(['contain', 'within', 'touch'], dtype=object)
+    """
+    s1 = np.asarray(start1, dtype=np.int64)
+    e1 = np.asarray(end1, dtype=np.int64)
+    s2 = np.asarray(start2, dtype=np.int64)
+    e2 = np.asarray(end2, dtype=np.int64)
+    codes = np.full(len(s1), 5, dtype=np.int8)
+    overlapped = np.minimum(e1, e2) - np.maximum(s1, s2) > 0
+    contain = ((s1 <= s2) & (e1 > e2)) | ((s1 < s2) & (e1 >= e2))
+    within = ((s1 >= s2) & (e1 < e2)) | ((s1 > s2) & (e1 <= e2))
+    # later assignments take precedence (same order as srogcode)
+    codes[contain] = 4
+    codes[within] = 3
+    codes[(s1 == s2) & (e1 == e2)] = 2
+    touch = (s1 == e2) | (e1 == s2)
+    codes[~overlapped] = np.where(touch[~overlapped], 1, 0)
+    return codes
+
+
+class _ChromIndex(object):
+    """
+    Target regions of one chromosome.
+
+    Regions are kept in the (in-)order of the interval tree: sorted by
+    start; among regions with the same start, empty regions (end == start)
+    come first in reverse input order, followed by the others in input
+    order.
+    """
+
+    def __init__(self, starts, ends, names):
+        n = len(starts)
+        rank = np.arange(n)
+        empty = ends == starts
+        order = np.lexsort((np.where(empty, -rank, rank), ~empty, starts))
+        self.starts = starts[order]
+        self.ends = ends[order]
+        self.names = names[order]
+        # regions sorted by end (ties by position), for upstream searches
+        self.end_order = np.lexsort((rank, self.ends))
+        self.sorted_ends = self.ends[self.end_order]
+        # regions grouped by size class (sizes in [2**(k-1), 2**k)), so
+        # that the candidates of a query only extend back by the largest
+        # size of the class
+        size_class = np.ceil(np.log2(self.ends - self.starts + 1))
+        self.classes = []
+        for k in np.unique(size_class):
+            idx = np.flatnonzero(size_class == k)
+            self.classes.append((idx, self.starts[idx], self.ends[idx],
+                                 int((self.ends[idx] - self.starts[idx]).max())))
+
+    def overlaps(self, q_starts, q_ends):
+        """
+        Targets overlapping each query (t_start < q_end and t_end >
+        q_start). Returns (query index, target index) pairs, sorted by
+        query and then by target position.
+        """
+        q_idx = []
+        t_idx = []
+        for idx, starts, ends, max_size in self.classes:
+            lo = np.searchsorted(starts, q_starts - max_size, side='right')
+            hi = np.searchsorted(starts, q_ends, side='left')
+            counts = np.maximum(hi - lo, 0)
+            total = int(counts.sum())
+            if total == 0:
+                continue
+            q = np.repeat(np.arange(len(q_starts)), counts)
+            pos = np.arange(total) - np.repeat(np.cumsum(counts) - counts,
+                                               counts) + lo[q]
+            keep = ends[pos] > q_starts[q]
+            q_idx.append(q[keep])
+            t_idx.append(idx[pos[keep]])
+        if len(q_idx) == 0:
+            empty = np.empty(0, dtype=np.int64)
+            return (empty, empty)
+        q_idx = np.concatenate(q_idx)
+        t_idx = np.concatenate(t_idx)
+        order = np.lexsort((t_idx, q_idx))
+        return (q_idx[order], t_idx[order])
+
+    def left(self, points, n, max_dist):
+        """
+        Nearest target ending before each point (end < point, within
+        max_dist), as chosen by the interval tree's left search. Returns
+        target indexes (-1 if none).
+        """
+        lo = np.searchsorted(self.sorted_ends, points - max_dist,
+                             side='left')
+        hi = np.searchsorted(self.sorted_ends, points - 1, side='right')
+        counts = hi - lo
+        found = np.where(counts > 0, self.end_order[np.maximum(hi - 1, 0)],
+                         -1)
+        # exactly n candidates are returned in tree order (the last one
+        # in position comes first) rather than sorted by end
+        exact = np.flatnonzero(counts == n)
+        if n > 1 and len(exact) > 0:
+            bounds = np.stack((lo[exact], hi[exact]), axis=1).ravel()
+            found[exact] = np.maximum.reduceat(
+                np.append(self.end_order, -1), bounds)[::2]
+        return found
+
+    def right(self, points, n, max_dist):
+        """
+        Nearest target starting after each point (start > point, within
+        max_dist), as chosen by the interval tree's right search. Returns
+        target indexes (-1 if none).
+        """
+        lo = np.searchsorted(self.starts, points, side='right')
+        hi = np.searchsorted(self.starts, points + max_dist, side='right')
+        return np.where(hi > lo, lo, -1)
+
+
+class SrogIndex(object):
+    """
+    Sorted-array index of target regions for SROG annotation.
+
+    Parameters
+    ----------
+    df : pandas.DataFrame
+        Target regions returned by `read_srog`.
+    name : str, optional
+        Name of the target set. The default is None.
+    """
+
+    def __init__(self, df, name=None):
+        self.name = name
+        self.chroms = {}
+        starts = df['start'].to_numpy(dtype=np.int64)
+        ends = df['end'].to_numpy(dtype=np.int64)
+        names = df['name'].to_numpy(dtype=object)
+        for chrom, idx in _groups(df):
+            self.chroms[chrom] = _ChromIndex(starts[idx], ends[idx],
+                                             names[idx])
+
+    @classmethod
+    def from_bed(cls, inbed, name=None):
+        """
+        Read and index target regions (see `read_srog`).
+        """
+        return cls(read_srog(inbed), name=name)
+
+    def annotate(self, query, n_up=1, n_down=1, max_dist=250000000):
+        """
+        Determine the SROG codes of all query regions.
+
+        Parameters
+        ----------
+        query : pandas.DataFrame
+            Query regions returned by `read_srog`.
+        n_up : int, optional
+            Number of upstream targets searched. The default is 1.
+        n_down : int, optional
+            Number of downstream targets searched. The default is 1.
+        max_dist : int, optional
+            Maximum distance to upstream/downstream targets. The default is
+            250000000.
+
+        Returns
+        -------
+        tuple
+            (codes, targets, summary). codes and targets are the two output
+            columns of each query region (e.g., 'overlap,within' and
+            'gene1,gene2', or 'disjoint' and
+            'UpInterval=gene1,DownInterval=gene2', or 'NA' and 'NA' if the
+            chromosome has no target); summary counts each relation.
+        """
+        summary = {'disjoint': 0, 'overlap': 0, 'contain': 0, 'within': 0,
+                   'touch': 0, 'equal': 0, 'other': 0}
+        codes_col = np.full(len(query), 'NA', dtype=object)
+        targets_col = np.full(len(query), 'NA', dtype=object)
+        starts = query['start'].to_numpy(dtype=np.int64)
+        ends = query['end'].to_numpy(dtype=np.int64)
+        minus = query['strand'].to_numpy(dtype=object) == '-'
+        code_counts = np.zeros(len(srog_labels), dtype=np.int64)
+        for chrom, rows in _groups(query):
+            if chrom not in self.chroms:
+                summary['disjoint'] += len(rows)
+                continue
+            index = self.chroms[chrom]
+            for i in range(0, len(rows), _block):
+                block = rows[i:i + _block]
+                self._annotate_block(index, block, starts[block],
+                                     ends[block], minus[block], n_up, n_down,
+                                     max_dist, codes_col, targets_col,
+                                     code_counts)
+        for label, count in zip(srog_labels, code_counts.tolist()):
+            summary[label] += count
+        return (codes_col, targets_col, summary)
+
+    @staticmethod
+    def _annotate_block(index, rows, q_starts, q_ends, minus, n_up, n_down,
+                        max_dist, codes_col, targets_col, code_counts):
+        q_idx, t_idx = index.overlaps(q_starts, q_ends)
+        codes = relation_codes(q_starts[q_idx], q_ends[q_idx],
+                               index.starts[t_idx], index.ends[t_idx])
+        code_counts += np.bincount(codes, minlength=len(srog_labels))
+        labels = srog_labels[codes].tolist()
+        names = [str(v) for v in index.names[t_idx].tolist()]
+        bounds = np.flatnonzero(np.diff(q_idx)) + 1
+        first = np.concatenate(([0], bounds)).tolist()
+        last = np.concatenate((bounds, [len(q_idx)])).tolist()
+        hit_rows = rows[q_idx[first]] if len(q_idx) > 0 else rows[:0]
+        for row, a, b in zip(hit_rows.tolist(), first, last):
+            codes_col[row] = ','.join(labels[a:b])
+            targets_col[row] = ','.join(names[a:b])
+
+        # nearest targets of the disjoint regions
+        hit = np.zeros(len(rows), dtype=bool)
+        hit[q_idx] = True
+        miss = np.flatnonzero(~hit)
+        if len(miss) == 0:
+            return
+        code_counts[0] += len(miss)
+        left_up = index.left(q_starts[miss], n_up, max_dist)
+        left_down = index.left(q_starts[miss], n_down, max_dist)
+        right_up = index.right(q_ends[miss], n_up, max_dist)
+        right_down = index.right(q_ends[miss], n_down, max_dist)
+        # upstream is on the right for regions on the '-' strand
+        up = np.where(minus[miss], right_up, left_up)
+        down = np.where(minus[miss], left_down, right_down)
+        names = np.append(index.names, 'NA')
+        for row, u, d in zip(rows[miss].tolist(), names[up].tolist(),
+                             names[down].tolist()):
+            codes_col[row] = 'disjoint'
+            targets_col[row] = ('UpInterval=' + str(u) + ',' +
+                                'DownInterval=' + str(d))
+
+
+def _target_name(inbed):
+    """
+    Name of a target set: the base name of a file, or the name of an
+    IntervalArray or IntervalSet.
+    """
+    if type(inbed) is str:
+        return basename(inbed)
+    name = getattr(inbed, 'name', None)
+    return name if name is not None else 'intervals'
+
+
+def srog_multi(inbed1, targets, outfile, names=None, n_up=1, n_down=1,
+               max_dist=250000000):
+    """
+    Calculates SROG codes for each region in inbed1 against several target
+    files in one pass: all targets are indexed once and inbed1 is read once.
+
+    Each line of outfile is the original line of inbed1 followed by one
+    group of two columns (SROG codes, and overlapping or neighbouring
+    targets) per target, in the order of `targets`. See `BED.srog_peak`.
+
+    Parameters
+    ----------
+    inbed1 : str, list, IntervalArray or IntervalSet
+        Name of a BED file, or genomic intervals.
+    targets : list
+        Target BED files (or genomic intervals).
+    outfile : str
+        Name of output file.
+    names : list of str, optional
+        Names of the targets. The default is the base names of the files.
+    n_up : int, optional
+        Number of upstream regions searched. The default is 1.
+    n_down : int, optional
+        Number of downstream regions searched. The default is 1.
+    max_dist : int, optional
+        Maximum distance to the upstream/downstream regions. The default is
+        250000000.
+
+    Returns
+    -------
+    pandas.DataFrame
+        Number of regions of each relation (rows) for each target
+        (columns).
+    """
+    if names is None:
+        names = [_target_name(t) for t in targets]
+    if len(names) != len(targets):
+        raise ValueError("%d names given for %d targets" %
+                         (len(names), len(targets)))
+    indexes = []
+    for inbed2, name in zip(targets, names):
+        logging.info("Build index from file: \"%s\"" % inbed2)
+        indexes.append(SrogIndex.from_bed(inbed2, name=name))
+
+    logging.info("Reading BED file: \"%s\"" % inbed1)
+    query = read_srog(inbed1)
+    summaries = [None] * len(indexes)
+    with open(outfile, 'w') as OUT:
+        for i in range(0, len(query), _block):
+            block = query.iloc[i:i + _block]
+            rows = block['line'].tolist()
+            for j, index in enumerate(indexes):
+                codes, hits, summary = index.annotate(
+                    block, n_up=n_up, n_down=n_down, max_dist=max_dist)
+                rows = [l + '\t' + c + '\t' + t for l, c, t in
+                        zip(rows, codes.tolist(), hits.tolist())]
+                if summaries[j] is None:
+                    summaries[j] = summary
+                else:
+                    for k, v in summary.items():
+                        summaries[j][k] += v
+            if rows:
+                OUT.write('\n'.join(rows) + '\n')
+    for j, index in enumerate(indexes):
+        if summaries[j] is None:
+            summaries[j] = index.annotate(query.iloc[:0])[2]
+    return pd.concat([pd.Series(data=summary) for summary in summaries],
+                     axis=1, keys=names)
+
+
+def srog_annotate(inbed1, inbed2, outfile, n_up=1, n_down=1,
+                  max_dist=250000000):
+    """
+    Calculates SROG code for each region in inbed1. See `BED.srog_peak`.
+    """
+    summary = srog_multi(inbed1, [inbed2], outfile, n_up=n_up,
+                         n_down=n_down, max_dist=max_dist)
+    return summary.iloc[:, 0].rename(None)
@@ -9,8 +9,7 @@ Created on Tue Jan 11 14:17:50 2022
 import sys
 import logging
 import pandas as pd
-from scipy import stats
-from cobindability.BED import bed_overlap_size, bed_to_list, bed_info
+from cobindability.BED import bed_overlap_size, bed_to_intervalset, bed_info
 from cobindability.coefcal import ov_coef, ov_jaccard, ov_ss, ov_sd, pmi_value, npmi_value
 from cobindability import version
 
@@ -29,12 +28,12 @@ def ov_stats(file1, file2, name1 = None, name2 = None, bg_size = 1400000000):
     """
     Parameters
     ----------
-    file1 : str
+    file1 : str or IntervalSet
         Genomic regions in BED (Browser Extensible Data, https://genome.ucsc.edu/FAQ/FAQformat.html#format1), BED-like or BigBed format.
         The BED-like format includes 'bed3','bed4','bed6','bed12','bedgraph','narrowpeak', 'broadpeak','gappedpeak'. BED and BED-like
         format can be plain text, compressed (.gz, .z, .bz, .bz2, .bzip2) or remote (http://, https://, ftp://) files. Do not compress
         BigBed foramt. BigBed file can also be a remote file.
-    file2 : str
+    file2 : str or IntervalSet
         Genomic regions in BED (Browser Extensible Data, https://genome.ucsc.edu/FAQ/FAQformat.html#format1), BED-like or BigBed format.
         The BED-like format includes 'bed3','bed4','bed6','bed12','bedgraph','narrowpeak', 'broadpeak','gappedpeak'. BED and BED-like
         format can be plain text, compressed (.gz, .z, .bz, .bz2, .bzip2) or remote (http://, https://, ftp://) files. Do not compress
@@ -58,11 +57,12 @@ def ov_stats(file1, file2, name1 = None, name2 = None, bg_size = 1400000000):
 
     """
     results = {}
-    file1_lst = bed_to_list(file1)
-    file2_lst = bed_to_list(file2)
+    # each input is read only once
+    bed1 = bed_to_intervalset(file1)
+    bed2 = bed_to_intervalset(file2)
 
-    logging.info("Gathering information for \"%s\" ..." % file1)
-    info1 = bed_info(file1)
+    logging.info("Gathering information for \"%s\" ..." % bed1.name)
+    info1 = bed_info(bed1)
     if name1 is None:
         results['A.name'] = info1['Name']
     else:
@@ -77,8 +77,8 @@ def ov_stats(file1, file2, name1 = None, name2 = None, bg_size = 1400000000):
     results['A.interval_size_SD'] = info1['STD']
     uniqBase1 = info1['Genomic_size']
 
-    logging.info("Gathering information for \"%s\" ..." % file2)
-    info2 = bed_info(file2)
+    logging.info("Gathering information for \"%s\" ..." % bed2.name)
+    info2 = bed_info(bed2)
     if name2 is None:
         results['B.name'] = info2['Name']
     else:
@@ -95,7 +95,7 @@ def ov_stats(file1, file2, name1 = None, name2 = None, bg_size = 1400000000):
 
     # calculate overall collocation coef
     logging.debug("Calculating overlapped bases ...")
-    overlapBases = bed_overlap_size(file1_lst, file2_lst)
+    overlapBases = bed_overlap_size(bed1, bed2)
 
     results['G.size'] = bg_size
     results['A.size'] = uniqBase1
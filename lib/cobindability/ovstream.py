@@ -0,0 +1,306 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Streaming (out-of-core) statistics of genomic regions larger than memory.
+
+Input files are read in chunks. Interval size statistics are accumulated
+on the fly, and the intervals of each chromosome are merged within the
+chunk and appended to a temporary per-chromosome file. Genomic sizes and
+the overlap are then computed one chromosome at a time, so that memory use
+is bounded by the chunk size and the (merged) intervals of the largest
+chromosome, not by the size of the input. Inputs do not need to be sorted.
+
+@author: m102324
+"""
+
+import os
+import shutil
+import logging
+import tempfile
+from os.path import basename
+import numpy as np
+import pandas as pd
+from cobindability import ireader
+from cobindability.intervals import merge_intervals, overlap_sorted
+from cobindability.coefcal import ov_coef, ov_jaccard, ov_ss, ov_sd
+from cobindability.coefcal import pmi_value, npmi_value
+from cobindability import version
+
+
+__author__ = "Liguo Wang"
+__copyright__ = "Copyleft"
+__credits__ = []
+__license__ = "MIT"
+__version__ = version.version
+__maintainer__ = "Liguo Wang"
+__email__ = "wang.liguo@mayo.edu"
+__status__ = "Development"
+
+
+class StreamedBed(object):
+    """
+    A BED file read by `stream_bed`: interval size statistics, and merged
+    intervals of each chromosome spilled to a temporary directory.
+
+    Interval sizes are tallied by value (sizes are integers and usually
+    take few distinct values), so the count, total, mean, median, minimum
+    and maximum are exact; the standard deviation is computed from the same
+    tally.
+    """
+
+    def __init__(self, name, spill_dir):
+        self.name = name
+        self.spill_dir = spill_dir
+        self.chroms = {}
+        self._size_counts = {}
+
+    def _add_sizes(self, sizes):
+        values, counts = np.unique(sizes, return_counts=True)
+        for v, n in zip(values.tolist(), counts.tolist()):
+            self._size_counts[v] = self._size_counts.get(v, 0) + n
+
+    def _spill(self, chrom, starts, ends):
+        if chrom not in self.chroms:
+            self.chroms[chrom] = os.path.join(self.spill_dir,
+                                              '%d.bin' % len(self.chroms))
+        # starts and ends are interleaved: s0, e0, s1, e1, ...
+        with open(self.chroms[chrom], 'ab') as fh:
+            np.stack((starts, ends), axis=1).tofile(fh)
+
+    def merged(self, chrom):
+        """
+        Merged (sorted, disjoint) intervals of one chromosome.
+        """
+        if chrom not in self.chroms:
+            empty = np.empty(0, dtype=np.int64)
+            return (empty, empty)
+        coords = np.fromfile(self.chroms[chrom], dtype=np.int64)
+        coords = coords.reshape(-1, 2)
+        return merge_intervals(coords[:, 0], coords[:, 1])
+
+    def info(self, genomic_size=None):
+        """
+        Basic statistics of the intervals. Keys are the same as those
+        returned by `BED.bed_info`.
+        """
+        if genomic_size is None:
+            genomic_size = sum(int((e - s).sum()) for s, e in
+                               map(self.merged, self.chroms))
+        values = np.array(sorted(self._size_counts), dtype=np.int64)
+        counts = np.array([self._size_counts[v] for v in values.tolist()],
+                          dtype=np.int64)
+        n = int(counts.sum())
+        if n == 0:
+            return {'Name': self.name, 'Genomic_size': genomic_size,
+                    'Total_size': 0, 'Count': 0, 'Mean_size': np.nan,
+                    'Median_size': np.nan, 'Min_size': np.nan,
+                    'Max_size': np.nan, 'STD': np.nan}
+        total = int((values * counts).sum())
+        mean = total / n
+        # the two middle elements of the sorted sizes
+        cum = np.cumsum(counts)
+        lower = values[np.searchsorted(cum, (n - 1) // 2, side='right')]
+        upper = values[np.searchsorted(cum, n // 2, side='right')]
+        std = np.sqrt(((values - mean)**2 * counts).sum() / (n - 1)) \
+            if n > 1 else np.nan
+        return {'Name': self.name,
+                'Genomic_size': genomic_size,
+                'Total_size': total,
+                'Count': n,
+                'Mean_size': np.float64(mean),
+                'Median_size': (lower + upper) / 2,
+                'Min_size': values[0],
+                'Max_size': values[-1],
+                'STD': np.float64(std)}
+
+
+def stream_bed(inbed, spill_dir, name=None, chunk_bytes=64 * 1024**2,
+               regions=None):
+    """
+    Read a BED file in chunks (see `ireader.read_bed_chunks`).
+
+    Parameters
+    ----------
+    inbed : str
+        Genomic regions in BED, BED-like or bigBed format.
+    spill_dir : str
+        Directory of the temporary per-chromosome files.
+    name : str, optional
+        Name of the interval set. The default is the base name of inbed.
+    chunk_bytes : int, optional
+        Number of bytes parsed at once. The default is 64 MB.
+    regions : str, list or dict, optional
+        Only read the intervals overlapping these regions (see
+        `ireader.read_regions`). The default is None (all intervals).
+
+    Returns
+    -------
+    StreamedBed
+    """
+    os.makedirs(spill_dir, exist_ok=True)
+    bed = StreamedBed(basename(inbed) if name is None else name, spill_dir)
+    n_lines = 0
+    for df in ireader.read_bed_chunks(inbed, chunk_bytes=chunk_bytes,
+                                      regions=regions):
+        starts = df['start'].to_numpy(dtype=np.int64)
+        ends = df['end'].to_numpy(dtype=np.int64)
+        if np.any(ends < starts):
+            raise ValueError("invalid BED line (start > end)")
+        bed._add_sizes(ends - starts)
+        codes = df['chrom'].cat.codes.to_numpy()
+        order = np.argsort(codes, kind='stable')
+        present, bounds = np.unique(codes[order], return_index=True)
+        bounds = np.append(bounds, len(order))
+        for i, code in enumerate(present):
+            idx = order[bounds[i]:bounds[i + 1]]
+            s, e = merge_intervals(starts[idx], ends[idx])
+            if len(s) > 0:
+                bed._spill(str(df['chrom'].cat.categories[code]), s, e)
+        n_lines += len(df)
+        logging.debug("%d lines read from \"%s\"" % (n_lines, inbed))
+    return bed
+
+
+def stream_sizes(file1, file2, name1=None, name2=None,
+                 chunk_bytes=64 * 1024**2, tmp_dir=None, regions=None):
+    """
+    Stream two BED files, and calculate their genomic sizes and overlap
+    size chromosome by chromosome.
+
+    Parameters
+    ----------
+    file1 : str
+        Genomic regions in BED, BED-like or bigBed format.
+    file2 : str
+        Genomic regions in BED, BED-like or bigBed format.
+    name1 : str, optional
+        Name of the 1st set of genomic interval. The default is None.
+    name2 : str, optional
+        Name of the 2nd set of genomic interval. The default is None.
+    chunk_bytes : int, optional
+        Number of bytes parsed at once. The default is 64 MB.
+    tmp_dir : str, optional
+        Parent directory of temporary files. The default is the system
+        temporary directory.
+    regions : str, list or dict, optional
+        Only read the intervals overlapping these regions (see
+        `ireader.read_regions`). The default is None (all intervals).
+
+    Returns
+    -------
+    tuple
+        (info1, info2, overlap_size). info1 and info2 are dicts with the
+        same keys as returned by `BED.bed_info`.
+    """
+    regions = ireader.read_regions(regions)
+    spill_dir = tempfile.mkdtemp(prefix='cobind_', dir=tmp_dir)
+    try:
+        logging.info("Reading \"%s\" ..." % file1)
+        bed1 = stream_bed(file1, os.path.join(spill_dir, 'A'), name1,
+                          chunk_bytes, regions)
+        logging.info("Reading \"%s\" ..." % file2)
+        bed2 = stream_bed(file2, os.path.join(spill_dir, 'B'), name2,
+                          chunk_bytes, regions)
+
+        logging.info("Calculating overlapped bases ...")
+        size1 = 0
+        size2 = 0
+        overlap = 0
+        for chrom in list(bed1.chroms) + \
+                [c for c in bed2.chroms if c not in bed1.chroms]:
+            logging.debug("Processing %s ..." % chrom)
+            s1, e1 = bed1.merged(chrom)
+            s2, e2 = bed2.merged(chrom)
+            size1 += int((e1 - s1).sum())
+            size2 += int((e2 - s2).sum())
+            overlap += overlap_sorted(s1, e1, s2, e2)
+    finally:
+        shutil.rmtree(spill_dir, ignore_errors=True)
+    return (bed1.info(genomic_size=size1), bed2.info(genomic_size=size2),
+            overlap)
+
+
+def stream_stats(file1, file2, name1=None, name2=None, bg_size=1400000000,
+                 chunk_bytes=64 * 1024**2, tmp_dir=None, regions=None):
+    """
+    Streaming version of `ovstat.ov_stats` for inputs larger than memory.
+    Returns the same fields. See `stream_sizes` for the parameters.
+
+    Returns
+    -------
+    pandas.Series
+    """
+    info1, info2, overlapBases = stream_sizes(
+        file1, file2, name1, name2, chunk_bytes=chunk_bytes, tmp_dir=tmp_dir,
+        regions=regions)
+    uniqBase1 = info1['Genomic_size']
+    uniqBase2 = info2['Genomic_size']
+
+    results = {}
+    for prefix, info in (('A', info1), ('B', info2)):
+        results[prefix + '.name'] = info['Name']
+        results[prefix + '.interval_count'] = info['Count']
+        results[prefix + '.interval_total_size'] = info['Total_size']
+        results[prefix + '.interval_mean_size'] = info['Mean_size']
+        results[prefix + '.interval_median_size'] = info['Median_size']
+        results[prefix + '.interval_min_size'] = info['Min_size']
+        results[prefix + '.interval_max_size'] = info['Max_size']
+        results[prefix + '.interval_size_SD'] = info['STD']
+
+    results['G.size'] = bg_size
+    results['A.size'] = uniqBase1
+    results['Not_A.size'] = bg_size - uniqBase1
+    results['B.size'] = uniqBase2
+    results['Not_B.size'] = bg_size - uniqBase2
+    results['A_not_B.size'] = uniqBase1 - overlapBases
+    results['B_not_A.size'] = uniqBase2 - overlapBases
+    results['A_and_B.size'] = overlapBases
+    results['A_and_B.exp_size'] = uniqBase1 * uniqBase2/bg_size
+    results['A_or_B.size'] = uniqBase1 + uniqBase2 - overlapBases
+    results['Neither_A_nor_B.size'] = \
+        bg_size - uniqBase1 - uniqBase2 + overlapBases
+
+    results['coef.Collocation'] = ov_coef(uniqBase1, uniqBase2, overlapBases,
+                                          bg_size)
+    results['coef.Jaccard'] = ov_jaccard(uniqBase1, uniqBase2, overlapBases,
+                                         bg_size)
+    results['coef.Dice'] = ov_sd(uniqBase1, uniqBase2, overlapBases, bg_size)
+    results['coef.SS'] = ov_ss(uniqBase1, uniqBase2, overlapBases, bg_size)
+    results['A_and_B.PMI'] = pmi_value(uniqBase1, uniqBase2, overlapBases,
+                                       bg_size)
+    results['A_and_B.NPMI'] = npmi_value(uniqBase1, uniqBase2, overlapBases,
+                                         bg_size)
+    return pd.Series(data=results)
+
+
+def stream_coef(file1, file2, score_func, name1=None, name2=None,
+                bg_size=1400000000, chunk_bytes=64 * 1024**2, tmp_dir=None,
+                regions=None):
+    """
+    Streaming version of `ovbootstrap.bootstrap_coef` without resampling
+    (subsampling needs all intervals in memory). Returns the same fields;
+    'Coef(95% CI)' is '[NA,NA]'. See `stream_sizes` for the parameters.
+
+    Returns
+    -------
+    pandas.Series
+    """
+    info1, info2, overlapBases = stream_sizes(
+        file1, file2, name1, name2, chunk_bytes=chunk_bytes, tmp_dir=tmp_dir,
+        regions=regions)
+    uniqBase1 = info1['Genomic_size']
+    uniqBase2 = info2['Genomic_size']
+    results = {}
+    results['A.name'] = info1['Name']
+    results['B.name'] = info2['Name']
+    results['A.interval_count'] = info1['Count']
+    results['B.interval_count'] = info2['Count']
+    results['A.size'] = uniqBase1
+    results['B.size'] = uniqBase2
+    results['A_or_B.size'] = uniqBase1 + uniqBase2 - overlapBases
+    results['A_and_B.size'] = overlapBases
+    results['Coef'] = score_func(uniqBase1, uniqBase2, overlapBases, bg_size)
+    results['Coef(expected)'] = score_func(
+        uniqBase1, uniqBase2, uniqBase1*uniqBase2/bg_size, bg_size)
+    results['Coef(95% CI)'] = '[NA,NA]'
+    return pd.Series(data=results)
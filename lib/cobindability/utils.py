@@ -1,7 +1,6 @@
+import os
 import logging
-import pandas as pd
-import numpy as np
-from scipy.stats import zscore
+import multiprocessing
 
 
 def config_log(switch, logfile=None):
@@ -39,6 +38,17 @@ def config_log(switch, logfile=None):
                 datefmt='%Y-%m-%d %I:%M:%S', level=logging.INFO)
 
 
+def pool_context():
+    """
+    Multiprocessing context for process pools. Prefer 'fork' so that worker
+    processes inherit large numpy arrays set up by the pool initializer
+    without pickling them; fall back to the platform default elsewhere.
+    """
+    if 'fork' in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context('fork')
+    return multiprocessing.get_context()
+
+
 def cal_zscores(infile, outfile):
     """calculate z-score of the six collocation measurements
     TF_name C       J       SD      SS      PMI     NPMI
@@ -48,6 +58,9 @@ def cal_zscores(infile, outfile):
     TRIM22  0.14    0.0214  0.0419  0.9127  1.9858  0.3355
     STAG1   0.1368  0.0191  0.0375  0.9787  2.0556  0.3407
     """
+    import numpy as np
+    import pandas as pd
+    from scipy.stats import zscore
     logging.info("Calculate Z-scores from \"%s\"" % infile)
     df = pd.read_csv(infile, index_col=0, sep="\t", engine='python')
     print(df)
@@ -63,3 +76,26 @@ def cal_zscores(infile, outfile):
     logging.info("Save Z-scores to \"%s\"" % outfile)
     df2.to_csv(outfile, sep="\t")
     print(df2)
+
+
+def append_row(row, outfile):
+    """
+    Append a pandas Series as one row of a TSV file. The header is written
+    only when the file is new (or empty), so results of many runs can be
+    collected into one table (e.g., the input of `cal_zscores`).
+
+    Parameters
+    ----------
+    row : pandas.Series
+        The row to save. Its name is used as the row name.
+    outfile : str
+        Name of the TSV file.
+
+    Returns
+    -------
+    None.
+
+    """
+    new_file = (not os.path.exists(outfile)) or os.path.getsize(outfile) == 0
+    row.to_frame().T.to_csv(outfile, sep="\t", mode='a', header=new_file,
+                            index_label='Name')
@@ -23,7 +23,7 @@ def main():
             author_email ="wangliguo78@gmail.com",
             platforms = ['Linux','MacOS'],
             requires = [],
-            install_requires = ['scipy', 'numpy', 'pandas', 'bx-python','pyBigWig'],
+            install_requires = ['scipy', 'numpy', 'pandas', 'pyBigWig'],
             description = "collocation analysis of genomics intervals",
             url = "https://cobind.readthedocs.io/en/latest/",
             zip_safe = False,
@@ -0,0 +1,6 @@
+import os
+import sys
+
+# run the tests against the source tree (lib/) without installing it
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                os.pardir, 'lib'))
@@ -0,0 +1,195 @@
+"""
+Tests of cobindability.fetch against a local HTTP server, which can turn
+off range requests and truncate chosen responses.
+"""
+
+import os
+import sys
+import hashlib
+import threading
+import subprocess
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import pytest
+from cobindability import fetch
+
+_lib = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir,
+                    'lib')
+
+
+class Server(object):
+    """
+    Serve the byte strings of `files` (path => data). Every request is
+    recorded in `log` as (method, Range header).
+    """
+
+    def __init__(self):
+        self.files = {}
+        self.log = []
+        self.ranges = True
+        # range offsets whose next response is cut short
+        self.short = set()
+        # range offsets whose next response body stops before its
+        # Content-Length (the connection is closed)
+        self.cut = set()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_HEAD(self):
+                self._send(body=False)
+
+            def do_GET(self):
+                self._send(body=True)
+
+            def _send(self, body):
+                server.log.append((self.command, self.headers.get('Range')))
+                data = server.files.get(self.path)
+                if data is None:
+                    self.send_error(404)
+                    return
+                status, start = 200, 0
+                if server.ranges and self.headers.get('Range'):
+                    first, last = self.headers['Range'][6:].split('-')
+                    start = int(first)
+                    data = data[start:int(last) + 1]
+                    status = 206
+                length = len(data)
+                if body and start in server.short:
+                    server.short.discard(start)
+                    data = data[:len(data) // 2]
+                    length = len(data)
+                elif body and start in server.cut:
+                    server.cut.discard(start)
+                    data = data[:len(data) // 2]
+                self.send_response(status)
+                self.send_header('Content-Length', str(length))
+                self.send_header('ETag', '"%s"' % hashlib.sha1(
+                    server.files[self.path]).hexdigest())
+                if server.ranges:
+                    self.send_header('Accept-Ranges', 'bytes')
+                self.end_headers()
+                if body:
+                    self.wfile.write(data)
+
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = 'http://127.0.0.1:%d' % self.httpd.server_address[1]
+        self.thread = threading.Thread(target=self.httpd.serve_forever,
+                                       daemon=True)
+        self.thread.start()
+
+    def requests(self, method):
+        return [r for r in self.log if r[0] == method]
+
+
+@pytest.fixture
+def server():
+    s = Server()
+    yield s
+    s.httpd.shutdown()
+    s.httpd.server_close()
+
+
+@pytest.fixture(autouse=True)
+def session(tmp_path, monkeypatch):
+    """
+    Fresh download state; temporary downloads go to tmp_path.
+    """
+    monkeypatch.setattr(fetch, '_session',
+                        {'dir': str(tmp_path / 'session'), 'files': {}})
+    monkeypatch.setitem(fetch._settings, 'dir', None)
+    os.makedirs(fetch._session['dir'])
+
+
+def bed_text(n):
+    return ''.join('chr%d\t%d\t%d\n' % (i % 3 + 1, i * 10, i * 10 + 5)
+                   for i in range(n)).encode()
+
+
+def read(path):
+    with open(path, 'rb') as fh:
+        return fh.read()
+
+
+def test_single_request(server):
+    server.ranges = False
+    server.files['/a.bed'] = bed_text(500)
+    path = fetch.fetch(server.url + '/a.bed')
+    assert read(path) == server.files['/a.bed']
+    assert server.requests('GET') == [('GET', None)]
+
+
+def test_chunks_with_retry(server):
+    data = bed_text(2000)
+    server.files['/a.bed'] = data
+    server.short.add(4000)
+    server.cut.add(8000)
+    path = fetch.fetch(server.url + '/a.bed', threads=3, chunk_bytes=2000)
+    assert read(path) == data
+    gets = server.requests('GET')
+    n_chunks = (len(data) + 1999) // 2000
+    # every chunk once, plus the two failed ones again
+    assert len(gets) == n_chunks + 2
+    assert all(r is not None for m, r in gets)
+    assert not os.path.exists(path + '.part')
+
+
+def test_reuse_within_run(server):
+    server.files['/a.bed'] = bed_text(100)
+    url = server.url + '/a.bed'
+    path = fetch.fetch(url)
+    n = len(server.log)
+    assert fetch.fetch(url) == path
+    assert fetch.cached(url) == path
+    assert len(server.log) == n
+
+
+def test_reuse_across_runs(server, tmp_path):
+    fetch.enable(str(tmp_path / 'downloads'))
+    server.files['/a.bed'] = bed_text(100)
+    url = server.url + '/a.bed'
+    path = fetch.fetch(url)
+    # a new run: nothing downloaded by this process yet
+    fetch._session['files'].clear()
+    server.log.clear()
+    assert fetch.fetch(url) == path
+    assert server.log == [('HEAD', None)]
+    # the file changed on the server: new ETag, new download
+    fetch._session['files'].clear()
+    server.files['/a.bed'] = bed_text(200)
+    path2 = fetch.fetch(url)
+    assert path2 != path
+    assert read(path2) == server.files['/a.bed']
+    assert len(server.requests('GET')) == 1
+
+
+_worker_script = """
+import sys, tempfile
+from concurrent.futures import ProcessPoolExecutor
+from cobindability import fetch, ovindex
+from cobindability.utils import pool_context
+urls = sys.argv[2:]
+ovindex.build_index(urls, sys.argv[1], threads=2)
+# remote files read by workers without a prefetch
+with ProcessPoolExecutor(max_workers=2, mp_context=pool_context()) as pool:
+    paths = list(pool.map(fetch.fetch, urls))
+print(len(paths))
+"""
+
+
+def test_worker_cleanup(server, tmp_path):
+    for i in range(3):
+        server.files['/p%d.bed' % i] = bed_text(100 + i)
+    urls = [server.url + '/p%d.bed' % i for i in range(3)]
+    tmp = tmp_path / 'tmp'
+    tmp.mkdir()
+    env = dict(os.environ, TMPDIR=str(tmp), PYTHONPATH=_lib)
+    for var in ('COBIND_DOWNLOAD_DIR', 'COBIND_CACHE', 'COBIND_CACHE_DIR'):
+        env.pop(var, None)
+    subprocess.run([sys.executable, '-c', _worker_script,
+                    str(tmp_path / 'index')] + urls,
+                   env=env, check=True, capture_output=True)
+    assert (tmp_path / 'index' / 'members.tsv').exists()
+    assert [f for f in os.listdir(tmp) if f.startswith('cobind_download_')] \
+        == []
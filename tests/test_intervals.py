@@ -0,0 +1,152 @@
+"""
+Check the sorted-array interval engine (cobindability.intervals) against
+brute force: every base of a small genome is represented by one element of
+a boolean mask, so merging, set operations and overlap sizes reduce to
+element-wise operations on the masks.
+"""
+
+import numpy as np
+import pytest
+from cobindability import intervals
+from cobindability import BED
+
+_size = 300
+_chroms = ['chr1', 'chr2', 'chr3']
+_seeds = range(40)
+
+
+def random_coords(rng, max_n=40):
+    """
+    Random (unsorted, overlapping, book-ended and empty) intervals.
+    """
+    coords = {}
+    for chrom in _chroms:
+        n = rng.integers(0, max_n)
+        if n == 0:
+            continue
+        starts = rng.integers(0, _size - 30, n)
+        ends = starts + rng.integers(0, 30, n)
+        coords[chrom] = (starts.astype(np.int64), ends.astype(np.int64))
+    return coords
+
+
+def to_masks(coords):
+    masks = {}
+    for chrom, (starts, ends) in coords.items():
+        mask = np.zeros(_size, dtype=bool)
+        for s, e in zip(starts, ends):
+            mask[s:e] = True
+        masks[chrom] = mask
+    return masks
+
+
+def from_masks(masks):
+    """
+    Runs of True of every mask, as a dict of merged intervals.
+    """
+    coords = {}
+    for chrom, mask in masks.items():
+        edge = np.diff(np.concatenate(([0], mask.astype(np.int8), [0])))
+        starts = np.flatnonzero(edge == 1)
+        if len(starts) > 0:
+            coords[chrom] = (starts, np.flatnonzero(edge == -1))
+    return coords
+
+
+def combine_masks(masks1, masks2, op):
+    empty = np.zeros(_size, dtype=bool)
+    chroms = set(masks1) | set(masks2)
+    return {c: op(masks1.get(c, empty), masks2.get(c, empty))
+            for c in chroms}
+
+
+def assert_same(coords, expected):
+    assert sorted(coords) == sorted(expected)
+    for chrom in expected:
+        np.testing.assert_array_equal(coords[chrom][0], expected[chrom][0])
+        np.testing.assert_array_equal(coords[chrom][1], expected[chrom][1])
+
+
+@pytest.mark.parametrize('seed', _seeds)
+def test_merge(seed):
+    coords = random_coords(np.random.default_rng(seed))
+    merged = intervals.merge_arrays(coords)
+    assert_same(merged, from_masks(to_masks(coords)))
+    assert intervals.genomic_size(merged) == \
+        sum(int(m.sum()) for m in to_masks(coords).values())
+
+
+@pytest.mark.parametrize('seed', _seeds)
+def test_set_operations(seed):
+    rng = np.random.default_rng(seed)
+    a = intervals.merge_arrays(random_coords(rng))
+    b = intervals.merge_arrays(random_coords(rng))
+    ma, mb = to_masks(a), to_masks(b)
+    assert_same(intervals.union_arrays(a, b),
+                from_masks(combine_masks(ma, mb, np.logical_or)))
+    assert_same(intervals.intersect_arrays(a, b),
+                from_masks(combine_masks(ma, mb, np.logical_and)))
+    assert_same(intervals.subtract_arrays(a, b),
+                from_masks(combine_masks(
+                    ma, mb, lambda x, y: x & ~y)))
+
+
+@pytest.mark.parametrize('seed', _seeds)
+def test_overlap_size(seed):
+    rng = np.random.default_rng(seed)
+    a = intervals.merge_arrays(random_coords(rng))
+    b = intervals.merge_arrays(random_coords(rng))
+    expected = sum(int(m.sum()) for m in combine_masks(
+        to_masks(a), to_masks(b), np.logical_and).values())
+    assert intervals.overlap_size(a, b) == expected
+    assert sum(intervals.overlap_sorted(*a[c], *b[c])
+               for c in a if c in b) == expected
+    flat_a, flat_b = intervals.linearize(a, b)
+    assert intervals.overlap_sorted(*flat_a, *flat_b) == expected
+
+
+@pytest.mark.parametrize('seed', _seeds)
+def test_covered_before(seed):
+    rng = np.random.default_rng(seed)
+    coords = intervals.merge_arrays(random_coords(rng))
+    points = np.arange(_size + 1)
+    for chrom, mask in to_masks(coords).items():
+        expected = np.concatenate(([0], np.cumsum(mask)))
+        np.testing.assert_array_equal(
+            intervals.covered_before(*coords[chrom], points), expected)
+
+
+@pytest.mark.parametrize('seed', range(10))
+def test_bed_functions(seed):
+    rng = np.random.default_rng(seed)
+    a = intervals.to_list(random_coords(rng))
+    b = intervals.to_list(random_coords(rng))
+    if not a or not b:
+        return
+    ma = to_masks(intervals.read_arrays(a))
+    mb = to_masks(intervals.read_arrays(b))
+    for func, op in ((BED.union_bed3, None),
+                     (BED.intersect_bed3, np.logical_and),
+                     (BED.subtract_bed3, lambda x, y: x & ~y)):
+        result = func(a) if op is None else func(a, b)
+        expected = from_masks(ma if op is None else
+                              combine_masks(ma, mb, op))
+        assert sorted(result) == sorted(intervals.to_list(expected))
+
+
+@pytest.mark.parametrize('seed', range(10))
+def test_from_bed(tmp_path, seed):
+    coords = random_coords(np.random.default_rng(seed))
+    bed = tmp_path / 'a.bed'
+    bed.write_text('track name=a\n' + ''.join(
+        '%s\t%d\t%d\n' % i for i in intervals.to_list(coords)))
+    bed_set = intervals.IntervalSet.from_bed(str(bed))
+    assert bed_set.count == intervals.interval_count(coords)
+    assert_same(bed_set.merged, from_masks(to_masks(coords)))
+
+
+def test_invalid_line(tmp_path):
+    bed = tmp_path / 'bad.bed'
+    bed.write_text('chr1\t10\t20\nchr1\t100\t50\n')
+    with pytest.raises(ValueError, match='chr1\t100\t50'):
+        intervals.read_arrays(str(bed))
@@ -0,0 +1,35 @@
+"""
+Tests of the batch cooccurrence analysis (cobindability.ovcooccur).
+"""
+
+import numpy as np
+from cobindability.ovcooccur import cooccur_batch, pair_matrices
+
+
+def write_bed(path, regions):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(''.join('chr1\t%d\t%d\n' % r for r in regions))
+    return str(path)
+
+
+def test_same_file_names(tmp_path):
+    background = write_bed(tmp_path / 'bg.bed',
+                           [(i * 100, i * 100 + 50) for i in range(40)])
+    bed_files = [
+        write_bed(tmp_path / 'dup' / 'x' / 'p.bed',
+                  [(i * 100, i * 100 + 10) for i in range(0, 20)]),
+        write_bed(tmp_path / 'dup' / 'y' / 'p.bed',
+                  [(i * 100, i * 100 + 10) for i in range(10, 30)]),
+        write_bed(tmp_path / 'dup' / 's1.bed',
+                  [(i * 100, i * 100 + 10) for i in range(25, 40)])]
+    results = cooccur_batch(bed_files, background)
+    assert list(results['A.name']) == ['x/p.bed', 'x/p.bed', 'y/p.bed']
+    assert list(results['B.name']) == ['y/p.bed', 's1.bed', 's1.bed']
+    names, counts, matrices = pair_matrices(results)
+    assert names == ['x/p.bed', 'y/p.bed', 's1.bed']
+    assert list(counts) == [20, 20, 15]
+    pvalues = matrices['pvalue']
+    assert np.isnan(np.diag(pvalues)).all()
+    np.testing.assert_array_equal(pvalues, pvalues.T)
+    for (i, j), p in zip(results.index, results['p-value']):
+        assert pvalues[i, j] == p